@@ -3,4 +3,11 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from .base import BaseWseEvaluator
-from .lp_solver import LpReticleLevelWseEvaluator, GnnReticleLevelWseEvaluator
\ No newline at end of file
+from .lp_solver import LpReticleLevelWseEvaluator, GnnReticleLevelWseEvaluator
+from .incremental import IncrementalLpReticleLevelWseEvaluator
+from .max_min_fair import MaxMinFairWseEvaluator
+from .flow_sim import FlowLevelWseSimulator
+from .streaming import StreamingLpReticleLevelWseEvaluator
+from .solver_backend import LinprogBackend
+from .utilization import UtilizationProfile
+from .result_cache import EvaluatorResultCache, get_result_cache, set_result_cache
@@ -0,0 +1,138 @@
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import Dict, List
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from dse4wse.pe_graph.hardware import ReticleTopology
+
+class ResourceLoad():
+    """ Data amount of each virtual reticle on one type of resource.
+    Raw entries (resource_id, var, amount) are accumulated during task annotation,
+    then coalesced into COO arrays grouped by resource id.
+    Inside a resource, vars keep the order they are first added.
+    """
+
+    def __init__(self, num_resources: int, num_vars: int) -> None:
+        self.num_resources = num_resources
+        self.num_vars = num_vars
+
+        self._raw_resource_ids = []
+        self._raw_vars = []
+        self._raw_amounts = []
+        self._raw_chunks = []  # (resource_ids, vars, amounts) arrays, in the order they are added
+
+        self.resource_ids = None
+        self.vars = None
+        self.amounts = None
+        self.indptr = None  # entries of resource i are in [indptr[i], indptr[i+1])
+        self.totals = None
+
+    def add(self, resource_id: int, var: int, amount: float):
+        self._raw_resource_ids.append(resource_id)
+        self._raw_vars.append(var)
+        self._raw_amounts.append(amount)
+
+    def add_array(self, resource_ids: np.ndarray, vars: np.ndarray, amounts: np.ndarray):
+        """ Add a batch of entries, e.g. all hops of many routed flows
+        """
+        self.__flush_raw_entries()
+        self._raw_chunks.append((
+            np.asarray(resource_ids, dtype=np.int64),
+            np.asarray(vars, dtype=np.int64),
+            np.asarray(amounts, dtype=np.float64),
+        ))
+
+    def __flush_raw_entries(self):
+        if self._raw_resource_ids:
+            self._raw_chunks.append((
+                np.array(self._raw_resource_ids, dtype=np.int64),
+                np.array(self._raw_vars, dtype=np.int64),
+                np.array(self._raw_amounts, dtype=np.float64),
+            ))
+        self._raw_resource_ids = []
+        self._raw_vars = []
+        self._raw_amounts = []
+
+    def finalize(self) -> None:
+        self.__flush_raw_entries()
+        raw_resource_ids = np.concatenate([np.zeros(0, dtype=np.int64)] + [chunk[0] for chunk in self._raw_chunks])
+        raw_vars = np.concatenate([np.zeros(0, dtype=np.int64)] + [chunk[1] for chunk in self._raw_chunks])
+        raw_amounts = np.concatenate([np.zeros(0, dtype=np.float64)] + [chunk[2] for chunk in self._raw_chunks])
+
+        stride = max(self.num_vars, 1)
+        keys = raw_resource_ids * stride + raw_vars
+        unique_keys, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        amounts = np.bincount(inverse.reshape(-1), weights=raw_amounts, minlength=len(unique_keys))
+        resource_ids = unique_keys // stride
+        order = np.lexsort((first_index, resource_ids))
+
+        self.resource_ids = resource_ids[order]
+        self.vars = (unique_keys % stride)[order]
+        self.amounts = amounts[order]
+        self.indptr = np.searchsorted(self.resource_ids, np.arange(self.num_resources + 1))
+        self.totals = np.bincount(self.resource_ids, weights=self.amounts, minlength=self.num_resources)
+
+        self._raw_chunks = []
+
+    @property
+    def busy(self) -> np.ndarray:
+        """ Whether each resource is used by any virtual reticle
+        """
+        return np.diff(self.indptr) > 0
+
+    def get_mark(self, resource_id: int) -> Dict[int, float]:
+        """ var -> data amount on this resource
+        """
+        start, end = self.indptr[resource_id], self.indptr[resource_id + 1]
+        return dict(zip(self.vars[start:end].tolist(), self.amounts[start:end].tolist()))
+
+    def to_csr(self, capacity: float) -> csr_matrix:
+        """ Busy resources x vars matrix of seconds per iteration
+        """
+        busy_rank = np.cumsum(self.busy) - 1
+        num_busy = busy_rank[-1] + 1 if self.num_resources else 0
+        return csr_matrix((self.amounts / capacity, (busy_rank[self.resource_ids], self.vars)), shape=(num_busy, self.num_vars))
+
+class AnnotatedLoad():
+    """ Load of reticle tasks on the reticle topology, indexed by integer node and link ids.
+    Node and link ids are those of the topology, whose arrays and coordinate views are shared, not copied.
+    """
+
+    def __init__(self, topology: ReticleTopology, num_vars: int) -> None:
+        self.topology = topology
+        self.nodes = topology.nodes
+        self.links = topology.links
+        self.node_2_id = topology.node_2_id
+        self.link_2_id = topology.link_2_id
+        self.link_src_ids = topology.link_srcs
+        self.link_dst_ids = topology.link_dsts
+        self.is_reticle = topology.is_reticle
+        self.is_dram_port = topology.is_dram_port
+        self.num_vars = num_vars
+
+        self.compute = ResourceLoad(topology.num_nodes, num_vars)
+        self.dram_access = ResourceLoad(topology.num_nodes, num_vars)
+        self.transmission = ResourceLoad(topology.num_links, num_vars)
+        self.intra_reticle: ResourceLoad = None  # hottest core mesh link of each reticle, only if requested by the evaluator
+
+    def get_node_ids(self, coordinates: np.ndarray) -> np.ndarray:
+        """ Vectorized version of node_2_id
+        """
+        return self.topology.get_node_ids(coordinates)
+
+    def get_link_ids(self, src_coordinates: np.ndarray, dst_coordinates: np.ndarray) -> np.ndarray:
+        """ Vectorized version of link_2_id
+        """
+        return self.topology.get_link_ids(self.get_node_ids(src_coordinates), self.get_node_ids(dst_coordinates))
+
+    def finalize(self) -> "AnnotatedLoad":
+        self.compute.finalize()
+        self.dram_access.finalize()
+        self.transmission.finalize()
+        if self.intra_reticle is not None:
+            self.intra_reticle.finalize()
+        return self
@@ -0,0 +1,346 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import Dict, List
+import heapq
+import numpy as np
+
+from dse4wse.pe_graph.hardware import WaferScaleEngine
+from dse4wse.pe_graph.task import BaseReticleTask, ListWaferTask, ComputeReticleTask, DramAccessReticleTask, PeerAccessReticleTask
+from dse4wse.pe_graph.mapper import WseMapper
+
+from .base import BaseWseEvaluator
+from .annotated_load import AnnotatedLoad
+
+class FlowLevelWseSimulator(BaseWseEvaluator):
+    """ Event-driven flow-level simulation of reticle tasks.
+
+    Every subtask iteration is an activity that needs its compute amount or data amount
+    served by a set of resources: the reticle for compute, the DRAM port and routed links for DRAM access,
+    and routed links for peer access. Activities sharing a resource get max-min fair rates.
+
+    Iteration k of a subtask is ready when its predecessors in the FusedReticleTask graph
+    have finished iteration k, and itself has finished iteration k-1.
+    Top-level reticle tasks are independent of each other, as in the LP evaluator.
+
+    The simulation jumps from event to event (activity start / finish). After each event, max-min fair rates
+    are recomputed for the running activities transitively sharing resources with the started or finished ones.
+    Max-min fairness can propagate a change through that whole component, so it is re-solved as a whole,
+    which on a loaded wafer is usually most running activities.
+
+    The result is cached. Assigning a new hardware, task or mapper invalidates it,
+    for in-place changes call invalidate_cache() manually.
+    """
+
+    def __init__(self,
+                 hardware: WaferScaleEngine,
+                 task: ListWaferTask,
+                 mapper: WseMapper,
+                 ) -> None:
+        super().__init__(hardware, task, mapper)
+
+    @property
+    def hardware(self) -> WaferScaleEngine:
+        return self._hardware
+
+    @hardware.setter
+    def hardware(self, hardware: WaferScaleEngine):
+        self._hardware = hardware
+        self.invalidate_cache()
+
+    @property
+    def task(self) -> ListWaferTask:
+        return self._task
+
+    @task.setter
+    def task(self, task: ListWaferTask):
+        self._task = task
+        self.invalidate_cache()
+
+    @property
+    def mapper(self) -> WseMapper:
+        return self._mapper
+
+    @mapper.setter
+    def mapper(self, mapper: WseMapper):
+        self._mapper = mapper
+        self.invalidate_cache()
+
+    def invalidate_cache(self):
+        self._result = None
+
+    def get_total_latency(self) -> float:
+        return self.simulate()['makespan']
+
+    def simulate(self) -> Dict:
+        """
+        Returns:
+            - makespan: time when the last activity finishes
+            - timelines: for every top-level reticle task, {subtask name: {'start': array, 'end': array}} per iteration.
+              Subtask names are the nodes of the fused task graph, or the task type for other tasks.
+        """
+        if self._result is None:
+            self._result = self.__simulate()
+        return self._result
+
+    def __build_activities(self):
+        """ Flatten reticle tasks into subtask nodes, each with its amount, resources and dependencies
+        """
+        load = AnnotatedLoad(self.hardware._topology, 0)  # only used for node and link ids
+        num_nodes = len(load.nodes)
+        capacities = np.concatenate([
+            np.full(num_nodes, self.hardware.reticle_compute_power, dtype=np.float64),
+            np.full(num_nodes, self.hardware.dram_bandwidth, dtype=np.float64),
+            self.hardware.get_link_bandwidths(),
+        ])
+
+        amounts = []
+        resources = []  # resource ids besides routed links
+        repeated_times = []
+        preds = []
+        names = []  # (task index, subtask name)
+        flow_owners = []
+        flow_srcs = []
+        flow_dsts = []
+
+        def add_subtask(task: BaseReticleTask):
+            owner = len(amounts)
+            if isinstance(task, ComputeReticleTask):
+                prid = self.mapper.find_physical_reticle_coordinate(task.virtual_reticle_id)
+                amounts.append(task.compute_amount)
+                resources.append([load.node_2_id[prid]])
+            elif isinstance(task, DramAccessReticleTask):
+                prid = self.mapper.find_physical_reticle_coordinate(task.virtual_reticle_id)
+                pdpid = self.mapper.find_physical_dram_port_coordinate(task.virtual_dram_port)
+                amounts.append(task.data_amount)
+                resources.append([num_nodes + load.node_2_id[pdpid]])
+                flow_owners.append(owner)
+                flow_srcs.append(pdpid if task.access_type == 'read' else prid)
+                flow_dsts.append(prid if task.access_type == 'read' else pdpid)
+            elif isinstance(task, PeerAccessReticleTask):
+                prid = self.mapper.find_physical_reticle_coordinate(task.virtual_reticle_id)
+                peer_prid = self.mapper.find_physical_reticle_coordinate(task.peer_virtual_reticle_id)
+                amounts.append(task.data_amount)
+                resources.append([])
+                flow_owners.append(owner)
+                flow_srcs.append(peer_prid if task.access_type == 'read' else prid)
+                flow_dsts.append(prid if task.access_type == 'read' else peer_prid)
+            else:
+                raise NotImplementedError(f"Unrecognized subtask type {task.task_type}")
+            return owner
+
+        for task_index, reticle_task in enumerate(self.task):
+            assert np.isfinite(reticle_task.repeated_times), "Simulation needs a finite number of repeated times"
+            if reticle_task.task_type == 'fused':
+                task_graph = reticle_task.task_graph
+                name_2_node = {}
+                for name, subtask in task_graph.nodes(data='task'):
+                    name_2_node[name] = add_subtask(subtask)
+                    names.append((task_index, name))
+                    repeated_times.append(reticle_task.repeated_times)
+                    preds.append([])
+                for name, node in name_2_node.items():
+                    preds[node] = [name_2_node[pred] for pred in task_graph.predecessors(name)]
+            else:
+                add_subtask(reticle_task)
+                names.append((task_index, reticle_task.task_type))
+                repeated_times.append(reticle_task.repeated_times)
+                preds.append([])
+
+        if flow_srcs:
+            flow_indices, link_srcs, link_dsts = self.mapper.find_batch_routing_links(np.array(flow_srcs), np.array(flow_dsts))
+            link_ids = 2 * num_nodes + load.get_link_ids(link_srcs, link_dsts)
+            owners = np.array(flow_owners, dtype=np.int64)[flow_indices]
+            for owner, link_id in zip(owners.tolist(), link_ids.tolist()):
+                resources[owner].append(link_id)
+
+        return {
+            'amounts': np.array(amounts, dtype=np.float64),
+            'resources': [np.array(r, dtype=np.int64) for r in resources],
+            'repeated_times': np.array(repeated_times, dtype=np.int64),
+            'preds': preds,
+            'names': names,
+            'capacities': capacities,
+        }
+
+    def __simulate(self) -> Dict:
+        activities = self.__build_activities()
+        amounts = activities['amounts']
+        resources = activities['resources']
+        repeated_times = activities['repeated_times']
+        preds = activities['preds']
+        capacities = activities['capacities']
+        num_activities = len(amounts)
+
+        succs = [[] for _ in range(num_activities)]
+        for node, node_preds in enumerate(preds):
+            for pred in node_preds:
+                succs[pred].append(node)
+
+        # a subtask without dependencies restarts on the same resources as soon as it finishes,
+        # so all its iterations are simulated as one activity, and split by its progress history afterwards
+        is_chained = (repeated_times > 1) & np.array([not p and not s for p, s in zip(preds, succs)], dtype=bool)
+        activity_amounts = amounts * np.where(is_chained, repeated_times, 1)
+        activity_repeated_times = np.where(is_chained, 1, repeated_times)
+        progress_history = {node: [] for node in np.flatnonzero(is_chained).tolist()}  # (time, progress)
+
+        # activity -> resources and resource -> activities incidence in CSR form
+        num_resources_per_activity = np.array([len(r) for r in resources], dtype=np.int64)
+        activity_indptr = np.concatenate([[0], np.cumsum(num_resources_per_activity)])
+        activity_resources = np.concatenate([np.zeros(0, dtype=np.int64)] + resources)
+        entry_activities = np.repeat(np.arange(num_activities), num_resources_per_activity)
+        resource_order = np.argsort(activity_resources, kind='stable')
+        resource_indptr = np.searchsorted(activity_resources[resource_order], np.arange(len(capacities) + 1))
+        resource_activities = entry_activities[resource_order]
+        is_served = (activity_amounts > 0) & (num_resources_per_activity > 0)
+
+        def gather(indptr: np.ndarray, indices: np.ndarray, ids: np.ndarray):
+            """ Concatenated rows ids of a CSR incidence, and the position in ids of every entry
+            """
+            starts = indptr[ids]
+            counts = indptr[ids + 1] - starts
+            owners = np.repeat(np.arange(len(ids)), counts)
+            offsets = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+            return indices[starts[owners] + offsets], owners
+
+        num_done = np.zeros(num_activities, dtype=np.int64)
+        running = np.zeros(num_activities, dtype=bool)
+        rates = np.zeros(num_activities)
+        remaining = np.zeros(num_activities)
+        last_update = np.zeros(num_activities)
+        versions = np.zeros(num_activities, dtype=np.int64)
+        start_times = [[] for _ in range(num_activities)]
+        end_times = [[] for _ in range(num_activities)]
+
+        events = []  # (finish time, version, activity)
+        now = 0.0
+
+        def is_ready(node: int) -> bool:
+            k = num_done[node]
+            return not running[node] and k < activity_repeated_times[node] and all([num_done[pred] > k for pred in preds[node]])
+
+        def start(node: int):
+            running[node] = True
+            remaining[node] = activity_amounts[node]
+            rates[node] = 0
+            last_update[node] = now
+            start_times[node].append(now)
+            if node in progress_history:
+                progress_history[node].append((now, 0))
+            if not is_served[node]:
+                # nothing to serve, finish at once
+                versions[node] += 1
+                heapq.heappush(events, (now, versions[node].item(), node))
+
+        def finish(node: int):
+            running[node] = False
+            num_done[node] += 1
+            end_times[node].append(now)
+            if node in progress_history:
+                progress_history[node].append((now, activity_amounts[node]))
+
+        def update_rates(changed_nodes: List[int]):
+            # running activities transitively sharing resources with the changed ones
+            in_component = np.zeros(num_activities, dtype=bool)
+            visited = np.zeros(len(capacities), dtype=bool)
+            frontier, _ = gather(activity_indptr, activity_resources, np.array(changed_nodes, dtype=np.int64))
+            frontier = np.unique(frontier)
+            while len(frontier):
+                visited[frontier] = True
+                nodes, _ = gather(resource_indptr, resource_activities, frontier)
+                nodes = np.unique(nodes[running[nodes] & ~in_component[nodes]])
+                in_component[nodes] = True
+                frontier, _ = gather(activity_indptr, activity_resources, nodes)
+                frontier = np.unique(frontier[~visited[frontier]])
+            component = np.flatnonzero(in_component & is_served)
+            if len(component) == 0:
+                return
+
+            # progressive filling: every unfrozen activity gets the same rate until some resource saturates.
+            # entries of frozen activities are dropped, so every round is cheaper than the last
+            entry_resources, entry_nodes = gather(activity_indptr, activity_resources, component)
+            local_resources, entry_local_resources = np.unique(entry_resources, return_inverse=True)
+            entry_local_resources = entry_local_resources.reshape(-1)
+            residual = capacities[local_resources].copy()
+            new_rates = np.full(len(component), np.inf)
+            while len(entry_nodes):
+                num_unfrozen = np.bincount(entry_local_resources, minlength=len(local_resources))
+                constrained = num_unfrozen > 0
+                levels = np.full(len(local_resources), np.inf)
+                levels[constrained] = residual[constrained] / num_unfrozen[constrained]
+                level = max(levels.min(), 0)
+                saturated = levels <= level * (1 + 1e-12)
+                newly_frozen = np.zeros(len(component), dtype=bool)
+                newly_frozen[entry_nodes[saturated[entry_local_resources]]] = True
+                new_rates[newly_frozen] = level
+                entry_frozen = newly_frozen[entry_nodes]
+                residual -= np.bincount(entry_local_resources[entry_frozen], minlength=len(local_resources)) * level
+                entry_nodes = entry_nodes[~entry_frozen]
+                entry_local_resources = entry_local_resources[~entry_frozen]
+
+            # settle progress with old rates, then schedule finish events with new rates
+            is_changed = new_rates != rates[component]
+            changed = component[is_changed]
+            changed_rates = new_rates[is_changed]
+            remaining[changed] = np.maximum(remaining[changed] - rates[changed] * (now - last_update[changed]), 0)
+            last_update[changed] = now
+            rates[changed] = changed_rates
+            versions[changed] += 1
+            for node in changed[is_chained[changed]].tolist():
+                progress_history[node].append((now, activity_amounts[node] - remaining[node]))
+            finish_times = now + remaining[changed] / changed_rates
+            for finish_time, version, node in zip(finish_times.tolist(), versions[changed].tolist(), changed.tolist()):
+                heapq.heappush(events, (finish_time, version, node))
+
+        started = []
+        for node in range(num_activities):
+            if is_ready(node):
+                start(node)
+                started.append(node)
+        update_rates(started)
+
+        while events:
+            finish_time, version, node = heapq.heappop(events)
+            if version != versions[node] or not running[node]:
+                continue
+            now = finish_time
+
+            # finish every activity ending at the same time together
+            finished = [node]
+            while events and events[0][0] <= now * (1 + 1e-12):
+                _, version, node = heapq.heappop(events)
+                if version == versions[node] and running[node]:
+                    finished.append(node)
+
+            changed_nodes = []
+            candidates = []
+            for node in finished:
+                finish(node)
+                changed_nodes.append(node)
+                candidates.append(node)
+                candidates.extend(succs[node])
+            for node in candidates:
+                if is_ready(node):
+                    start(node)
+                    changed_nodes.append(node)
+            update_rates(changed_nodes)
+
+        assert np.all(num_done == activity_repeated_times), "Deadlock in reticle task graph"
+
+        timelines = [{} for _ in self.task]
+        for node, (task_index, name) in enumerate(activities['names']):
+            if node in progress_history:
+                history_times, history_progress = zip(*progress_history[node])
+                boundaries = np.interp(np.arange(repeated_times[node] + 1) * amounts[node], history_progress, history_times)
+                node_start_times, node_end_times = boundaries[:-1], boundaries[1:]
+            else:
+                node_start_times, node_end_times = np.array(start_times[node]), np.array(end_times[node])
+            timelines[task_index][name] = {
+                'start': node_start_times,
+                'end': node_end_times,
+            }
+        return {
+            'makespan': now,
+            'timelines': timelines,
+        }
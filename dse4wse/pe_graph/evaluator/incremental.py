@@ -0,0 +1,260 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import Dict, List, Tuple, Iterable
+from collections import defaultdict, Counter
+import heapq
+import numpy as np
+
+from dse4wse.pe_graph.hardware import WaferScaleEngine
+from dse4wse.pe_graph.task import BaseReticleTask, ListWaferTask, ComputeReticleTask, DramAccessReticleTask, PeerAccessReticleTask
+from dse4wse.pe_graph.mapper import WseMapper
+from dse4wse.pe_graph.mapper.reticle_mapper import TableReticleMapper
+
+from .base import BaseWseEvaluator
+from .annotated_load import AnnotatedLoad
+
+Coordinate = Tuple[int, int]
+
+class IncrementalLpReticleLevelWseEvaluator(BaseWseEvaluator):
+    """ Analytical LP evaluator that keeps resource loads up to date under small changes,
+    so that mapping search and what-if analysis can try many moves cheaply.
+
+    Only the routed loads of tasks touching a changed virtual reticle are recomputed,
+    and the most loaded resource is tracked by a max-heap with lazy deletion.
+    Physical DRAM ports are resolved with the initial mapper and stay fixed when reticles move.
+    Hardware parameters are read once, build a new evaluator after changing them.
+    """
+
+    def __init__(self,
+                 hardware: WaferScaleEngine,
+                 task: ListWaferTask,
+                 mapper: WseMapper,
+                 ) -> None:
+        super().__init__(hardware, task, mapper)
+        self._load = AnnotatedLoad(hardware._topology, 0)  # only used for node and link ids
+        num_nodes = len(self._load.nodes)
+        num_links = len(self._load.links)
+
+        # compute, dram and inter_reticle resources share one array of seconds per iteration
+        self._resource_offsets = {'compute': 0, 'dram': num_nodes, 'inter_reticle': 2 * num_nodes}
+        self._resource_capacities = {
+            'compute': hardware.reticle_compute_power,
+            'dram': hardware.dram_bandwidth,
+            'inter_reticle': hardware.inter_reticle_bandwidth,
+        }
+        self._link_bandwidth_ratios = hardware.link_bandwidth_ratios
+        self._resource_times = np.zeros(2 * num_nodes + num_links)
+        self._heap = []  # (-seconds per iteration, resource id), stale entries are dropped on peek
+
+        self._task_list: List[BaseReticleTask] = list(task)
+        self._reticle_coordinates: Dict[int, Coordinate] = {}
+        self._dram_port_coordinates: Dict[int, Coordinate] = {}
+        self._vrid_2_task_indices = defaultdict(set)
+        self._task_contributions: List[Tuple[np.ndarray, np.ndarray]] = [None] * len(self._task_list)
+        self._repeated_times = Counter()
+
+        task_indices = list(range(len(self._task_list)))
+        for task_index in task_indices:
+            self.__index_task(task_index)
+        self.__add_tasks(task_indices)
+
+    def find_physical_reticle_coordinate(self, virtual_reticle_id: int) -> Coordinate:
+        if virtual_reticle_id not in self._reticle_coordinates:
+            self._reticle_coordinates[virtual_reticle_id] = self.mapper.find_physical_reticle_coordinate(virtual_reticle_id)
+        return self._reticle_coordinates[virtual_reticle_id]
+
+    def find_physical_dram_port_coordinate(self, virtual_dram_port_id: int) -> Coordinate:
+        if virtual_dram_port_id not in self._dram_port_coordinates:
+            self._dram_port_coordinates[virtual_dram_port_id] = self.mapper.find_physical_dram_port_coordinate(virtual_dram_port_id)
+        return self._dram_port_coordinates[virtual_dram_port_id]
+
+    def get_mapper(self) -> WseMapper:
+        """ A WseMapper that reproduces the current mapping, e.g. for LpReticleLevelWseEvaluator
+        """
+        for vrid in self._vrid_2_task_indices:
+            self.find_physical_reticle_coordinate(vrid)
+        return WseMapper(
+            reticle_mapper=TableReticleMapper(self._reticle_coordinates),
+            dram_port_mapper=self.mapper._dram_port_mapper,
+            reticle_router=self.mapper._reticle_router,
+        )
+
+    def move_virtual_reticle(self, virtual_reticle_id: int, new_coordinate: Coordinate):
+        """ Map a virtual reticle to another physical reticle.
+        The target may already host other virtual reticles, their compute loads simply add up.
+        """
+        node_id = self._load.get_node_ids(np.array(new_coordinate)).item()
+        assert self._load.is_reticle[node_id], f"{new_coordinate} is not a reticle"
+        task_indices = sorted(self._vrid_2_task_indices[virtual_reticle_id])
+        self.__remove_tasks(task_indices)
+        self._reticle_coordinates[virtual_reticle_id] = tuple(new_coordinate)
+        self.__add_tasks(task_indices)
+
+    def update_task(self, task_index: int, new_task: BaseReticleTask):
+        """ Replace the task at task_index of the original task list
+        """
+        assert isinstance(new_task, BaseReticleTask)
+        self.__remove_tasks([task_index])
+        self.__unindex_task(task_index)
+        self._task_list[task_index] = new_task
+        self.__index_task(task_index)
+        self.__add_tasks([task_index])
+
+    def get_bottleneck(self) -> Dict:
+        """ Same format as LpReticleLevelWseEvaluator.get_bottleneck
+        """
+        resource_id = self.__peek_bottleneck()
+        if resource_id is None:
+            return {'type': None, 'resource': None, 'frequency': np.inf}
+        resource_type = max([k for k, offset in self._resource_offsets.items() if offset <= resource_id], key=self._resource_offsets.get)
+        local_id = resource_id - self._resource_offsets[resource_type]
+        return {
+            'type': resource_type,
+            'resource': self._load.links[local_id] if resource_type == 'inter_reticle' else self._load.nodes[local_id],
+            'frequency': 1 / self._resource_times[resource_id].item(),
+        }
+
+    def get_total_latency(self) -> float:
+        resource_id = self.__peek_bottleneck()
+        max_load = self._resource_times[resource_id].item() if resource_id is not None else 0
+        repeated_times = max(self._repeated_times, default=0)  # an empty task list takes no time
+        return repeated_times * max_load
+
+    def __get_task_vrids(self, task: BaseReticleTask) -> List[int]:
+        subtasks = task.get_subtask_list() if task.task_type == 'fused' else [task]
+        vrids = []
+        for subtask in subtasks:
+            vrids.append(subtask.virtual_reticle_id)
+            if isinstance(subtask, PeerAccessReticleTask):
+                vrids.append(subtask.peer_virtual_reticle_id)
+        return vrids
+
+    def __index_task(self, task_index: int):
+        task = self._task_list[task_index]
+        for vrid in self.__get_task_vrids(task):
+            self._vrid_2_task_indices[vrid].add(task_index)
+        self._repeated_times[task.repeated_times] += 1
+
+    def __unindex_task(self, task_index: int):
+        task = self._task_list[task_index]
+        for vrid in self.__get_task_vrids(task):
+            self._vrid_2_task_indices[vrid].discard(task_index)
+            if not self._vrid_2_task_indices[vrid]:
+                del self._vrid_2_task_indices[vrid]
+        self._repeated_times[task.repeated_times] -= 1
+        if self._repeated_times[task.repeated_times] == 0:
+            del self._repeated_times[task.repeated_times]
+
+    def __get_task_contributions(self, task_indices: Iterable[int]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """ Resource ids and seconds per iteration that each task adds, all flows are routed in one batch
+        """
+        task_indices = list(task_indices)
+        owners = []  # position in task_indices of every entry
+        resource_ids = []
+        times = []
+
+        flow_owners = []
+        flow_srcs = []
+        flow_dsts = []
+        flow_times = []
+
+        compute_offset = self._resource_offsets['compute']
+        dram_offset = self._resource_offsets['dram']
+        compute_power = self._resource_capacities['compute']
+        dram_bandwidth = self._resource_capacities['dram']
+        inter_reticle_bandwidth = self._resource_capacities['inter_reticle']
+
+        def add_task(owner: int, task: BaseReticleTask):
+            if isinstance(task, ComputeReticleTask):
+                prid = self.find_physical_reticle_coordinate(task.virtual_reticle_id)
+                owners.append(owner)
+                resource_ids.append(compute_offset + self._load.node_2_id[prid])
+                times.append(task.compute_amount / compute_power)
+            elif isinstance(task, DramAccessReticleTask):
+                prid = self.find_physical_reticle_coordinate(task.virtual_reticle_id)
+                pdpid = self.find_physical_dram_port_coordinate(task.virtual_dram_port)
+                owners.append(owner)
+                resource_ids.append(dram_offset + self._load.node_2_id[pdpid])
+                times.append(task.data_amount / dram_bandwidth)
+                flow_owners.append(owner)
+                flow_srcs.append(pdpid if task.access_type == 'read' else prid)
+                flow_dsts.append(prid if task.access_type == 'read' else pdpid)
+                flow_times.append(task.data_amount / inter_reticle_bandwidth)
+            elif isinstance(task, PeerAccessReticleTask):
+                prid = self.find_physical_reticle_coordinate(task.virtual_reticle_id)
+                peer_prid = self.find_physical_reticle_coordinate(task.peer_virtual_reticle_id)
+                flow_owners.append(owner)
+                flow_srcs.append(peer_prid if task.access_type == 'read' else prid)
+                flow_dsts.append(prid if task.access_type == 'read' else peer_prid)
+                flow_times.append(task.data_amount / inter_reticle_bandwidth)
+            else:
+                raise NotImplementedError(f"Unrecognized subtask type {task.task_type}")
+
+        for owner, task_index in enumerate(task_indices):
+            task = self._task_list[task_index]
+            if task.task_type == 'fused':
+                for subtask in task.get_subtask_list():
+                    add_task(owner, subtask)
+            else:
+                add_task(owner, task)
+
+        owners = np.array(owners, dtype=np.int64)
+        resource_ids = np.array(resource_ids, dtype=np.int64)
+        times = np.array(times, dtype=np.float64)
+        if flow_srcs:
+            flow_indices, link_srcs, link_dsts = self.mapper.find_batch_routing_links(np.array(flow_srcs), np.array(flow_dsts))
+            link_ids = self._load.get_link_ids(link_srcs, link_dsts)
+            owners = np.concatenate([owners, np.array(flow_owners, dtype=np.int64)[flow_indices]])
+            resource_ids = np.concatenate([resource_ids, self._resource_offsets['inter_reticle'] + link_ids])
+            times = np.concatenate([times, np.array(flow_times, dtype=np.float64)[flow_indices] / self._link_bandwidth_ratios[link_ids]])
+
+        order = np.argsort(owners, kind='stable')
+        splits = np.searchsorted(owners[order], np.arange(1, len(task_indices)))
+        return list(zip(np.split(resource_ids[order], splits), np.split(times[order], splits)))
+
+    def __add_tasks(self, task_indices: List[int]):
+        contributions = self.__get_task_contributions(task_indices)
+        for task_index, contribution in zip(task_indices, contributions):
+            self._task_contributions[task_index] = contribution
+        self.__update_resources(contributions, sign=1)
+
+    def __remove_tasks(self, task_indices: List[int]):
+        contributions = [self._task_contributions[task_index] for task_index in task_indices]
+        for task_index in task_indices:
+            self._task_contributions[task_index] = None
+        self.__update_resources(contributions, sign=-1)
+
+    def __update_resources(self, contributions: List[Tuple[np.ndarray, np.ndarray]], sign: int):
+        if not contributions:
+            return
+        resource_ids = np.concatenate([resource_ids for resource_ids, _ in contributions])
+        times = np.concatenate([times for _, times in contributions])
+        np.add.at(self._resource_times, resource_ids, sign * times)
+
+        touched = np.unique(resource_ids)
+        if sign < 0:
+            # clean up rounding residue so that idle resources are exactly idle
+            residue = touched[np.abs(self._resource_times[touched]) < 1e-12 * max(np.max(np.abs(times), initial=0), 1e-300)]
+            self._resource_times[residue] = 0
+
+        # rebuilding is cheaper than carrying too many stale entries
+        if len(self._heap) + len(touched) > 2 * len(self._resource_times) + 1024:
+            busy = np.flatnonzero(self._resource_times > 0)
+            self._heap = list(zip((-self._resource_times[busy]).tolist(), busy.tolist()))
+            heapq.heapify(self._heap)
+        else:
+            for resource_id, resource_time in zip(touched.tolist(), self._resource_times[touched].tolist()):
+                if resource_time > 0:
+                    heapq.heappush(self._heap, (-resource_time, resource_id))
+
+    def __peek_bottleneck(self):
+        """ Resource id with the largest seconds per iteration, None if nothing is loaded
+        """
+        while self._heap:
+            neg_time, resource_id = self._heap[0]
+            if self._resource_times[resource_id] == -neg_time:
+                return resource_id
+            heapq.heappop(self._heap)
+        return None
@@ -0,0 +1,79 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from dse4wse.pe_graph.hardware import CoreMesh, ReticleTopology
+
+from .annotated_load import ResourceLoad
+
+def build_intra_reticle_load(topology: ReticleTopology,
+                             core_mesh: CoreMesh,
+                             num_vars: int,
+                             flow_indices: np.ndarray,
+                             link_ids: np.ndarray,
+                             flow_srcs: np.ndarray,
+                             flow_vars: np.ndarray,
+                             flow_amounts: np.ndarray,
+                             flow_is_exchange: np.ndarray,
+                             ) -> ResourceLoad:
+    """ Load of each reticle on the hottest link of its core mesh, as a ResourceLoad over node ids.
+
+    Every routed flow loads the core mesh of the reticles it touches with one CoreMesh pattern each:
+    egress at its source reticle through the side of its first hop, ingress at its destination reticle,
+    and transit between the sides of consecutive hops at every reticle in between.
+    Flows without any hop are all-to-all exchange inside a reticle if flow_is_exchange is set (e.g. peer access),
+    otherwise they are DRAM accesses stacked under every core, which don't use the core mesh.
+
+    Hops of each flow must be consecutive and in path order, as returned by find_batch_routing_links.
+    Link loads are linear in data amounts, so the hottest link of a reticle is picked from its totals,
+    and every virtual reticle contributes its own amount on that link. This keeps the row of each reticle exact
+    at the optimum f_i = f of the LP, where only the most loaded row is binding.
+    """
+    load = ResourceLoad(topology.num_nodes, num_vars)
+    num_flows = len(flow_srcs)
+    flow_indices = np.asarray(flow_indices, dtype=np.int64)
+    link_ids = np.asarray(link_ids, dtype=np.int64)
+    flow_srcs = np.asarray(flow_srcs, dtype=np.int64)
+    flow_vars = np.asarray(flow_vars, dtype=np.int64)
+    flow_amounts = np.asarray(flow_amounts, dtype=np.float64)
+    directions = topology.link_directions[link_ids]
+
+    is_first_hop = np.ones(len(flow_indices), dtype=bool)
+    is_first_hop[1:] = flow_indices[1:] != flow_indices[:-1]
+    is_last_hop = np.ones(len(flow_indices), dtype=bool)
+    is_last_hop[:-1] = flow_indices[1:] != flow_indices[:-1]
+    has_hops = np.bincount(flow_indices, minlength=num_flows) > 0
+
+    # (node id, flow, pattern) of every reticle crossed by a flow
+    first_hops = np.flatnonzero(is_first_hop)
+    last_hops = np.flatnonzero(is_last_hop)
+    transit_hops = np.flatnonzero(~is_last_hop)
+    exchange_flows = np.flatnonzero(~has_hops & np.asarray(flow_is_exchange, dtype=bool))
+    nodes = np.concatenate([
+        topology.link_srcs[link_ids[first_hops]],
+        topology.link_dsts[link_ids[last_hops]],
+        topology.link_dsts[link_ids[transit_hops]],
+        flow_srcs[exchange_flows],
+    ])
+    flows = np.concatenate([flow_indices[first_hops], flow_indices[last_hops], flow_indices[transit_hops], exchange_flows])
+    patterns = np.concatenate([
+        CoreMesh.get_egress_pattern(directions[first_hops]),
+        CoreMesh.get_ingress_pattern(CoreMesh.NUM_SIDES - 1 - directions[last_hops]),
+        CoreMesh.get_transit_pattern(CoreMesh.NUM_SIDES - 1 - directions[transit_hops], directions[transit_hops + 1]),
+        np.full(len(exchange_flows), CoreMesh.ALL_TO_ALL),
+    ])
+    on_reticle = topology.is_reticle[nodes]
+    nodes, flows, patterns = nodes[on_reticle], flows[on_reticle], patterns[on_reticle]
+    amounts = flow_amounts[flows]
+
+    if core_mesh.num_links > 0 and len(nodes) > 0:
+        busy_nodes, node_ranks = np.unique(nodes, return_inverse=True)
+        pattern_amounts = np.zeros((len(busy_nodes), CoreMesh.NUM_PATTERNS))
+        np.add.at(pattern_amounts, (node_ranks, patterns), amounts)
+        _, hot_links = core_mesh.get_max_link_loads(pattern_amounts)
+        hot_amounts = amounts * core_mesh.unit_loads[patterns, hot_links[node_ranks]]
+        used = hot_amounts > 0
+        load.add_array(nodes[used], flow_vars[flows[used]], hot_amounts[used])
+    return load
@@ -3,15 +3,12 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from typing import Dict
-from copy import deepcopy
-import networkx as nx
-from networkx import DiGraph
-from scipy.optimize import linprog
+from typing import Dict, List, Tuple, Union
+from scipy.sparse import csr_matrix, vstack, block_diag, bmat
+from scipy.sparse.csgraph import connected_components
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import torch as th
-from itertools import chain, product
-from functools import reduce
 import math
 import random
 import torch
@@ -24,6 +21,12 @@ from dse4wse.utils import logger
 from dse4wse.gnn.dataloader import process_noception_gnn_data
 
 from .base import BaseWseEvaluator
+from .annotated_load import AnnotatedLoad, ResourceLoad
+from .result_cache import get_result_cache, get_structure_digest
+from .solver_backend import LinprogBackend
+from .utilization import UtilizationProfile
+from .symmetry import get_translation_classes, reduce_resource_constraints
+from .intra_reticle import build_intra_reticle_load
 
 class LpReticleLevelWseEvaluator(BaseWseEvaluator):
     """ Use linear programming to estimate reticle-level performance.
@@ -33,68 +36,237 @@ class LpReticleLevelWseEvaluator(BaseWseEvaluator):
     def __init__(self, 
                  hardware: WaferScaleEngine, 
                  task: ListWaferTask, 
-                 mapper: WseMapper
+                 mapper: WseMapper,
+                 solver: str = 'analytical',
+                 decompose: bool = False,
+                 max_workers: int = None,
+                 use_result_cache: bool = True,
+                 linprog_backend: Union[str, LinprogBackend] = 'accurate',
+                 symmetry: bool = False,
+                 intra_reticle: bool = False,
                  ) -> None:
+        """
+        solver: 
+            - 'analytical': closed-form solution, the frequency is bounded by the most loaded resource
+            - 'linprog': solve the full LP with scipy, useful for cross-checking
+        decompose: split the LP into independent components that share no resource, and solve them one by one.
+            Each linprog call has a fixed overhead, so this pays off for a few large components, not for many small ones
+        max_workers: if set, solve components on a thread pool of this size
+        use_result_cache: look up annotated loads and solved frequencies in the process-wide EvaluatorResultCache,
+            so that evaluators of identical task lists and mappings share them
+        linprog_backend: a LinprogBackend, or the name of one of its presets ('accurate', 'screening'),
+            used by every linprog solve including sensitivity_report. Its solve_stats record timings and iteration counts of the latest solves
+        symmetry: before a linprog solve of the frequency, merge translation-equivalent virtual reticles (e.g. tensor parallel replicas)
+            into one variable and drop duplicate resource rows, see get_symmetry_report
+        intra_reticle: also bound the frequency by the hottest link of each reticle's core mesh ('intra_reticle' resources),
+            with XY-routed core link loads of the traffic entering, leaving, crossing or exchanged inside the reticle, see CoreMesh
+        """
         super().__init__(hardware, task, mapper)
+        assert solver in ['analytical', 'linprog']
+        self.solver = solver
+        self.decompose = decompose
+        self.max_workers = max_workers
+        self.use_result_cache = use_result_cache
+        self.linprog_backend = LinprogBackend.from_preset(linprog_backend) if isinstance(linprog_backend, str) else linprog_backend
+        self.symmetry = symmetry
+        self.intra_reticle = intra_reticle
+        self.cache_info = {
+            'annotated_load': {'hits': 0, 'misses': 0},
+            'min_freq': {'hits': 0, 'misses': 0},
+        }
+
+    # Annotated load and solved frequency are cached per evaluator.
+    # Assigning a new hardware, task or mapper invalidates the cache.
+    # For in-place changes other than appending tasks (amounts, peers, access types,
+    # or the mapping table of a shared mapper), call invalidate_cache() manually.
+    # Misses then fall back to the process-wide EvaluatorResultCache, keyed by content rather than by object.
+
+    @property
+    def hardware(self) -> WaferScaleEngine:
+        return self._hardware
+
+    @hardware.setter
+    def hardware(self, hardware: WaferScaleEngine):
+        self._hardware = hardware
+        self.invalidate_cache()
+
+    @property
+    def task(self) -> ListWaferTask:
+        return self._task
+
+    @task.setter
+    def task(self, task: ListWaferTask):
+        self._task = task
         self.vrid_2_var = {vrid: i for i, vrid in enumerate(task.get_all_virtual_reticle_ids())}
+        self.invalidate_cache()
+
+    @property
+    def mapper(self) -> WseMapper:
+        return self._mapper
+
+    @mapper.setter
+    def mapper(self, mapper: WseMapper):
+        self._mapper = mapper
+        self.invalidate_cache()
+
+    def invalidate_cache(self):
+        self._annotated_load = None
+        self._annotated_load_key = None
+        self._min_freq = None
+        self._min_freq_key = None
+        self._structure_digest = None
+        self._structure_digest_key = None
+
+    def get_structure_digest(self) -> str:
+        """ Content digest of the task, the resolved mapping, the router and the topology,
+        which keys the process-wide EvaluatorResultCache. It is only computed on a miss of the per-evaluator cache,
+        and kept until the cache is invalidated or tasks are appended.
+        """
+        cache_key = len(self.task)
+        if self._structure_digest is None or self._structure_digest_key != cache_key:
+            self._structure_digest = get_structure_digest(self.hardware, self.task, self.mapper)
+            self._structure_digest_key = cache_key
+        return self._structure_digest
+
+    def __get_intra_reticle_key(self) -> Tuple:
+        """ Hardware parameters that change the hottest core mesh link, empty if intra_reticle is disabled
+        """
+        if not self.intra_reticle:
+            return ()
+        return ('intra_reticle', self.hardware.reticle_config['core_array_height'], self.hardware.reticle_config['core_array_width'])
+
+    def __get_annotated_load(self) -> AnnotatedLoad:
+        cache_key = (len(self.task), *self.__get_intra_reticle_key())
+        if self._annotated_load is not None and self._annotated_load_key == cache_key:
+            self.cache_info['annotated_load']['hits'] += 1
+        else:
+            self.cache_info['annotated_load']['misses'] += 1
+            self.vrid_2_var = {vrid: i for i, vrid in enumerate(self.task.get_all_virtual_reticle_ids())}  # tasks may be appended
+            result_cache_key = (self.get_structure_digest(), *cache_key[1:]) if self.use_result_cache else None
+            load = get_result_cache().get('annotated_load', result_cache_key) if self.use_result_cache else None
+            if load is None:
+                load = self.__build_annotated_load()
+                if self.use_result_cache:
+                    get_result_cache().put('annotated_load', result_cache_key, load)
+            self._annotated_load = load
+            self._annotated_load_key = cache_key
+        return self._annotated_load
+
+    def get_annotated_load(self) -> AnnotatedLoad:
+        """ Routed data amount of every virtual reticle on every resource, shared by other evaluation engines
+        """
+        return self.__get_annotated_load()
+
+    def __get_min_freq(self) -> float:
+        # hardware parameters only scale constraints, so they don't invalidate the annotated load
+        cache_key = (len(self.task), self.solver, self.decompose, self.hardware.reticle_compute_power, self.hardware.dram_bandwidth, self.hardware.inter_reticle_bandwidth)
+        if self.solver == 'linprog':
+            cache_key += (self.symmetry, *self.linprog_backend.get_config_key())
+        if self.intra_reticle:
+            cache_key += (*self.__get_intra_reticle_key(), self.hardware.inter_core_bandwidth)
+        if self._min_freq is not None and self._min_freq_key == cache_key:
+            self.cache_info['min_freq']['hits'] += 1
+        else:
+            self.cache_info['min_freq']['misses'] += 1
+            # the process-wide cache is consulted before anything is built
+            result_cache_key = (self.get_structure_digest(), *cache_key[1:]) if self.use_result_cache else None
+            min_freq = get_result_cache().get('min_freq', result_cache_key) if self.use_result_cache else None
+            if min_freq is None:
+                min_freq = self.__lp_solver(self.__get_annotated_load())
+                if self.use_result_cache:
+                    get_result_cache().put('min_freq', result_cache_key, min_freq)
+            self._min_freq = min_freq
+            self._min_freq_key = cache_key
+        return self._min_freq
 
     def get_total_latency(self) -> float:
-        G = self.__build_annotated_graph()
-        min_freq = self.__lp_solver(G)  # times / second
+        min_freq = self.__get_min_freq()  # times / second
         repeated_times = max([reticle_task.repeated_times for reticle_task in self.task])  # times
         return repeated_times / min_freq
 
-    def __build_annotated_graph(self) -> DiGraph:
-        # get annotated graph (directly use a graph copy for agile impl)
-        G = deepcopy(self.hardware._reticle_graph)
-        for node, ndata in G.nodes(data=True):
-            ndata['compute_mark'] = {}
-            ndata['dram_access_mark'] = {}
-        for u, v, edata in G.edges(data=True):
-            edata['transmission_mark'] = {}
+    def sweep_hardware_parameters(self,
+                                  reticle_compute_power: np.ndarray,
+                                  inter_reticle_bandwidth: np.ndarray,
+                                  dram_bandwidth: np.ndarray,
+                                  ) -> np.ndarray:
+        """ Total latency for many hardware parameters on the same topology, task and mapping.
+        Routed loads don't depend on these parameters, so they are accumulated only once,
+        and the analytical optimum is evaluated by broadcasting the three arrays against each other.
+        """
+        load = self.__get_annotated_load()
+        repeated_times = max([reticle_task.repeated_times for reticle_task in self.task])
+        max_compute = load.compute.totals.max(initial=0)
+        max_transmission = load.transmission.totals.max(initial=0)
+        max_dram_access = load.dram_access.totals.max(initial=0)
+        # the core mesh is not swept, it only sets a floor
+        max_intra_reticle = load.intra_reticle.totals.max(initial=0) / self.hardware.inter_core_bandwidth if load.intra_reticle is not None else 0
+
+        max_load = np.maximum.reduce(np.broadcast_arrays(
+            max_compute / np.asarray(reticle_compute_power, dtype=np.float64),
+            max_transmission / np.asarray(inter_reticle_bandwidth, dtype=np.float64),
+            max_dram_access / np.asarray(dram_bandwidth, dtype=np.float64),
+            np.float64(max_intra_reticle),
+        ))
+        return repeated_times * max_load
+
+    def get_bottleneck(self) -> Dict:
+        """ Find the resource that limits the frequency of all reticle tasks.
+        Resource type follows the keys of profile_utilization's report.
+        """
+        load = self.__get_annotated_load()
+        resource_times = self.__get_resource_times(load)
+        resource_type = max(resource_times, key=lambda k: resource_times[k].max(initial=0))
+        resource_id = np.argmax(resource_times[resource_type]).item()
+        max_time = resource_times[resource_type][resource_id].item()
+        return {
+            'type': resource_type,
+            'resource': load.links[resource_id] if resource_type == 'inter_reticle' else load.nodes[resource_id],  # node coordinate, or link for inter_reticle
+            'frequency': 1 / max_time if max_time > 0 else np.inf,
+        }
+
+    def __build_annotated_load(self) -> AnnotatedLoad:
+        load = AnnotatedLoad(self.hardware._topology, len(self.vrid_2_var))
+
+        # transmissions are collected as flows and routed in a single batch
+        flow_srcs = []
+        flow_dsts = []
+        flow_vars = []
+        flow_amounts = []
+        flow_is_exchange = []  # peer accesses, which stay inside the reticle when both ends share it
+
+        def add_flow(src, dst, vrid, data_amount, is_exchange=False):
+            flow_srcs.append(src)
+            flow_dsts.append(dst)
+            flow_vars.append(self.vrid_2_var[vrid])
+            flow_amounts.append(data_amount)
+            flow_is_exchange.append(is_exchange)
 
         def add_compute_task(task: ComputeReticleTask):
             vrid = task.virtual_reticle_id
             prid = self.mapper.find_physical_reticle_coordinate(vrid)
-            ndata = G.nodes[prid]
-            if self.vrid_2_var[vrid] not in ndata['compute_mark']:
-                ndata['compute_mark'][self.vrid_2_var[vrid]] = task.compute_amount
-            else:
-                ndata['compute_mark'][self.vrid_2_var[vrid]] += task.compute_amount
+            load.compute.add(load.node_2_id[prid], self.vrid_2_var[vrid], task.compute_amount)
 
         def add_dram_access_task(task: DramAccessReticleTask):
             vrid = task.virtual_reticle_id
             prid = self.mapper.find_physical_reticle_coordinate(vrid)
             pdpid = self.mapper.find_physical_dram_port_coordinate(task.virtual_dram_port)
-            ndata = G.nodes[pdpid]
-            if self.vrid_2_var[vrid] not in ndata['dram_access_mark']:
-                ndata['dram_access_mark'][self.vrid_2_var[vrid]] = task.data_amount
+            load.dram_access.add(load.node_2_id[pdpid], self.vrid_2_var[vrid], task.data_amount)
+
+            # same direction as find_read_dram_routing_path / find_write_dram_routing_path
+            if task.access_type == 'read':
+                add_flow(pdpid, prid, vrid, task.data_amount)
             else:
-                ndata['dram_access_mark'][self.vrid_2_var[vrid]] += task.data_amount
-
-            routing_func = self.mapper.find_read_dram_routing_path \
-                           if task.access_type == 'read' else self.mapper.find_write_dram_routing_path
-            link_list = routing_func(prid, pdpid)
-            for link in link_list:
-                edata = G.edges[link]
-                if self.vrid_2_var[vrid] not in edata['transmission_mark']:
-                    edata['transmission_mark'][self.vrid_2_var[vrid]] = task.data_amount
-                else:
-                    edata['transmission_mark'][self.vrid_2_var[vrid]] += task.data_amount
+                add_flow(prid, pdpid, vrid, task.data_amount)
 
         def add_peer_access_task(task: PeerAccessReticleTask):
             vrid = task.virtual_reticle_id
             prid = self.mapper.find_physical_reticle_coordinate(vrid)
             peer_prid = self.mapper.find_physical_reticle_coordinate(task.peer_virtual_reticle_id)
-            routing_func = self.mapper.find_read_peer_routing_path \
-                           if task.access_type == 'read' else self.mapper.find_write_peer_routing_path
-            link_list = routing_func(prid, peer_prid)
-            for link in link_list:
-                edata = G.edges[link]
-                if self.vrid_2_var[vrid] not in edata['transmission_mark']:
-                    edata['transmission_mark'][self.vrid_2_var[vrid]] = task.data_amount
-                else:
-                    edata['transmission_mark'][self.vrid_2_var[vrid]] += task.data_amount
+            # same direction as find_read_peer_routing_path / find_write_peer_routing_path
+            if task.access_type == 'read':
+                add_flow(peer_prid, prid, vrid, task.data_amount, is_exchange=True)
+            else:
+                add_flow(prid, peer_prid, vrid, task.data_amount, is_exchange=True)
 
         def add_task(task: BaseReticleTask):
             if isinstance(task, ComputeReticleTask):
@@ -114,131 +286,347 @@ class LpReticleLevelWseEvaluator(BaseWseEvaluator):
             else:
                 add_task(reticle_task)
 
-        return G
-        
-    def __lp_solver(self, G: DiGraph) -> float:
+        flow_indices = link_ids = np.zeros(0, dtype=np.int64)
+        if flow_srcs:
+            flow_indices, link_srcs, link_dsts = self.mapper.find_batch_routing_links(np.array(flow_srcs), np.array(flow_dsts))
+            link_ids = load.get_link_ids(link_srcs, link_dsts)
+            hop_amounts = np.array(flow_amounts, dtype=np.float64)[flow_indices] / self.hardware.link_bandwidth_ratios[link_ids]
+            load.transmission.add_array(link_ids, np.array(flow_vars)[flow_indices], hop_amounts)
+
+        if self.intra_reticle:
+            load.intra_reticle = build_intra_reticle_load(
+                topology=self.hardware._topology,
+                core_mesh=self.hardware.core_mesh,
+                num_vars=len(self.vrid_2_var),
+                flow_indices=flow_indices,
+                link_ids=link_ids,
+                flow_srcs=load.get_node_ids(np.array(flow_srcs)) if flow_srcs else np.zeros(0, dtype=np.int64),
+                flow_vars=np.array(flow_vars, dtype=np.int64),
+                flow_amounts=np.array(flow_amounts, dtype=np.float64),
+                flow_is_exchange=np.array(flow_is_exchange, dtype=bool),
+            )
+
+        return load.finalize()
+
+    def __get_resource_times(self, load: AnnotatedLoad) -> Dict[str, np.ndarray]:
+        """ Seconds per iteration of each resource, keyed by resource type
+        """
+        resource_times = {
+            'compute': load.compute.totals / self.hardware.reticle_compute_power,
+            'dram': load.dram_access.totals / self.hardware.dram_bandwidth,
+            'inter_reticle': load.transmission.totals / self.hardware.inter_reticle_bandwidth,
+        }
+        if load.intra_reticle is not None:
+            resource_times['intra_reticle'] = load.intra_reticle.totals / self.hardware.inter_core_bandwidth
+        return resource_times
+
+    def __lp_solver(self, load: AnnotatedLoad) -> float:
         """
         Calculate the slowest frequency of all reticle tasks            
         """
-        global_freq_index = len(self.vrid_2_var)
-        num_variables = len(self.vrid_2_var) + 1
+        if self.decompose:
+            return min([component['frequency'] for component in self.__solve_components(load)], default=np.inf)
+        elif self.solver == 'analytical':
+            return self.__analytical_solver(load)
+        elif self.solver == 'linprog':
+            return self.__linprog_solver(load)
+        else:
+            raise NotImplementedError(f"Unrecognized solver {self.solver}")
+
+    def __analytical_solver(self, load: AnnotatedLoad) -> float:
+        """
+        Every constraint of the LP is sum_i a_ij * f_i <= 1, and we maximize f <= f_i,
+        so the optimum sets all f_i = f and f = 1 / max_j(sum_i a_ij)
+        """
+        max_load = max([t.max(initial=0) for t in self.__get_resource_times(load).values()])
+        return 1 / max_load if max_load > 0 else np.inf
 
-        c = np.zeros(num_variables)  # f_0, f_1, ..., f_{n-1}, f
-        c[global_freq_index] = -1  # maximize f
-        A_ub = []
-        b_ub = []
-        A_eq = []
-        b_eq = []
-        bounds = [(0, None) for _ in range(num_variables)]
-
-        def add_compute_constraint(ndata):
-            reticle_compute_power = self.hardware.reticle_compute_power
-            A_ub_ = np.zeros(num_variables)
-            b_ub_ = np.ones(1)
-            for var, data_amount in ndata['compute_mark'].items():
-                A_ub_[var] = data_amount / reticle_compute_power
-            A_ub.append(A_ub_)
-            b_ub.append(b_ub_)
-
-        def add_transmission_constraint(edata):
-            inter_reticle_bandwidth = self.hardware.inter_reticle_bandwidth
-            A_ub_ = np.zeros(num_variables)
-            b_ub_ = np.ones(1)
-            for var, data_amount in edata['transmission_mark'].items():
-                A_ub_[var] = data_amount / inter_reticle_bandwidth
-            A_ub.append(A_ub_)
-            b_ub.append(b_ub_)
-
-        def add_dram_access_constraint(ndata):
-            dram_bandwidth = self.hardware.dram_bandwidth
-            A_ub_ = np.zeros(num_variables)
-            b_ub_ = np.ones(1)
-            for var, data_amount in ndata['dram_access_mark'].items():
-                A_ub_[var] = data_amount / dram_bandwidth
-            A_ub.append(A_ub_)
-            b_ub.append(b_ub_)
-
-        # add optimization constraint: f <= f_i
-        for var in range(num_variables - 1):
-            A_ub_ = np.zeros(num_variables)
-            A_ub_[global_freq_index] = 1
-            A_ub_[var] = -1
-            b_ub_ = np.zeros(1)
-            A_ub.append(A_ub_)
-            b_ub.append(b_ub_)
-
-        for node, ndata in G.nodes(data=True):
-            add_compute_constraint(ndata)
-            add_dram_access_constraint(ndata)
-
-        for unode, vnode, edata in G.edges(data=True):
-            add_transmission_constraint(edata)
-
-        stack_func = lambda x: np.stack(x) if x else None
-
-        linprog_kwargs = {
-            'c': c,
-            'A_ub': stack_func(A_ub),
-            'b_ub': stack_func(b_ub),
-            'A_eq': stack_func(A_eq),
-            'b_eq': stack_func(b_eq),
-            'bounds': bounds,
+    def __get_resource_constraints(self, load: AnnotatedLoad) -> csr_matrix:
+        """
+        Busy resources x vars matrix of seconds per iteration, rows are compute, dram, link and core mesh resources in order
+        """
+        # one row per busy resource, idle resources only produce all-zero rows
+        resource_constraints = [
+            load.compute.to_csr(self.hardware.reticle_compute_power),
+            load.dram_access.to_csr(self.hardware.dram_bandwidth),
+            load.transmission.to_csr(self.hardware.inter_reticle_bandwidth),
+        ]
+        if load.intra_reticle is not None:
+            resource_constraints.append(load.intra_reticle.to_csr(self.hardware.inter_core_bandwidth))
+        return vstack(resource_constraints, format='csr')
+
+    def __get_linprog_constraints(self, load: AnnotatedLoad):
+        """
+        A_ub and b_ub of the LP, variables are f_0, f_1, ..., f_{n-1}, f
+        """
+        return self.__build_linprog_constraints(self.__get_resource_constraints(load))
+
+    @staticmethod
+    def __build_linprog_constraints(resource_constraints: csr_matrix):
+        # add optimization constraint: f <= f_i, i.e. -f_i + f <= 0
+        num_resource_rows, num_freq_rows = resource_constraints.shape
+        freq_rows = np.arange(num_freq_rows)
+        resource_constraints = resource_constraints.tocoo()
+
+        rows = np.concatenate([freq_rows, freq_rows, num_freq_rows + resource_constraints.row])
+        cols = np.concatenate([freq_rows, np.full(num_freq_rows, num_freq_rows), resource_constraints.col])
+        data = np.concatenate([-np.ones(num_freq_rows), np.ones(num_freq_rows), resource_constraints.data])
+        A_ub = csr_matrix((data, (rows, cols)), shape=(num_freq_rows + num_resource_rows, num_freq_rows + 1))
+        b_ub = np.concatenate([np.zeros(num_freq_rows), np.ones(num_resource_rows)])
+        return A_ub, b_ub
+
+    def __linprog_solver(self, load: AnnotatedLoad) -> float:
+        """
+        Calculate the slowest frequency of all reticle tasks with scipy linprog
+        """
+        if self.__analytical_solver(load) == np.inf:
+            return np.inf  # nothing bounds the frequency, and the LP would be unbounded
+        if self.symmetry:
+            resource_constraints, _ = self.__get_reduced_resource_constraints(load)
+            linprog_result = self.__solve_resource_linprog(resource_constraints)
+        else:
+            linprog_result = self.__solve_linprog(load)
+        min_freq = linprog_result.x[-1]
+        return min_freq
+
+    def __get_reduced_resource_constraints(self, load: AnnotatedLoad) -> Tuple[csr_matrix, np.ndarray]:
+        """
+        Since the optimum sets every f_i = f, merging the columns of any group of variables keeps the optimum,
+        and identical rows are redundant. So the reduction is exact whatever the classes are,
+        and reticles that break the symmetry simply stay in classes of their own.
+        """
+        var_coordinates = np.zeros((len(self.vrid_2_var), 2), dtype=np.int64)
+        for vrid, var in self.vrid_2_var.items():
+            var_coordinates[var] = self.mapper.find_physical_reticle_coordinate(vrid)
+        var_classes = get_translation_classes(load, var_coordinates)
+        resource_constraints, _ = reduce_resource_constraints(self.__get_resource_constraints(load), var_classes)
+        return resource_constraints, var_classes
+
+    def get_symmetry_report(self) -> Dict:
+        """ Translation classes of virtual reticles and the LP size with and without the symmetry reduction
+        """
+        load = self.__get_annotated_load()
+        full_constraints = self.__get_resource_constraints(load)
+        reduced_constraints, var_classes = self.__get_reduced_resource_constraints(load)
+        var_2_vrid = {var: vrid for vrid, var in self.vrid_2_var.items()}
+        classes = [[] for _ in range(var_classes.max(initial=-1) + 1)]
+        for var, class_index in enumerate(var_classes.tolist()):
+            classes[class_index].append(var_2_vrid[var])
+        return {
+            'classes': classes,
+            'num_vars': full_constraints.shape[1],
+            'num_reduced_vars': reduced_constraints.shape[1],
+            'num_resource_rows': full_constraints.shape[0],
+            'num_reduced_resource_rows': reduced_constraints.shape[0],
         }
 
-        linprog_result = linprog(**linprog_kwargs)
-        min_freq = linprog_result.x[global_freq_index]
+    def __solve_linprog(self, load: AnnotatedLoad):
+        return self.__solve_resource_linprog(self.__get_resource_constraints(load))
 
-        return min_freq
+    def __solve_resource_linprog(self, resource_constraints: csr_matrix):
+        A_ub, b_ub = self.__build_linprog_constraints(resource_constraints)
+        num_variables = A_ub.shape[1]
+        global_freq_index = num_variables - 1
+
+        c = np.zeros(num_variables)  # f_0, f_1, ..., f_{n-1}, f
+        c[global_freq_index] = -1  # maximize f
+        return self.linprog_backend.solve(c, A_ub, b_ub, bounds=(0, None))
+
+    def __solve_components(self, load: AnnotatedLoad) -> List[Dict]:
+        """
+        Virtual reticles and resources form a bipartite graph, and each connected component
+        is an independent LP whose optimum doesn't depend on the others.
+        Virtual reticles without any load are left out, since they never bound the frequency.
+        """
+        resource_constraints = self.__get_resource_constraints(load)
+        num_rows, num_vars = resource_constraints.shape
+        incidence = bmat([[None, resource_constraints.T], [resource_constraints, None]], format='csr')
+        _, labels = connected_components(incidence, directed=False)
+        var_labels = labels[:num_vars]
+        row_labels = labels[num_vars:]
+
+        # busy row -> (resource type, resource)
+        row_resources = [('compute', load.nodes[i]) for i in np.flatnonzero(load.compute.busy)] \
+                      + [('dram', load.nodes[i]) for i in np.flatnonzero(load.dram_access.busy)] \
+                      + [('inter_reticle', load.links[i]) for i in np.flatnonzero(load.transmission.busy)]
+        if load.intra_reticle is not None:
+            row_resources += [('intra_reticle', load.nodes[i]) for i in np.flatnonzero(load.intra_reticle.busy)]
+        var_2_vrid = {var: vrid for vrid, var in self.vrid_2_var.items()}
+
+        # group vars and rows by component once, instead of masking per component
+        var_order = np.argsort(var_labels, kind='stable')
+        row_order = np.argsort(row_labels, kind='stable')
+        component_labels = np.unique(row_labels)
+        var_bounds = np.searchsorted(var_labels[var_order], np.stack([component_labels, component_labels + 1]))
+        row_bounds = np.searchsorted(row_labels[row_order], np.stack([component_labels, component_labels + 1]))
+
+        def solve_component(index: int) -> Dict:
+            component_vars = var_order[var_bounds[0, index]: var_bounds[1, index]]
+            component_rows = row_order[row_bounds[0, index]: row_bounds[1, index]]
+            component_constraints = resource_constraints[component_rows][:, component_vars]
+            row_times = np.asarray(component_constraints.sum(axis=1)).reshape(-1)
+            bottleneck_row = np.argmax(row_times)
+            # resources with only zero amounts are busy too, but never bound the frequency
+            bottleneck_frequency = 1 / row_times[bottleneck_row].item() if row_times[bottleneck_row] > 0 else np.inf
+            if self.solver == 'analytical' or not np.isfinite(bottleneck_frequency):
+                frequency = bottleneck_frequency
+            else:
+                frequency = self.__solve_resource_linprog(component_constraints).x[-1]
+            resource_type, resource = row_resources[component_rows[bottleneck_row]]
+            return {
+                'vrids': [var_2_vrid[var] for var in component_vars.tolist()],
+                'num_resources': len(component_rows),
+                'frequency': frequency,
+                'bottleneck': {
+                    'type': resource_type,
+                    'resource': resource,
+                    'frequency': bottleneck_frequency,
+                },
+            }
+
+        component_indices = range(len(component_labels))
+        if self.max_workers:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                return list(executor.map(solve_component, component_indices))
+        else:
+            return [solve_component(index) for index in component_indices]
+
+    def get_component_report(self) -> List[Dict]:
+        """ Frequency and bottleneck of every independent component of the LP,
+        the total latency is bounded by the slowest component
+        """
+        load = self.__get_annotated_load()
+        return self.__solve_components(load)
+
+    def sensitivity_report(self) -> Dict:
+        """ Shadow prices of resource constraints and latency gradients w.r.t. hardware parameters,
+        read from the duals of a single linprog solve (whatever the configured solver is).
+
+        Each busy resource j contributes a row sum_i (a_ij / C) f_i <= 1, with C the capacity of its type.
+        Its shadow price p_j = df / d(rhs_j) >= 0, so scaling the capacity of a whole type gives
+        df / dC = sum_j p_j / C, and dT / dC = -T / f * df / dC for T = repeated_times / f.
+        When several resource types are tied bottlenecks, the duals are not unique
+        and the gradients are one valid choice among them.
+        Unloaded problems get an infinite frequency, zero latency and zero gradients without a solve.
+        """
+        load = self.__get_annotated_load()
+        resources = [
+            ('compute', 'reticle_compute_power', load.compute, load.nodes),
+            ('dram', 'dram_bandwidth', load.dram_access, load.nodes),
+            ('inter_reticle', 'inter_reticle_bandwidth', load.transmission, load.links),
+        ]
+        if load.intra_reticle is not None:
+            resources.append(('intra_reticle', 'inter_core_bandwidth', load.intra_reticle, load.nodes))
+
+        if self.__analytical_solver(load) == np.inf:
+            # nothing is loaded, the LP would be unbounded and no hardware parameter matters
+            return {
+                'frequency': np.inf,
+                'total_latency': 0.,
+                'shadow_prices': {resource_type: {} for resource_type, _, _, _ in resources},
+                'frequency_gradient': {parameter: 0. for _, parameter, _, _ in resources},
+                'latency_gradient': {parameter: 0. for _, parameter, _, _ in resources},
+            }
+
+        linprog_result = self.__solve_linprog(load)
+        min_freq = linprog_result.x[-1]
+        repeated_times = max([reticle_task.repeated_times for reticle_task in self.task])
+        total_latency = repeated_times / min_freq
+
+        num_freq_rows = len(self.vrid_2_var)
+        shadow_prices = -linprog_result.ineqlin.marginals[num_freq_rows:]  # scipy reports d(-f) / d(b_ub)
+
+        report = {
+            'frequency': min_freq,
+            'total_latency': total_latency,
+            'shadow_prices': {},
+            'frequency_gradient': {},
+            'latency_gradient': {},
+        }
+        row = 0
+        for resource_type, parameter, resource_load, resource_keys in resources:
+            busy_ids = np.flatnonzero(resource_load.busy)
+            type_shadow_prices = shadow_prices[row: row + len(busy_ids)]
+            row += len(busy_ids)
+
+            capacity = getattr(self.hardware, parameter)
+            freq_gradient = type_shadow_prices.sum().item() / capacity
+            # non-binding constraints have zero shadow price and are omitted
+            report['shadow_prices'][resource_type] = {resource_keys[i]: p for i, p in zip(busy_ids.tolist(), type_shadow_prices.tolist()) if p > 0}
+            report['frequency_gradient'][parameter] = freq_gradient
+            report['latency_gradient'][parameter] = -total_latency / min_freq * freq_gradient
+
+        return report
+
+    @classmethod
+    def get_batch_total_latency(cls, 
+                                problems: List[Tuple[WaferScaleEngine, ListWaferTask, WseMapper]],
+                                solver: str = 'analytical',
+                                linprog_backend: Union[str, LinprogBackend] = 'accurate',
+                                ) -> List[float]:
+        """ Evaluate the total latency of many (hardware, task, mapper) triples at once,
+        so that a sweep pays the Python and scipy setup cost only once.
+        solver:
+            - 'analytical': resource times of all problems are reduced in one vectorized pass
+            - 'linprog': constraints of all problems are stacked into one block-diagonal LP
+        """
+        assert solver in ['analytical', 'linprog']
+        linprog_backend = LinprogBackend.from_preset(linprog_backend) if isinstance(linprog_backend, str) else linprog_backend
+        evaluators = [cls(hardware, task, mapper, solver=solver, linprog_backend=linprog_backend) for hardware, task, mapper in problems]
+        if not evaluators:
+            return []
+
+        loads = [evaluator.__get_annotated_load() for evaluator in evaluators]
+        resource_times = [np.concatenate(list(evaluator.__get_resource_times(load).values())) for evaluator, load in zip(evaluators, loads)]
+        problem_ids = np.repeat(np.arange(len(evaluators)), [len(t) for t in resource_times])
+        max_loads = np.zeros(len(evaluators))
+        np.maximum.at(max_loads, problem_ids, np.concatenate(resource_times))
+
+        # problems without any load are never bounded
+        busy = max_loads > 0
+        min_freqs = np.full(len(evaluators), np.inf)
+        if solver == 'analytical':
+            min_freqs[busy] = 1 / max_loads[busy]
+        elif np.any(busy):
+            busy_problems = np.flatnonzero(busy)
+            constraints = [evaluators[i].__get_linprog_constraints(loads[i]) for i in busy_problems]
+            A_ub = block_diag([A for A, _ in constraints], format='csr')
+            b_ub = np.concatenate([b for _, b in constraints])
+
+            # blocks are independent, so maximizing a positively weighted sum of all f maximizes each f.
+            # weighting by max load keeps the objective of every block around 1
+            num_variables = np.array([A.shape[1] for A, _ in constraints])
+            global_freq_indices = np.cumsum(num_variables) - 1
+            c = np.zeros(A_ub.shape[1])
+            c[global_freq_indices] = -max_loads[busy_problems]
+
+            linprog_result = linprog_backend.solve(c, A_ub, b_ub, bounds=(0, None))
+            min_freqs[busy_problems] = linprog_result.x[global_freq_indices]
+        
+        repeated_times = np.array([max([reticle_task.repeated_times for reticle_task in evaluator.task]) for evaluator in evaluators])
+        return (repeated_times / min_freqs).tolist()
     
     def profile_utilization(self, group=True, per_module=False, per_task=False):
         logger.debug("Profiling resource utilization for lp solver")
         
-        G = self.__build_annotated_graph()
-        min_freq = self.__lp_solver(G)  # times / second
-
-        group_compute_utils = []
-        group_dram_bandwidth_utils = []
-        group_inter_reticle_bandwidth_utils = []
-
-        for node, ndata in G.nodes(data=True):
-            if ndata['compute_mark']:
-                reticle_compute_power = self.hardware.reticle_compute_power
-                total_data_amount = sum(ndata['compute_mark'].values())
-                total_util = total_data_amount*min_freq/reticle_compute_power
-                group_compute_utils.append(total_util)
-                if per_module:
-                    logger.debug(f"Reticle coordinate {node}: compute_util={total_util:.2%}")
-                if per_task:
-                    for vrid, data_amount in ndata['compute_mark'].items():
-                        logger.debug(f"- Reticle coordinate {node}: vrid={vrid}, compute_util={data_amount*min_freq/reticle_compute_power:.2%}")
-            else:
-                if ndata['reticle']: group_compute_utils.append(0)
-            if ndata['dram_access_mark']:
-                dram_bandwidth = self.hardware.dram_bandwidth
-                total_data_amount = sum(ndata['dram_access_mark'].values())
-                total_util = total_data_amount*min_freq/dram_bandwidth
-                group_dram_bandwidth_utils.append(total_util)
-                if per_module:
-                    logger.debug(f"Reticle coordinate {node}: dram_bandwidth_util={total_util:.2%}")
-                if per_task:
-                    for vrid, data_amount in ndata['dram_access_mark'].items():
-                        logger.debug(f"- Reticle coordinate {node}: vrid={vrid}, dram_bandwidth_util={data_amount*min_freq/dram_bandwidth:.2%}")
-            else:
-                if ndata['dram_port']: group_dram_bandwidth_utils.append(0)
-
-        for u, v, edata in G.edges(data=True):
-            if edata['transmission_mark']:
-                inter_reticle_bandwidth = self.hardware.inter_reticle_bandwidth
-                total_data_amount = sum(edata['transmission_mark'].values())
-                total_util = total_data_amount*min_freq/inter_reticle_bandwidth
-                group_inter_reticle_bandwidth_utils.append(total_util)
-                if per_module:
-                    logger.debug(f"Reticle link {u, v}: link_bandwidth={total_util:.2%}")
-                if per_task:
-                    for vrid, data_amount in edata['transmission_mark'].items():
-                        logger.debug(f"- Reticle link {u, v}: vrid={vrid}, link_bandwidth_util={data_amount*min_freq/inter_reticle_bandwidth:.2%}")
-            else:
-                group_inter_reticle_bandwidth_utils.append(0)
+        load = self.__get_annotated_load()
+        min_freq = self.__get_min_freq()  # times / second
+
+        reticle_compute_power = self.hardware.reticle_compute_power
+        dram_bandwidth = self.hardware.dram_bandwidth
+        inter_reticle_bandwidth = self.hardware.inter_reticle_bandwidth
+
+        compute_utils = load.compute.totals * min_freq / reticle_compute_power
+        dram_bandwidth_utils = load.dram_access.totals * min_freq / dram_bandwidth
+        inter_reticle_bandwidth_utils = load.transmission.totals * min_freq / inter_reticle_bandwidth
+
+        # idle reticles and dram ports count as zero utilization
+        group_compute_utils = compute_utils[load.compute.busy | load.is_reticle]
+        group_dram_bandwidth_utils = dram_bandwidth_utils[load.dram_access.busy | load.is_dram_port]
+        group_inter_reticle_bandwidth_utils = inter_reticle_bandwidth_utils
+
+        if per_module or per_task:
+            self.get_utilization_profile().log(per_module=per_module, per_task=per_task)
 
         if group:
             logger.debug(f"Average compute util: {np.mean(group_compute_utils).item():.2%}")
@@ -253,45 +641,49 @@ class LpReticleLevelWseEvaluator(BaseWseEvaluator):
             'inter_reticle': np.max(group_inter_reticle_bandwidth_utils).item(),
             'dram': np.max(group_dram_bandwidth_utils).item(),
         }
+        if load.intra_reticle is not None:
+            final_report['intra_reticle'] = (load.intra_reticle.totals.max(initial=0) * min_freq / self.hardware.inter_core_bandwidth).item()
         return final_report
     
+    def get_utilization_profile(self) -> UtilizationProfile:
+        """ Utilization of every reticle, DRAM port and link at the solved frequency as arrays,
+        which can be dumped with to_npz or rendered with plot_heatmap
+        """
+        load = self.__get_annotated_load()
+        min_freq = self.__get_min_freq()
+        return UtilizationProfile(
+            load=load,
+            frequency=min_freq,
+            reticle_compute_power=self.hardware.reticle_compute_power,
+            dram_bandwidth=self.hardware.dram_bandwidth,
+            inter_reticle_bandwidth=self.hardware.inter_reticle_bandwidth,
+            reticle_array_height=self.hardware.reticle_array_height,
+            reticle_array_width=self.hardware.reticle_array_width,
+            vrids=list(self.vrid_2_var),
+        )
+
     def get_module_payload(self) -> Dict[str, int]:
         """ get total payload of each module type.
         This method is useful in calculating power
         """
-        G = self.__build_annotated_graph()
+        load = self.__get_annotated_load()
 
         total_payload = {
-            'compute': 0,
-            'inter_reticle': 0,
-            'dram': 0,
+            'compute': load.compute.totals.sum().item(),
+            'inter_reticle': load.transmission.totals.sum().item(),
+            'dram': load.dram_access.totals.sum().item(),
         }
-        for node, ndata in G.nodes(data=True):
-            if ndata['compute_mark']:
-                payload = sum(ndata['compute_mark'].values())
-                total_payload['compute'] += payload
-            if ndata['dram_access_mark']:
-                payload = sum(ndata['dram_access_mark'].values())
-                total_payload['dram'] += payload
-        for u, v, edata in G.edges(data=True):
-            if edata['transmission_mark']:
-                payload = sum(edata['transmission_mark'].values())
-                total_payload['inter_reticle'] += payload
         return total_payload
 
     def dump_graph(self):
         """ Dump graph and feature tensors for training GNN
         """
-        G = self.__build_annotated_graph()
-        min_freq = self.__lp_solver(G)
+        load = self.__get_annotated_load()
+        min_freq = self.__get_min_freq()
 
         # remove idle modules
-        idle_links = [(u, v) for u, v, edata in G.edges(data=True) \
-                       if not edata['transmission_mark']]
-        G.remove_edges_from(idle_links)
-        idle_nodes = [u for u, ndata in G.nodes(data=True) \
-                      if not (ndata['compute_mark'] or ndata['dram_access_mark'])]
-        G.remove_nodes_from(idle_nodes)
+        active_nodes = load.compute.busy | load.dram_access.busy
+        active_links = load.transmission.busy & active_nodes[load.link_src_ids] & active_nodes[load.link_dst_ids]
 
         # build a new heterogeneous graph from original graph
         # The effective bandwidth of a physical link is affected by:
@@ -300,72 +692,70 @@ class LpReticleLevelWseEvaluator(BaseWseEvaluator):
         # Each physical link may have different effective bandwidth during simulation
         # so we want to formulate this problem as a node/edge regression task.
 
-        # hyper nodes need to gather all relevant modules status
-        num_hyper_nodes = len(self.vrid_2_var)
-
         # physical id -> heterogenenous graph index
-        prids = [prid for prid, ndata in G.nodes(data=True) if ndata['compute_mark']]
-        prid_2_hrid = {prid: i for i, prid in enumerate(prids)}
-        pdpids = [pdpid for pdpid, ndata in G.nodes(data=True) if ndata['dram_access_mark']]
-        pdpid_2_hdpid = {pdpid: i for i, pdpid in enumerate(pdpids)}
-        plid_2_hlid = {plid: i for i, plid in enumerate(G.edges())}
+        # entries of each resource load are grouped by physical id in graph order
+        def get_used_by_hyper(resource_load: ResourceLoad, mask: np.ndarray, capacity: float):
+            physical_2_hetero = np.cumsum(mask) - 1
+            entry_mask = mask[resource_load.resource_ids]
+            hetero_ids = physical_2_hetero[resource_load.resource_ids[entry_mask]]
+            hypers = resource_load.vars[entry_mask]
+            used_by_hyper = list(zip(hetero_ids.tolist(), hypers.tolist()))
+            used_by_hyper_features = (resource_load.amounts[entry_mask] / capacity).tolist()
+            return used_by_hyper, used_by_hyper_features
 
         # reticle used by reticle task (hyper node)
         # feature is ideal latency (it is at least normalized...)
-        hrid_used_by_hyper = []
-        hrid_used_by_hyper_features = []
-        compute_power = self.hardware.reticle_compute_power
-        for prid, hrid in prid_2_hrid.items():
-            compute_mark = G.nodes[prid]['compute_mark']
-            for hyper, data_amount in compute_mark.items():
-                hrid_used_by_hyper.append((hrid, hyper))
-                hrid_used_by_hyper_features.append(data_amount / compute_power)
-
-        hdpid_used_by_hyper = []
-        hdpid_used_by_hyper_features = []
-        dram_bandwidth = self.hardware.dram_bandwidth
-        for pdpid, hdpid in pdpid_2_hdpid.items():
-            dram_access_mark = G.nodes[pdpid]['dram_access_mark']
-            for hyper, data_amount in dram_access_mark.items():
-                hdpid_used_by_hyper.append((hdpid, hyper))
-                hdpid_used_by_hyper_features.append(data_amount / dram_bandwidth)
-        
-        hlid_used_by_hyper = []
-        hlid_used_by_hyper_features = []
-        hlid_label = []  # effective bandwidth to predict, 0 ~ 100%
+        hrid_used_by_hyper, hrid_used_by_hyper_features = get_used_by_hyper(load.compute, load.compute.busy, self.hardware.reticle_compute_power)
+        hdpid_used_by_hyper, hdpid_used_by_hyper_features = get_used_by_hyper(load.dram_access, load.dram_access.busy, self.hardware.dram_bandwidth)
+        hlid_used_by_hyper, hlid_used_by_hyper_features = get_used_by_hyper(load.transmission, active_links, self.hardware.inter_reticle_bandwidth)
+
+        # effective bandwidth to predict, 0 ~ 100%
         inter_reticle_bandwidth = self.hardware.inter_reticle_bandwidth
-        for plid, hlid in plid_2_hlid.items():
-            transmission_mark = G.edges[plid]['transmission_mark']
-            for hyper, data_amount in transmission_mark.items():
-                hlid_used_by_hyper.append((hlid, hyper))
-                hlid_used_by_hyper_features.append(data_amount / inter_reticle_bandwidth)
-            total_data_amount = sum(transmission_mark.values())
-            effective_bandwidth = total_data_amount * min_freq / inter_reticle_bandwidth
-            hlid_label.append(effective_bandwidth)
+        hlid_label = (load.transmission.totals[active_links] * min_freq / inter_reticle_bandwidth).tolist()
 
         # add edges between links
         # is u -> v -> r, then we say (u, v) goes to (v, r)
-        hlid_goes_to_hlid = []
-        hlid_connect_to_ratio = []  # how much data of prev link are transferred to next link
-        hlid_connected_by_ratio = []  # how much data of succ link are transferred from prev link
+        # successors of a link are the active links leaving its destination node, in graph order
+        plids = np.flatnonzero(active_links)
+        hlid_srcs = load.link_src_ids[plids]
+        hlid_dsts = load.link_dst_ids[plids]
+        hlids_by_src = np.argsort(hlid_srcs, kind='stable')
+        num_out_links = np.bincount(hlid_srcs, minlength=len(load.nodes))
+        first_out_link = np.cumsum(num_out_links) - num_out_links
+
+        num_succ = num_out_links[hlid_dsts]
+        prev_hlids = np.repeat(np.arange(len(plids)), num_succ)
+        succ_offsets = np.arange(len(prev_hlids)) - np.repeat(np.cumsum(num_succ) - num_succ, num_succ)
+        succ_hlids = hlids_by_src[first_out_link[hlid_dsts[prev_hlids]] + succ_offsets]
+        hlid_goes_to_hlid = list(zip(prev_hlids.tolist(), succ_hlids.tolist()))
+
+        # how much data of prev link are transferred to next link, and vice versa
         # this is not very accurate, since we've already mixed up all the transmission of the same fused task
-        # therefore, we consider the maximum possible transmission inside this router
-        for (u, v), (r, s) in product(G.edges(), G.edges()):
-            if v == r:
-                hlid_src = plid_2_hlid[(u, v)]
-                hlid_dst = plid_2_hlid[(r, s)]
-                hlid_goes_to_hlid.append((hlid_src, hlid_dst))
-                total_data_amount = 0
-                prev_transmission_mark = G.edges[(u, v)]['transmission_mark']
-                succ_transmission_mark = G.edges[(r, s)]['transmission_mark']
-                union_hyper_set = set(prev_transmission_mark.keys()) | set(succ_transmission_mark.keys())
-                for hyper in union_hyper_set:
-                    data_amount = min(prev_transmission_mark.get(hyper, 0), succ_transmission_mark.get(hyper, 0))
-                    total_data_amount += data_amount
-                prev_total_data_amount = sum(prev_transmission_mark.values())
-                succ_total_data_amount = sum(succ_transmission_mark.values())
-                hlid_connect_to_ratio.append(total_data_amount / prev_total_data_amount)
-                hlid_connected_by_ratio.append(total_data_amount / succ_total_data_amount)
+        # therefore, we consider the maximum possible transmission inside this router, i.e. sum_vrid min(prev, succ)
+        stride = max(len(self.vrid_2_var), 1)
+        physical_2_hetero = np.cumsum(active_links) - 1
+        entry_mask = active_links[load.transmission.resource_ids]
+        entry_hlids = physical_2_hetero[load.transmission.resource_ids[entry_mask]]
+        entry_vars = load.transmission.vars[entry_mask]
+        entry_amounts = load.transmission.amounts[entry_mask]
+        entry_keys = entry_hlids * stride + entry_vars
+        key_order = np.argsort(entry_keys)
+        sorted_entry_keys = entry_keys[key_order]
+        hlid_indptr = np.searchsorted(entry_hlids, np.arange(len(plids) + 1))  # entries are grouped by link
+
+        # pair each entry of the prev link with the same vrid on the succ link
+        num_prev_entries = np.diff(hlid_indptr)[prev_hlids]
+        pair_ids = np.repeat(np.arange(len(prev_hlids)), num_prev_entries)
+        prev_entries = hlid_indptr[prev_hlids][pair_ids] + np.arange(len(pair_ids)) - np.repeat(np.cumsum(num_prev_entries) - num_prev_entries, num_prev_entries)
+        succ_keys = succ_hlids[pair_ids] * stride + entry_vars[prev_entries]
+        positions = np.minimum(np.searchsorted(sorted_entry_keys, succ_keys), max(len(sorted_entry_keys) - 1, 0))
+        found = sorted_entry_keys[positions] == succ_keys if len(sorted_entry_keys) else np.zeros(len(succ_keys), dtype=bool)
+        succ_amounts = np.where(found, entry_amounts[key_order[positions]], 0)
+        overlap_amounts = np.bincount(pair_ids, weights=np.minimum(entry_amounts[prev_entries], succ_amounts), minlength=len(prev_hlids))
+
+        hlid_totals = load.transmission.totals[plids]
+        hlid_connect_to_ratio = (overlap_amounts / hlid_totals[prev_hlids]).tolist()
+        hlid_connected_by_ratio = (overlap_amounts / hlid_totals[succ_hlids]).tolist()
 
         def decompose_edge_list(edge_list, reverse=False):
             src_list = th.tensor([e[0] for e in edge_list])
@@ -422,11 +812,9 @@ class LpReticleLevelWseEvaluator(BaseWseEvaluator):
         Of course, this doesn't include all of the hottest link,
         but we only need to collect representative data of a graph.
         """
-        G = self.__build_annotated_graph()
-        link_2_data_amount = [((u, v), sum(edata['transmission_mark'].values())) for u, v, edata in G.edges(data=True)]
-        sorted_links = sorted(link_2_data_amount, key=lambda item: item[1], reverse=True)  # descending order
-        hottest_link = sorted_links[0][0]
-        vrids = list(G.edges[hottest_link]['transmission_mark'].keys())
+        load = self.__get_annotated_load()
+        hottest_link_id = np.argmax(load.transmission.totals).item()  # the first one in graph order on ties
+        vrids = list(load.transmission.get_mark(hottest_link_id).keys())
         return vrids
     
     def dump_graph_v2(self, virtual_reticle_id: int):
@@ -441,40 +829,64 @@ class LpReticleLevelWseEvaluator(BaseWseEvaluator):
             - calculated total latency.
         Info to rebuild total latency:
             - total transmission amount
+
+        This is for dataset generation, which solves the LP for the label.
+        For inference, use get_graph_features instead.
         """
-        assert virtual_reticle_id < len(self.vrid_2_var)
+        graph_features = self.get_graph_features(virtual_reticle_id)
+        label = self.get_graph_label(virtual_reticle_id)
 
-        G = self.__build_annotated_graph()
-        min_freq = self.__lp_solver(G)
+        return {
+            "edge_srcs": graph_features['edge_srcs'], 
+            "edge_dsts": graph_features['edge_dsts'], 
+            "node_feats": graph_features['node_feats'], 
+            "edge_feats": graph_features['edge_feats'], 
+            "label": label, 
+            "num_total_flit": graph_features['num_total_flit'],
+            "compute_latency": graph_features['compute_latency'],
+            "dram_access_latency": graph_features['dram_access_latency'],
+        }
 
+    def __get_num_flit(self, data_amount):
         WSE_FREQUENCY = 1e9
+        flit_size = self.hardware.inter_reticle_bandwidth / WSE_FREQUENCY  # byte
+        num_flit = math.ceil(data_amount / flit_size) + 1
+        return num_flit
 
-        def get_num_flit(data_amount):
-            flit_size = self.hardware.inter_reticle_bandwidth / WSE_FREQUENCY  # byte
-            num_flit = math.ceil(data_amount / flit_size) + 1
-            return num_flit
-
-        # find all relevant nodes and build a subgraph
-        target_nodes = {u for u, v, edata in G.edges(data=True) if virtual_reticle_id in edata['transmission_mark']}
-        target_neighbors = reduce(lambda x, y: x | y, [set(G.neighbors(u)) for u in target_nodes], set())
-        target_nodes = target_nodes | target_neighbors
-        g = G.subgraph(target_nodes).copy()
-        g: nx.DiGraph
-        # delete edges without transmission, and isolated nodes
-        idle_links = [(u, v) for u, v, edata in g.edges(data=True) if not edata['transmission_mark']]
-        for u, v in idle_links:
-            g.remove_edge(u, v)
-        idle_nodes = [u for u in g.nodes() if g.degree(u) == 0]
-        for u in idle_nodes:
-            g.remove_node(u)
-        assert len(g.nodes()) > 0
-        node_2_alias = {u: i for i, u in enumerate(g.nodes())}
-
-        # build edges
-        edge_srcs = [node_2_alias[u] for u, v in g.edges()]
-        edge_dsts = [node_2_alias[v] for u, v in g.edges()]
+    def __get_task_subgraph(self, virtual_reticle_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ Node ids and busy link ids around the links used by a task, both in topology id order.
+        Neighbors and induced links are read from the CSR out adjacency of the topology.
+        """
+        assert virtual_reticle_id < len(self.vrid_2_var)
 
-        # rebuild info, we only consider link with maximum transmission amount
+        load = self.__get_annotated_load()
+        topology = self.hardware._topology
+
+        def get_out_links(node_ids: np.ndarray) -> np.ndarray:
+            starts, ends = topology.out_indptr[node_ids], topology.out_indptr[node_ids + 1]
+            num_out_links = ends - starts
+            return np.repeat(starts, num_out_links) + np.arange(num_out_links.sum()) - np.repeat(np.cumsum(num_out_links) - num_out_links, num_out_links)
+
+        # source nodes of the links used by the task, and their 1-hop successors
+        target_link_ids = load.transmission.resource_ids[load.transmission.vars == virtual_reticle_id]
+        target_node_ids = np.unique(topology.link_srcs[target_link_ids])
+        in_subgraph = np.zeros(topology.num_nodes, dtype=bool)
+        in_subgraph[target_node_ids] = True
+        in_subgraph[topology.link_dsts[get_out_links(target_node_ids)]] = True
+
+        # keep induced links with transmission, and the nodes they connect
+        candidate_links = get_out_links(np.flatnonzero(in_subgraph))
+        sub_link_ids = np.sort(candidate_links[in_subgraph[topology.link_dsts[candidate_links]] & load.transmission.busy[candidate_links]])
+        is_linked = np.zeros(topology.num_nodes, dtype=bool)
+        is_linked[topology.link_srcs[sub_link_ids]] = True
+        is_linked[topology.link_dsts[sub_link_ids]] = True
+        sub_node_ids = np.flatnonzero(is_linked)
+        assert len(sub_node_ids) > 0
+        return sub_node_ids, sub_link_ids
+
+    def __get_task_latencies(self, virtual_reticle_id: int) -> Dict:
+        """ Info to rebuild total latency of a task
+        """
         subtasks = [task for task in self.task if task.virtual_reticle_id == virtual_reticle_id]
         compute_amount = sum([task.compute_amount for task in subtasks if task.task_type == 'compute'])
         dram_access_amount = sum([task.data_amount for task in subtasks if task.task_type == 'dram_access'])
@@ -483,54 +895,33 @@ class LpReticleLevelWseEvaluator(BaseWseEvaluator):
         if transmission_amount < 1:
             raise RuntimeError("There's no transmission in this training data!")
 
-        num_total_flit = get_num_flit(transmission_amount)
-
-        compute_latency = compute_amount / self.hardware.reticle_compute_power
-        dram_access_latency = dram_access_amount / self.hardware.dram_bandwidth
-        ideal_transmission_latency = transmission_amount / self.hardware.inter_reticle_bandwidth
-
-        # we'll fuse these graph-level features into every node feat
-        compute_transmission_ratio =  np.log(compute_latency / ideal_transmission_latency)
-
-        # build graph level regression target
-        inter_reticle_bandwidth = self.hardware.inter_reticle_bandwidth
-        num_flit_per_service = 0
-
-        for u, v, edata in g.edges(data=True):
-            if not virtual_reticle_id in edata['transmission_mark']:
-                continue
-            vrid_2_num_flit = {vrid: get_num_flit(d) for vrid, d in edata['transmission_mark'].items()}
-            flit_of_current_task = vrid_2_num_flit[virtual_reticle_id]
-            vrid_2_num_relative_flit = {vrid: f / flit_of_current_task for vrid, f in vrid_2_num_flit.items()}
+        return {
+            'num_total_flit': self.__get_num_flit(transmission_amount),
+            'compute_latency': compute_amount / self.hardware.reticle_compute_power,
+            'dram_access_latency': dram_access_amount / self.hardware.dram_bandwidth,
+            'ideal_transmission_latency': transmission_amount / self.hardware.inter_reticle_bandwidth,
+        }
 
-            bw_util = sum([d for d in edata['transmission_mark'].values()]) * min_freq / inter_reticle_bandwidth
-            num_flit_per_service_ = sum(vrid_2_num_relative_flit.values()) * bw_util + (1 - bw_util)
-            # this represents how many flit this link has to send to actually send a flit of this vrid
+    def get_graph_features(self, virtual_reticle_id: int) -> Dict:
+        """ GNN inputs of a task and info to rebuild its total latency.
+        Only the annotated load is needed, the LP is never solved.
+        """
+        load = self.__get_annotated_load()
+        sub_node_ids, sub_link_ids = self.__get_task_subgraph(virtual_reticle_id)
+        node_2_alias = np.full(len(load.nodes), -1, dtype=np.int64)
+        node_2_alias[sub_node_ids] = np.arange(len(sub_node_ids))
 
-            # to rebuild total latency of this link, we must normalize this factor proportional to data amount ratio
-            num_flit_per_service = max(num_flit_per_service, num_flit_per_service_ * (flit_of_current_task / num_total_flit))
+        WSE_FREQUENCY = 1e9
 
-        # logger.debug(f"edge_srcs = {edge_srcs}")
-        # logger.debug(f"edge_dsts = {edge_dsts}")
-        # logger.debug(f"node_feats = {node_feats}")
-        # logger.debug(f"edge_feats = {edge_feats}")
-        # logger.debug(f"num_flit_per_service = {num_flit_per_service}")
-        # logger.debug(f"num_total_flit = {num_total_flit}")
+        # build edges
+        edge_srcs = node_2_alias[load.link_src_ids[sub_link_ids]].tolist()
+        edge_dsts = node_2_alias[load.link_dst_ids[sub_link_ids]].tolist()
 
-        if num_flit_per_service > 50:
-            logger.debug(self.task)
+        # rebuild info, we only consider link with maximum transmission amount
+        task_latencies = self.__get_task_latencies(virtual_reticle_id)
 
-        # The following code test whether we can rebuild total latency
-        transmission_latency = num_flit_per_service * num_total_flit / 1e9
-        gnn_total_latency = max(transmission_latency, compute_latency, dram_access_latency)
-        ground_truth_total_latency = 1 / min_freq
-        ape = (gnn_total_latency - ground_truth_total_latency) / ground_truth_total_latency
-        if np.abs(ape) > 0.01:
-            logger.debug("Check consistency of reconstruction")
-            logger.debug(f"gnn_total_latency :{gnn_total_latency}")
-            logger.debug(f"ground_truth_total_latency :{ground_truth_total_latency}")
-            self.profile_utilization()
-            raise RuntimeError("You didn't find the hottest spot!")
+        # we'll fuse these graph-level features into every node feat
+        compute_transmission_ratio =  np.log(task_latencies['compute_latency'] / task_latencies['ideal_transmission_latency'])
 
         # build node feats
         node_feats = []
@@ -540,8 +931,10 @@ class LpReticleLevelWseEvaluator(BaseWseEvaluator):
         core_array_size = core_array_height * core_array_width
         core_compute_power = np.eye(7, dtype='float')[int(np.log2(core_compute_power / 4))]
 
-        for n, ndata in g.nodes(data=True):
-            is_compute_reticle = [1, 0] if virtual_reticle_id in ndata['compute_mark'] else [0, 1]
+        is_compute_node = np.zeros(len(load.nodes), dtype=bool)
+        is_compute_node[load.compute.resource_ids[load.compute.vars == virtual_reticle_id]] = True
+        for n in sub_node_ids.tolist():
+            is_compute_reticle = [1, 0] if is_compute_node[n] else [0, 1]
             is_compute_reticle = np.array(is_compute_reticle, dtype='float')
             reticle_config = np.array([core_array_height, core_array_width, core_array_size], dtype='float')
             ratios = np.array([compute_transmission_ratio], dtype='float')
@@ -559,8 +952,8 @@ class LpReticleLevelWseEvaluator(BaseWseEvaluator):
         core_noc_bw = np.eye(8)[int(np.log2(core_noc_bw / 32))]
         inter_reticle_bw = np.eye(4)[int(inter_reticle_bw * 4) - 1]
 
-        for u, v, edata in g.edges(data=True):
-            num_flow = np.array([len(edata['transmission_mark'])], dtype='float')
+        for plid in sub_link_ids.tolist():
+            num_flow = np.array([load.transmission.indptr[plid + 1] - load.transmission.indptr[plid]], dtype='float')
             feat = np.concatenate([num_flow, core_noc_bw, inter_reticle_bw], axis=-1)
             edge_feats.append(feat)
         edge_feats = np.stack(edge_feats, axis=0, dtype='float')
@@ -570,11 +963,59 @@ class LpReticleLevelWseEvaluator(BaseWseEvaluator):
             "edge_dsts": edge_dsts, 
             "node_feats": node_feats, 
             "edge_feats": edge_feats, 
-            "label": num_flit_per_service, 
-            "num_total_flit": num_total_flit,
-            "compute_latency": compute_latency,
-            "dram_access_latency": dram_access_latency,
+            "num_total_flit": task_latencies['num_total_flit'],
+            "compute_latency": task_latencies['compute_latency'],
+            "dram_access_latency": task_latencies['dram_access_latency'],
         }
+
+    def get_graph_label(self, virtual_reticle_id: int) -> float:
+        """ Graph-level regression target of a task, i.e. how many flits the hottest link
+        has to send to actually send a flit of this task.
+        This solves the LP, and checks that the total latency can be rebuilt from the label.
+        """
+        load = self.__get_annotated_load()
+        min_freq = self.__get_min_freq()
+        _, sub_link_ids = self.__get_task_subgraph(virtual_reticle_id)
+        task_latencies = self.__get_task_latencies(virtual_reticle_id)
+        num_total_flit = task_latencies['num_total_flit']
+        compute_latency = task_latencies['compute_latency']
+        dram_access_latency = task_latencies['dram_access_latency']
+
+        # build graph level regression target
+        inter_reticle_bandwidth = self.hardware.inter_reticle_bandwidth
+        num_flit_per_service = 0
+
+        for plid in sub_link_ids.tolist():
+            transmission_mark = load.transmission.get_mark(plid)
+            if not virtual_reticle_id in transmission_mark:
+                continue
+            vrid_2_num_flit = {vrid: self.__get_num_flit(d) for vrid, d in transmission_mark.items()}
+            flit_of_current_task = vrid_2_num_flit[virtual_reticle_id]
+            vrid_2_num_relative_flit = {vrid: f / flit_of_current_task for vrid, f in vrid_2_num_flit.items()}
+
+            bw_util = sum([d for d in transmission_mark.values()]) * min_freq / inter_reticle_bandwidth
+            num_flit_per_service_ = sum(vrid_2_num_relative_flit.values()) * bw_util + (1 - bw_util)
+            # this represents how many flit this link has to send to actually send a flit of this vrid
+
+            # to rebuild total latency of this link, we must normalize this factor proportional to data amount ratio
+            num_flit_per_service = max(num_flit_per_service, num_flit_per_service_ * (flit_of_current_task / num_total_flit))
+
+        if num_flit_per_service > 50:
+            logger.debug(self.task)
+
+        # The following code test whether we can rebuild total latency
+        transmission_latency = num_flit_per_service * num_total_flit / 1e9
+        gnn_total_latency = max(transmission_latency, compute_latency, dram_access_latency)
+        ground_truth_total_latency = 1 / min_freq
+        ape = (gnn_total_latency - ground_truth_total_latency) / ground_truth_total_latency
+        if np.abs(ape) > 0.01:
+            logger.debug("Check consistency of reconstruction")
+            logger.debug(f"gnn_total_latency :{gnn_total_latency}")
+            logger.debug(f"ground_truth_total_latency :{ground_truth_total_latency}")
+            self.profile_utilization()
+            raise RuntimeError("You didn't find the hottest spot!")
+
+        return num_flit_per_service
         
 class GnnReticleLevelWseEvaluator(LpReticleLevelWseEvaluator):
     def __init__(self, hardware: WaferScaleEngine, task: ListWaferTask, mapper: WseMapper, gnn_model: nn.Module) -> None:
@@ -586,14 +1027,12 @@ class GnnReticleLevelWseEvaluator(LpReticleLevelWseEvaluator):
 
         total_latency = 0
         for vrid in target_vrids[:1]:
-            gnn_data = self.dump_graph_v2(vrid)
-            gnn_data['design_point'] = None  # pad these fields which are useless here
+            gnn_data = self.get_graph_features(vrid)  # no LP solve on the inference path
+            gnn_data['label'] = np.nan  # pad these fields which are useless here
+            gnn_data['design_point'] = None
             gnn_data['model_parameters'] = None
             gnn_data = process_noception_gnn_data(gnn_data)
             pred = self.gnn_model(gnn_data['graph']).item()
-            label = gnn_data['label'].item()
-
-            logger.debug(f"pred-label percetage error: {np.abs(pred - label) / label:.2%}")
 
             transmission_latency = pred * gnn_data['num_total_flit'] / 1e9
             total_latency_ = max(transmission_latency, gnn_data['compute_latency'], gnn_data['dram_access_latency'])
@@ -0,0 +1,107 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import Dict
+import numpy as np
+from scipy.sparse import vstack
+
+from dse4wse.pe_graph.hardware import WaferScaleEngine
+from dse4wse.pe_graph.task import ListWaferTask
+from dse4wse.pe_graph.mapper import WseMapper
+
+from .lp_solver import LpReticleLevelWseEvaluator
+
+class MaxMinFairWseEvaluator(LpReticleLevelWseEvaluator):
+    """ Allocate steady-state frequencies to virtual reticles with max-min fairness.
+    Instead of forcing every reticle task to the slowest frequency, resources left over
+    by bottlenecked tasks are shared by the others, so every task gets its own rate.
+
+    Progressive filling: all unfrozen tasks speed up together until some resources saturate,
+    then the tasks using them are frozen. Each round is a few sparse matrix-vector products,
+    and there are as many rounds as bottleneck levels.
+    The slowest rate equals the LP optimum, so total latency is the same as LpReticleLevelWseEvaluator.
+    """
+
+    def __init__(self, 
+                 hardware: WaferScaleEngine, 
+                 task: ListWaferTask, 
+                 mapper: WseMapper,
+                 tolerance: float = 1e-9,
+                 ) -> None:
+        super().__init__(hardware, task, mapper)
+        self.tolerance = tolerance
+
+    def invalidate_cache(self):
+        super().invalidate_cache()
+        self._rates = None
+        self._rates_key = None
+
+    def __get_rates(self) -> np.ndarray:
+        """ Frequency of every var, inf for vars that use no resource
+        """
+        cache_key = (len(self.task), self.hardware.reticle_compute_power, self.hardware.dram_bandwidth, self.hardware.inter_reticle_bandwidth)
+        if self._rates is None or self._rates_key != cache_key:
+            self._rates = self.__progressive_filling()
+            self._rates_key = cache_key
+        return self._rates
+
+    def __progressive_filling(self) -> np.ndarray:
+        load = self.get_annotated_load()
+        # busy resources x vars, seconds per iteration, so every resource has capacity 1
+        resource_matrix = vstack([
+            load.compute.to_csr(self.hardware.reticle_compute_power),
+            load.dram_access.to_csr(self.hardware.dram_bandwidth),
+            load.transmission.to_csr(self.hardware.inter_reticle_bandwidth),
+        ], format='csr')
+        resource_matrix_t = resource_matrix.T.tocsr()
+
+        num_vars = resource_matrix.shape[1]
+        rates = np.full(num_vars, np.inf)
+        frozen = np.asarray(resource_matrix.sum(axis=0)).reshape(-1) == 0  # unloaded vars are never bounded
+        frozen_usage = np.zeros(resource_matrix.shape[0])
+
+        while not np.all(frozen):
+            unfrozen_load = resource_matrix @ (~frozen).astype(np.float64)
+            constrained = unfrozen_load > 0
+            levels = (1 - frozen_usage[constrained]) / unfrozen_load[constrained]
+            level = max(levels.min(), 0)
+
+            # freeze every unfrozen var on a saturated resource
+            saturated = np.zeros(len(constrained), dtype=bool)
+            saturated[np.flatnonzero(constrained)[levels <= level * (1 + self.tolerance)]] = True
+            newly_frozen = (resource_matrix_t @ saturated.astype(np.float64) > 0) & ~frozen
+            rates[newly_frozen] = level
+            frozen_usage += resource_matrix @ np.where(newly_frozen, level, 0)
+            frozen |= newly_frozen
+
+        return rates
+
+    def get_rates(self) -> Dict[int, float]:
+        """ Steady-state frequency (times / second) of every virtual reticle
+        """
+        rates = self.__get_rates()
+        return {vrid: rates[var].item() for vrid, var in self.vrid_2_var.items()}
+
+    def get_resource_utilization(self) -> Dict[str, np.ndarray]:
+        """ Utilization of every resource under max-min fair rates, keyed by resource type.
+        compute and dram follow the node order of the reticle graph, inter_reticle follows the link order.
+        """
+        load = self.get_annotated_load()
+        rates = self.__get_rates()
+        finite_rates = np.where(np.isfinite(rates), rates, 0)
+
+        def get_utilization(resource_load, capacity):
+            used_amount = np.bincount(resource_load.resource_ids, weights=resource_load.amounts * finite_rates[resource_load.vars], minlength=resource_load.num_resources)
+            return used_amount / capacity
+
+        return {
+            'compute': get_utilization(load.compute, self.hardware.reticle_compute_power),
+            'dram': get_utilization(load.dram_access, self.hardware.dram_bandwidth),
+            'inter_reticle': get_utilization(load.transmission, self.hardware.inter_reticle_bandwidth),
+        }
+
+    def get_total_latency(self) -> float:
+        min_freq = self.__get_rates().min(initial=np.inf)  # times / second
+        repeated_times = max([reticle_task.repeated_times for reticle_task in self.task])  # times
+        return repeated_times / min_freq
@@ -0,0 +1,172 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import pickle as pkl
+import tempfile
+
+from dse4wse.pe_graph.hardware import WaferScaleEngine
+from dse4wse.pe_graph.task import BaseReticleTask, ListWaferTask, ComputeReticleTask, DramAccessReticleTask, PeerAccessReticleTask
+from dse4wse.pe_graph.mapper import WseMapper
+
+class EvaluatorResultCache():
+    """ Process-wide LRU cache of reticle-level evaluation results, shared by all evaluator instances.
+    Design points that only differ in parameters outside the reticle task list and the mapping
+    (e.g. two runners with the same hidden size, tensor parallel size and nano batch size) hit the same entries.
+
+    Two tables are kept, keyed by the structure digest of (topology, task table, resolved mapping, router):
+        - 'annotated_load': routed loads, which don't depend on compute power or bandwidths. Memory only.
+        - 'min_freq': solved frequencies, additionally keyed by the solver and hardware parameters.
+          If cache_dir is set, they are also persisted as one small pickle per entry,
+          so that later runs and other worker processes reuse them.
+    """
+
+    def __init__(self,
+                 max_annotated_loads: int = 8,
+                 max_min_freqs: int = 65536,
+                 cache_dir: Optional[str] = None,
+                 ) -> None:
+        self.max_sizes = {
+            'annotated_load': max_annotated_loads,
+            'min_freq': max_min_freqs,
+        }
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._tables = {name: OrderedDict() for name in self.max_sizes}
+        self.cache_info = {name: {'hits': 0, 'misses': 0, 'disk_hits': 0} for name in self.max_sizes}
+
+    def get(self, table: str, key: Hashable):
+        """ Cached value, or None on a miss
+        """
+        entries = self._tables[table]
+        if key in entries:
+            entries.move_to_end(key)
+            self.cache_info[table]['hits'] += 1
+            return entries[key]
+        value = self.__load_from_disk(table, key)
+        if value is not None:
+            self.cache_info[table]['disk_hits'] += 1
+            self.__put_in_memory(table, key, value)
+            return value
+        self.cache_info[table]['misses'] += 1
+        return None
+
+    def put(self, table: str, key: Hashable, value) -> None:
+        self.__put_in_memory(table, key, value)
+        if self.cache_dir is not None and table == 'min_freq':
+            self.__save_to_disk(table, key, value)
+
+    def clear(self, reset_stats: bool = True) -> None:
+        """ Drop in-memory entries, files in cache_dir are kept
+        """
+        for entries in self._tables.values():
+            entries.clear()
+        if reset_stats:
+            for stats in self.cache_info.values():
+                stats.update({'hits': 0, 'misses': 0, 'disk_hits': 0})
+
+    def get_hit_rates(self) -> Dict[str, float]:
+        """ Fraction of lookups served from memory or disk, per table
+        """
+        hit_rates = {}
+        for table, stats in self.cache_info.items():
+            num_lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+            hit_rates[table] = (stats['hits'] + stats['disk_hits']) / num_lookups if num_lookups else 0.
+        return hit_rates
+
+    def __put_in_memory(self, table: str, key: Hashable, value) -> None:
+        entries = self._tables[table]
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_sizes[table]:
+            entries.popitem(last=False)
+
+    def __get_disk_path(self, table: str, key: Hashable) -> str:
+        return os.path.join(self.cache_dir, f"{table}_{hashlib.sha256(repr(key).encode()).hexdigest()}.pickle")
+
+    def __load_from_disk(self, table: str, key: Hashable):
+        if self.cache_dir is None or table != 'min_freq':
+            return None
+        path = self.__get_disk_path(table, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                stored_key, value = pkl.load(f)
+        except (OSError, EOFError, pkl.UnpicklingError):
+            return None
+        return value if stored_key == key else None
+
+    def __save_to_disk(self, table: str, key: Hashable, value) -> None:
+        # write then rename, so that concurrent workers never read a partial file
+        path = self.__get_disk_path(table, key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pkl.dump((key, value), f)
+        os.replace(tmp_path, path)
+
+_result_cache = EvaluatorResultCache()
+
+def get_result_cache() -> EvaluatorResultCache:
+    return _result_cache
+
+def set_result_cache(result_cache: EvaluatorResultCache) -> None:
+    """ Replace the process-wide cache, e.g. to set cache_dir or the LRU sizes
+    """
+    global _result_cache
+    assert isinstance(result_cache, EvaluatorResultCache)
+    _result_cache = result_cache
+
+def get_topology_key(hardware: WaferScaleEngine) -> Tuple:
+    """ Everything that decides the reticle graph, and the relative bandwidth of torus wraparound links
+    """
+    if hardware.reticle_topology_type == 'torus':
+        return (*hardware._topology.key, hardware.wraparound_bandwidth_ratio)
+    return hardware._topology.key
+
+def get_structure_digest(hardware: WaferScaleEngine, task: ListWaferTask, mapper: WseMapper) -> str:
+    """ Canonical hash of what the routed loads depend on: topology, task table, resolved mapping and router.
+    Repeated times are left out, since they only scale the latency after the LP is solved.
+    Amounts are hashed with repr, which round-trips floats exactly.
+    """
+    reticle_coordinates = {}
+    dram_port_coordinates = {}
+
+    def find_reticle(vrid: int):
+        if vrid not in reticle_coordinates:
+            reticle_coordinates[vrid] = tuple(int(x) for x in mapper.find_physical_reticle_coordinate(vrid))
+        return reticle_coordinates[vrid]
+
+    def find_dram_port(vdpid: int):
+        if vdpid not in dram_port_coordinates:
+            dram_port_coordinates[vdpid] = tuple(int(x) for x in mapper.find_physical_dram_port_coordinate(vdpid))
+        return dram_port_coordinates[vdpid]
+
+    def get_task_row(task: BaseReticleTask) -> Tuple:
+        if isinstance(task, ComputeReticleTask):
+            return ('compute', find_reticle(task.virtual_reticle_id), task.virtual_reticle_id, float(task.compute_amount))
+        elif isinstance(task, DramAccessReticleTask):
+            return ('dram_access', find_reticle(task.virtual_reticle_id), task.virtual_reticle_id, find_dram_port(task.virtual_dram_port), task.access_type, float(task.data_amount))
+        elif isinstance(task, PeerAccessReticleTask):
+            return ('peer_access', find_reticle(task.virtual_reticle_id), task.virtual_reticle_id, find_reticle(task.peer_virtual_reticle_id), task.access_type, float(task.data_amount))
+        else:
+            raise NotImplementedError(f"Unrecognized subtask type {task.task_type}")
+
+    task_rows = []
+    for reticle_task in task:
+        if reticle_task.task_type == 'fused':
+            # dependencies between subtasks don't change the loads
+            task_rows.append(('fused', tuple(get_task_row(subtask) for subtask in reticle_task.get_subtask_list())))
+        else:
+            task_rows.append(get_task_row(reticle_task))
+
+    # virtual reticle ids decide the LP variables
+    vrids = tuple(task.get_all_virtual_reticle_ids())
+    router = mapper._reticle_router
+    router_key = (type(router).__module__, type(router).__qualname__, tuple(sorted((k, repr(v)) for k, v in vars(router).items())))
+    structure = (get_topology_key(hardware), vrids, tuple(task_rows), router_key)
+    return hashlib.sha256(repr(structure).encode()).hexdigest()
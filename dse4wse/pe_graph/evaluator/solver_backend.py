@@ -0,0 +1,187 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import Deque, Dict, Optional, Tuple
+from collections import deque
+import time
+import numpy as np
+from scipy.optimize import linprog, OptimizeResult
+from scipy.sparse import csr_matrix
+
+class LinprogBackend():
+    """ scipy HiGHS linprog with explicit method, presolve, tolerance and time limit,
+    shared by every linprog solve of an evaluator.
+
+    Unsuccessful solves (infeasible, unbounded, numerical trouble, iteration or time limit)
+    raise RuntimeError instead of returning an unusable x.
+    Every solve appends its wall time, iteration count and problem size to solve_stats,
+    which keeps the last max_solve_stats entries, and adds them to the totals reported by get_profile.
+
+    Coefficients of the evaluator LPs are bytes or FLOPs over bandwidths, and span many orders of magnitude.
+    With scaling, rows and columns are equilibrated to unit magnitude before solving,
+    and x, fun, slacks and marginals of the result are mapped back to the original problem.
+    """
+
+    PRESETS = {
+        # scipy defaults, HiGHS picks simplex or IPM by itself
+        'accurate': {},
+        # dual simplex with cheap pricing and relaxed tolerances, for ranking many design points.
+        # Relative error of the frequency is bounded by the feasibility tolerance
+        'screening': {
+            'method': 'highs-ds',
+            'primal_feasibility_tolerance': 1e-5,
+            'dual_feasibility_tolerance': 1e-5,
+            'simplex_dual_edge_weight_strategy': 'dantzig',
+        },
+    }
+
+    def __init__(self,
+                 method: str = 'highs',
+                 presolve: bool = True,
+                 time_limit: Optional[float] = None,
+                 primal_feasibility_tolerance: Optional[float] = None,
+                 dual_feasibility_tolerance: Optional[float] = None,
+                 ipm_optimality_tolerance: Optional[float] = None,
+                 simplex_dual_edge_weight_strategy: Optional[str] = None,
+                 scaling: bool = True,
+                 max_solve_stats: Optional[int] = 1024,
+                 ) -> None:
+        """
+        method: 'highs' (automatic), 'highs-ds' (dual simplex) or 'highs-ipm' (interior point)
+        time_limit: seconds per solve, None for no limit
+        tolerances and edge weight strategy: None keeps the HiGHS default
+        scaling: equilibrate the LP before handing it to HiGHS
+        max_solve_stats: number of solves kept in solve_stats, 0 to record none, None for no limit
+        """
+        assert method in ['highs', 'highs-ds', 'highs-ipm']
+        self.method = method
+        self.scaling = scaling
+        self.options = {
+            'presolve': presolve,
+            'time_limit': time_limit,
+            'primal_feasibility_tolerance': primal_feasibility_tolerance,
+            'dual_feasibility_tolerance': dual_feasibility_tolerance,
+            'ipm_optimality_tolerance': ipm_optimality_tolerance,
+            'simplex_dual_edge_weight_strategy': simplex_dual_edge_weight_strategy,
+        }
+        self.max_solve_stats = max_solve_stats
+        self.reset_stats()
+
+    @classmethod
+    def from_preset(cls, preset: str, **kwargs) -> "LinprogBackend":
+        """ Build a backend from PRESETS, kwargs override single options
+        """
+        if preset not in cls.PRESETS:
+            raise ValueError(f"Unrecognized linprog preset {preset}, choose from {list(cls.PRESETS)}")
+        return cls(**{**cls.PRESETS[preset], **kwargs})
+
+    def get_config_key(self) -> Tuple:
+        """ Hashable summary of every option that may change the solution
+        """
+        return (self.method, self.scaling, *sorted(self.options.items()))
+
+    def solve(self, c: np.ndarray, A_ub: csr_matrix, b_ub: np.ndarray, bounds: Tuple = (0, None)) -> OptimizeResult:
+        """ bounds: (lower, upper) shared by all variables, None for unbounded
+        """
+        options = {k: v for k, v in self.options.items() if v is not None}
+        start_time = time.perf_counter()
+        if self.scaling:
+            linprog_result = self.__solve_scaled(c, csr_matrix(A_ub), np.asarray(b_ub, dtype=np.float64), bounds, options)
+        else:
+            linprog_result = linprog(c=c, A_ub=A_ub, b_ub=b_ub, bounds=bounds, method=self.method, options=options)
+        elapsed_time = time.perf_counter() - start_time
+
+        stats = {
+            'elapsed_time': elapsed_time,
+            'nit': int(linprog_result.nit),
+            'status': int(linprog_result.status),
+            'num_rows': A_ub.shape[0],
+            'num_cols': A_ub.shape[1],
+            'nnz': A_ub.nnz,
+        }
+        self.solve_stats.append(stats)
+        self.__profile['num_solves'] += 1
+        self.__profile['elapsed_time'] += stats['elapsed_time']
+        self.__profile['nit'] += stats['nit']
+        if linprog_result.status != 0:
+            raise RuntimeError(f"linprog ({self.method}) failed with status {linprog_result.status}: {linprog_result.message}")
+        return linprog_result
+
+    def __solve_scaled(self, c: np.ndarray, A_ub: csr_matrix, b_ub: np.ndarray, bounds, options: Dict) -> OptimizeResult:
+        """ Solve min (s * c C)^T y s.t. (R A C) y <= R b with x = C y, then map the result back
+        """
+        row_scale, col_scale = self.get_scaling(A_ub)
+        rows = np.repeat(np.arange(A_ub.shape[0]), np.diff(A_ub.indptr))
+        scaled_A_ub = csr_matrix((A_ub.data * row_scale[rows] * col_scale[A_ub.indices], A_ub.indices, A_ub.indptr), shape=A_ub.shape)
+        c = np.asarray(c, dtype=np.float64)
+        scaled_c = c * col_scale
+        obj_scale = self.__round_to_power_of_two(1 / np.max(np.abs(scaled_c), initial=0)) if np.any(scaled_c) else 1.
+        lower, upper = bounds
+        lower = np.full(col_scale.shape, -np.inf if lower is None else lower) / col_scale
+        upper = np.full(col_scale.shape, np.inf if upper is None else upper) / col_scale
+
+        linprog_result = linprog(
+            c=obj_scale * scaled_c,
+            A_ub=scaled_A_ub,
+            b_ub=row_scale * b_ub,
+            bounds=np.stack([lower, upper], axis=1),
+            method=self.method,
+            options=options,
+        )
+        if linprog_result.x is not None:
+            linprog_result.x = linprog_result.x * col_scale
+            linprog_result.fun = linprog_result.fun / obj_scale
+            linprog_result.slack = linprog_result.slack / row_scale
+            linprog_result.ineqlin.marginals = linprog_result.ineqlin.marginals * row_scale / obj_scale
+            linprog_result.ineqlin.residual = linprog_result.slack
+            linprog_result.lower.marginals = linprog_result.lower.marginals / col_scale / obj_scale
+            linprog_result.lower.residual = linprog_result.lower.residual * col_scale
+            linprog_result.upper.marginals = linprog_result.upper.marginals / col_scale / obj_scale
+            linprog_result.upper.residual = linprog_result.upper.residual * col_scale
+        return linprog_result
+
+    @staticmethod
+    def get_scaling(A: csr_matrix, num_passes: int = 4) -> Tuple[np.ndarray, np.ndarray]:
+        """ Row and column scales that bring the nonzeros of R A C around 1, by alternating geometric-mean passes.
+        Scales are rounded to powers of two, so that scaling never adds rounding error
+        """
+        A = csr_matrix(A)
+        A.sum_duplicates()
+        num_rows, num_cols = A.shape
+        rows = np.repeat(np.arange(num_rows), np.diff(A.indptr))
+        cols = A.indices
+        log_values = np.log2(np.abs(A.data), where=A.data != 0, out=np.zeros(A.nnz))
+        nonzero = A.data != 0
+        rows, cols, log_values = rows[nonzero], cols[nonzero], log_values[nonzero]
+
+        # work on log2 magnitudes, scaling by sqrt(max * min) centers the range of each row or column at 1
+        def get_log_scale(groups: np.ndarray, values: np.ndarray, num_groups: int) -> np.ndarray:
+            group_max = np.full(num_groups, -np.inf)
+            group_min = np.full(num_groups, np.inf)
+            np.maximum.at(group_max, groups, values)
+            np.minimum.at(group_min, groups, values)
+            empty = np.bincount(groups, minlength=num_groups) == 0
+            group_max[empty] = group_min[empty] = 0  # empty rows and columns are left as is
+            return -(group_max + group_min) / 2
+
+        log_row_scale = np.zeros(num_rows)
+        log_col_scale = np.zeros(num_cols)
+        for _ in range(num_passes):
+            log_row_scale = get_log_scale(rows, log_values + log_col_scale[cols], num_rows)
+            log_col_scale = get_log_scale(cols, log_values + log_row_scale[rows], num_cols)
+
+        return np.exp2(np.round(log_row_scale)), np.exp2(np.round(log_col_scale))
+
+    @staticmethod
+    def __round_to_power_of_two(x: float) -> float:
+        return float(np.exp2(np.round(np.log2(x))))
+
+    def get_profile(self) -> Dict:
+        """ Totals over all solves since the last reset_stats, including those dropped from solve_stats
+        """
+        return dict(self.__profile)
+
+    def reset_stats(self) -> None:
+        self.solve_stats: Deque[Dict] = deque(maxlen=self.max_solve_stats)
+        self.__profile = {'num_solves': 0, 'elapsed_time': 0., 'nit': 0}
@@ -0,0 +1,155 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+from dse4wse.pe_graph.hardware import WaferScaleEngine
+from dse4wse.pe_graph.task import BaseReticleTask, ComputeReticleTask, DramAccessReticleTask, PeerAccessReticleTask
+from dse4wse.pe_graph.mapper import WseMapper
+
+from .base import BaseWseEvaluator
+from .annotated_load import AnnotatedLoad
+
+Coordinate = Tuple[int, int]
+
+class StreamingLpReticleLevelWseEvaluator(BaseWseEvaluator):
+    """ Analytical LP evaluator with bounded memory, for very large wafers and 3d DRAM stacking.
+
+    Tasks are consumed once, in chunks of chunk_size entries, and their loads are added to
+    preallocated per-resource arrays. No per-task entry outlives its chunk and no constraint matrix is built,
+    so peak memory is O(resources + vrids + chunk_size), on top of the hardware itself.
+    The optimum f = 1 / max resource time only needs per-resource totals, so the result is
+    the same as LpReticleLevelWseEvaluator with the analytical solver.
+
+    task may be any iterable of reticle tasks, e.g. a generator, it is only iterated on the first evaluation.
+    """
+
+    def __init__(self,
+                 hardware: WaferScaleEngine,
+                 task: Iterable[BaseReticleTask],
+                 mapper: WseMapper,
+                 chunk_size: int = 65536,
+                 ) -> None:
+        super().__init__(hardware, task, mapper)
+        assert chunk_size > 0
+        self.chunk_size = chunk_size
+        self._totals = None  # data amount or compute amount of every resource, capacities are applied on query
+        self._repeated_times = None
+
+    def get_total_latency(self) -> float:
+        resource_times = self.__get_resource_times()
+        max_load = max([t.max(initial=0) for t in resource_times.values()])
+        return self._repeated_times * max_load
+
+    def get_bottleneck(self) -> Dict:
+        """ Same format as LpReticleLevelWseEvaluator.get_bottleneck
+        """
+        resource_times = self.__get_resource_times()
+        resource_type = max(resource_times, key=lambda k: resource_times[k].max(initial=0))
+        resource_id = np.argmax(resource_times[resource_type]).item()
+        topology = self.hardware._topology
+        resources = topology.links if resource_type == 'inter_reticle' else topology.nodes
+        max_time = resource_times[resource_type][resource_id].item()
+        return {
+            'type': resource_type,
+            'resource': resources[resource_id],
+            'frequency': 1 / max_time if max_time > 0 else np.inf,
+        }
+
+    def get_resource_times(self) -> Dict[str, np.ndarray]:
+        """ Seconds per iteration of every compute node, DRAM port and link, in the id order of the reticle topology
+        """
+        return self.__get_resource_times()
+
+    def __get_resource_times(self) -> Dict[str, np.ndarray]:
+        if self._totals is None:
+            self._totals = self.__accumulate()
+        return {
+            'compute': self._totals['compute'] / self.hardware.reticle_compute_power,
+            'dram': self._totals['dram'] / self.hardware.dram_bandwidth,
+            'inter_reticle': self._totals['inter_reticle'] / self.hardware.inter_reticle_bandwidth,
+        }
+
+    def __accumulate(self) -> Dict[str, np.ndarray]:
+        ids = AnnotatedLoad(self.hardware._topology, 0)  # only used for node and link ids
+        compute_totals = np.zeros(len(ids.nodes))
+        dram_totals = np.zeros(len(ids.nodes))
+        link_totals = np.zeros(len(ids.links))
+        link_bandwidth_ratios = self.hardware.link_bandwidth_ratios
+
+        # the only state that grows with the task list is one coordinate per virtual reticle or DRAM port
+        reticle_coordinates: Dict[int, Coordinate] = {}
+        dram_port_coordinates: Dict[int, Coordinate] = {}
+        repeated_times = 0
+
+        def find_reticle(vrid: int) -> Coordinate:
+            if vrid not in reticle_coordinates:
+                reticle_coordinates[vrid] = self.mapper.find_physical_reticle_coordinate(vrid)
+            return reticle_coordinates[vrid]
+
+        def find_dram_port(vdpid: int) -> Coordinate:
+            if vdpid not in dram_port_coordinates:
+                dram_port_coordinates[vdpid] = self.mapper.find_physical_dram_port_coordinate(vdpid)
+            return dram_port_coordinates[vdpid]
+
+        compute_nodes: List[Coordinate] = []
+        compute_amounts: List[float] = []
+        dram_nodes: List[Coordinate] = []
+        dram_amounts: List[float] = []
+        flow_srcs: List[Coordinate] = []
+        flow_dsts: List[Coordinate] = []
+        flow_amounts: List[float] = []
+
+        def flush():
+            if compute_nodes:
+                np.add.at(compute_totals, ids.get_node_ids(np.array(compute_nodes)), compute_amounts)
+            if dram_nodes:
+                np.add.at(dram_totals, ids.get_node_ids(np.array(dram_nodes)), dram_amounts)
+            if flow_srcs:
+                flow_indices, link_srcs, link_dsts = self.mapper.find_batch_routing_links(np.array(flow_srcs), np.array(flow_dsts))
+                link_ids = ids.get_link_ids(link_srcs, link_dsts)
+                np.add.at(link_totals, link_ids, np.array(flow_amounts, dtype=np.float64)[flow_indices] / link_bandwidth_ratios[link_ids])
+            for entries in [compute_nodes, compute_amounts, dram_nodes, dram_amounts, flow_srcs, flow_dsts, flow_amounts]:
+                entries.clear()
+
+        def add_task(task: BaseReticleTask):
+            # same directions as LpReticleLevelWseEvaluator
+            if isinstance(task, ComputeReticleTask):
+                compute_nodes.append(find_reticle(task.virtual_reticle_id))
+                compute_amounts.append(task.compute_amount)
+            elif isinstance(task, DramAccessReticleTask):
+                prid = find_reticle(task.virtual_reticle_id)
+                pdpid = find_dram_port(task.virtual_dram_port)
+                dram_nodes.append(pdpid)
+                dram_amounts.append(task.data_amount)
+                flow_srcs.append(pdpid if task.access_type == 'read' else prid)
+                flow_dsts.append(prid if task.access_type == 'read' else pdpid)
+                flow_amounts.append(task.data_amount)
+            elif isinstance(task, PeerAccessReticleTask):
+                prid = find_reticle(task.virtual_reticle_id)
+                peer_prid = find_reticle(task.peer_virtual_reticle_id)
+                flow_srcs.append(peer_prid if task.access_type == 'read' else prid)
+                flow_dsts.append(prid if task.access_type == 'read' else peer_prid)
+                flow_amounts.append(task.data_amount)
+            else:
+                raise NotImplementedError(f"Unrecognized subtask type {task.task_type}")
+
+        for reticle_task in self.task:
+            repeated_times = max(repeated_times, reticle_task.repeated_times)
+            if reticle_task.task_type == 'fused':
+                for subtask in reticle_task.get_subtask_list():
+                    add_task(subtask)
+            else:
+                add_task(reticle_task)
+            if len(compute_nodes) + len(dram_nodes) + len(flow_srcs) >= self.chunk_size:
+                flush()
+        flush()
+
+        self._repeated_times = repeated_times
+        return {
+            'compute': compute_totals,
+            'dram': dram_totals,
+            'inter_reticle': link_totals,
+        }
@@ -0,0 +1,115 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import Tuple
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from .annotated_load import AnnotatedLoad
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """ splitmix64 finalizer, uint64 arithmetic wraps around
+    """
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xbf58476d1ce4e5b9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+def _group_by_hash(hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Group index of every element and first element of every group, groups in order of their first element
+    """
+    _, first_indices, hash_indices = np.unique(hashes, return_index=True, return_inverse=True)
+    order = np.argsort(first_indices)
+    ranks = np.empty_like(order)
+    ranks[order] = np.arange(len(order))
+    return ranks[hash_indices.reshape(-1)], first_indices[order]
+
+def get_translation_classes(load: AnnotatedLoad, var_coordinates: np.ndarray) -> np.ndarray:
+    """ Class index of every LP variable, variables in one class put the same loads on resources up to a translation:
+    same amounts on resources of the same type, at the same offsets from their own physical reticle, and on links of the same direction.
+    Variables whose DRAM ports, peers or routes sit at other offsets, e.g. near wafer edges, end up in their own classes.
+    var_coordinates: (num_vars, 2) physical reticle of every variable
+    Each variable is summarized by a sum of hashes over its loads, so this is a few passes over the load arrays.
+    A hash collision merges two classes, which still keeps the LP optimum exact.
+    Classes are numbered in order of their first variable.
+    """
+    topology = load.topology
+    resources = [
+        (load.compute, topology.coordinates, None),
+        (load.dram_access, topology.coordinates, None),
+        (load.transmission, topology.coordinates[topology.link_srcs], topology.link_directions),
+    ]
+    if load.intra_reticle is not None:
+        resources.append((load.intra_reticle, topology.coordinates, None))
+
+    var_coordinates = np.asarray(var_coordinates, dtype=np.int64).reshape(-1, 2)
+    signatures = np.zeros(load.num_vars, dtype=np.uint64)
+    for resource_type, (resource_load, resource_coordinates, resource_directions) in enumerate(resources):
+        offsets = resource_coordinates[resource_load.resource_ids] - var_coordinates[resource_load.vars]
+        hashes = _mix(np.full(len(offsets), resource_type + 1, dtype=np.uint64))
+        hashes = _mix(hashes ^ np.ascontiguousarray(offsets[:, 0]).view(np.uint64))
+        hashes = _mix(hashes ^ np.ascontiguousarray(offsets[:, 1]).view(np.uint64))
+        if resource_directions is not None:
+            hashes = _mix(hashes ^ resource_directions[resource_load.resource_ids].astype(np.uint64))
+        hashes = _mix(hashes ^ np.ascontiguousarray(resource_load.amounts, dtype=np.float64).view(np.uint64))
+        np.add.at(signatures, resource_load.vars, hashes)
+
+    var_classes, _ = _group_by_hash(signatures)
+    return var_classes
+
+def reduce_resource_constraints(resource_constraints: csr_matrix, var_classes: np.ndarray) -> Tuple[csr_matrix, np.ndarray]:
+    """ Merge the columns of each class, then drop duplicate rows.
+    Returns the reduced matrix and, for every original row, the index of its reduced row.
+    A resource shared by several members of a class gets the sum of their coefficients,
+    i.e. the coefficient of the representative weighted by its multiplicity on that resource.
+    """
+    num_rows, num_vars = resource_constraints.shape
+    num_classes = var_classes.max(initial=-1) + 1
+    merge = csr_matrix((np.ones(num_vars), (np.arange(num_vars), var_classes)), shape=(num_vars, num_classes))
+    merged = (resource_constraints @ merge).tocsr()
+    merged.sum_duplicates()
+    merged.sort_indices()
+
+    row_indices, unique_rows = get_unique_rows(merged)
+    return merged[unique_rows], row_indices
+
+def _hash_rows(A: csr_matrix) -> np.ndarray:
+    """ 64-bit hash of the (column, value) pairs and the length of every row, sums of hashes over the nonzeros
+    """
+    data = np.ascontiguousarray(A.data, dtype=np.float64).view(np.uint64)
+    nonzero_hashes = _mix(_mix(A.indices.astype(np.uint64)) ^ data)
+    # differences of the wrapping prefix sums are the row sums
+    prefix_sums = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(nonzero_hashes, dtype=np.uint64)])
+    row_sums = prefix_sums[A.indptr[1:]] - prefix_sums[A.indptr[:-1]]
+    return _mix(row_sums ^ _mix(np.diff(A.indptr).astype(np.uint64)))
+
+def get_unique_rows(A: csr_matrix) -> Tuple[np.ndarray, np.ndarray]:
+    """ Index of every row among the distinct rows, and the first occurrence of every distinct row, in order of first occurrence.
+    A must have sorted indices without duplicates. Rows are grouped by hash, and checked entry by entry against their group,
+    if two different rows ever share a hash, rows are compared one by one instead.
+    """
+    num_rows = A.shape[0]
+    row_indices, unique_rows = _group_by_hash(_hash_rows(A))
+
+    row_lengths = np.diff(A.indptr)
+    representatives = unique_rows[row_indices]
+    if np.array_equal(row_lengths[representatives], row_lengths):
+        nonzero_rows = np.repeat(np.arange(num_rows), row_lengths)
+        representative_positions = A.indptr[representatives][nonzero_rows] + np.arange(A.nnz) - A.indptr[nonzero_rows]
+        data = np.ascontiguousarray(A.data, dtype=np.float64).view(np.uint64)
+        if np.array_equal(A.indices[representative_positions], A.indices) and np.array_equal(data[representative_positions], data):
+            return row_indices, unique_rows
+
+    row_2_unique = {}
+    row_indices = np.zeros(num_rows, dtype=np.int64)
+    unique_rows = []
+    for i in range(num_rows):
+        start, end = A.indptr[i], A.indptr[i + 1]
+        key = (A.indices[start:end].tobytes(), A.data[start:end].tobytes())
+        if key not in row_2_unique:
+            row_2_unique[key] = len(unique_rows)
+            unique_rows.append(i)
+        row_indices[i] = row_2_unique[key]
+    return row_indices, np.array(unique_rows, dtype=np.int64)
@@ -0,0 +1,141 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import List, Optional
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from dse4wse.utils import logger
+
+from .annotated_load import AnnotatedLoad
+
+class UtilizationProfile():
+    """ Utilization of every resource at a given frequency, as arrays instead of log lines.
+
+    Node-level arrays are grids of shape (H + 2, W + 2) indexed by (x + 1, y + 1),
+    so that 2d DRAM ports on the wafer border fit in. Entries without such a resource are NaN.
+        - compute: (H, W) compute utilization of reticles
+        - dram: DRAM port bandwidth utilization on the padded grid
+        - inter_reticle: direction ('+x', '-x', '+y', '-y') -> link utilization on the padded grid, indexed by the link source
+        - task_utils: sparse (num vrids, num resources) utilization of each resource caused by each virtual reticle.
+          Resource ids are node ids of compute, then node ids of DRAM ports, then link ids, as in AnnotatedLoad
+    """
+
+    DIRECTIONS = {'+x': (1, 0), '-x': (-1, 0), '+y': (0, 1), '-y': (0, -1)}
+
+    def __init__(self,
+                 load: AnnotatedLoad,
+                 frequency: float,
+                 reticle_compute_power: float,
+                 dram_bandwidth: float,
+                 inter_reticle_bandwidth: float,
+                 reticle_array_height: int,
+                 reticle_array_width: int,
+                 vrids: List[int],
+                 ) -> None:
+        H, W = reticle_array_height, reticle_array_width
+        num_nodes = len(load.nodes)
+        self.frequency = frequency
+        self.vrids = np.array(vrids, dtype=np.int64)
+        self.nodes = np.array(load.nodes, dtype=np.int64).reshape(-1, 2)
+        self.links = np.array(load.links, dtype=np.int64).reshape(-1, 2, 2)
+        self._resource_loads = [load.compute, load.dram_access, load.transmission]
+        self._resource_offsets = np.array([0, num_nodes, 2 * num_nodes])
+        self._capacities = np.array([reticle_compute_power, dram_bandwidth, inter_reticle_bandwidth], dtype=np.float64)
+        self._resource_utils = [r.totals * frequency / c for r, c in zip(self._resource_loads, self._capacities)]
+
+        grid_indices = tuple((self.nodes + 1).T)
+        compute_utils, dram_utils, link_utils = self._resource_utils
+        padded_compute = np.full((H + 2, W + 2), np.nan)
+        padded_compute[grid_indices] = np.where(load.is_reticle, compute_utils, np.nan)
+        self.compute = padded_compute[1: H + 1, 1: W + 1]
+
+        self.dram = np.full((H + 2, W + 2), np.nan)
+        self.dram[grid_indices] = np.where(load.is_dram_port, dram_utils, np.nan)
+
+        link_srcs, link_dsts = self.links[:, 0], self.links[:, 1]
+        self.inter_reticle = {}
+        for direction, delta in self.DIRECTIONS.items():
+            mask = np.all(link_dsts - link_srcs == delta, axis=1)
+            self.inter_reticle[direction] = np.full((H + 2, W + 2), np.nan)
+            self.inter_reticle[direction][tuple((link_srcs[mask] + 1).T)] = link_utils[mask]
+
+        num_resources = 2 * num_nodes + len(load.links)
+        self.task_utils = csr_matrix((
+            np.concatenate([r.amounts * frequency / c for r, c in zip(self._resource_loads, self._capacities)]),
+            (np.concatenate([r.vars for r in self._resource_loads]), np.concatenate([r.resource_ids + o for r, o in zip(self._resource_loads, self._resource_offsets)])),
+        ), shape=(len(vrids), num_resources))
+
+    def get_max_link_utils(self) -> np.ndarray:
+        """ Utilization of the busiest outgoing link of each node, on the padded grid
+        """
+        stacked = np.stack(list(self.inter_reticle.values()))
+        max_utils = np.max(np.where(np.isnan(stacked), -np.inf, stacked), axis=0)
+        return np.where(np.isinf(max_utils), np.nan, max_utils)
+
+    def to_npz(self, path: str) -> None:
+        """ Dump all arrays, task_utils is stored as its CSR components
+        """
+        np.savez_compressed(
+            path,
+            frequency=self.frequency,
+            vrids=self.vrids,
+            nodes=self.nodes,
+            links=self.links,
+            compute=self.compute,
+            dram=self.dram,
+            **{f"inter_reticle_{direction}": utils for direction, utils in self.inter_reticle.items()},
+            task_utils_data=self.task_utils.data,
+            task_utils_indices=self.task_utils.indices,
+            task_utils_indptr=self.task_utils.indptr,
+            task_utils_shape=np.array(self.task_utils.shape),
+        )
+
+    def plot_heatmap(self, path: Optional[str] = None):
+        """ Compute, DRAM and busiest outgoing link utilization side by side.
+        Saved to path if given, the figure is returned either way.
+        """
+        import matplotlib.pyplot as plt  # only needed for plotting
+
+        fig, axes = plt.subplots(1, 3, figsize=(18, 6))
+        H, W = self.compute.shape
+        panels = [
+            ('Compute util', self.compute, (-0.5, W - 0.5, H - 0.5, -0.5)),
+            ('DRAM bandwidth util', self.dram, (-1.5, W + 0.5, H + 0.5, -1.5)),
+            ('Max outgoing link util', self.get_max_link_utils(), (-1.5, W + 0.5, H + 0.5, -1.5)),
+        ]
+        for ax, (title, utils, extent) in zip(axes, panels):
+            image = ax.imshow(utils, vmin=0, vmax=1, cmap='viridis', extent=extent)
+            ax.set_title(title)
+            ax.set_xlabel('y')
+            ax.set_ylabel('x')
+            fig.colorbar(image, ax=ax, fraction=0.046)
+        fig.tight_layout()
+        if path is not None:
+            fig.savefig(path)
+        return fig
+
+    def log(self, per_module: bool = True, per_task: bool = False) -> None:
+        """ Text view of the arrays, as a single debug message
+        """
+        lines = []
+        names = [
+            ("Reticle coordinate", "compute_util", "compute_util"),
+            ("Reticle coordinate", "dram_bandwidth_util", "dram_bandwidth_util"),
+            ("Reticle link", "link_bandwidth", "link_bandwidth_util"),
+        ]
+        task_utils = self.task_utils.tocsc()
+        for resource_load, utils, offset, (name, util_name, task_util_name) in zip(self._resource_loads, self._resource_utils, self._resource_offsets, names):
+            resources = self.links if name == "Reticle link" else self.nodes
+            for resource_id in np.flatnonzero(resource_load.busy).tolist():
+                resource = resources[resource_id].tolist()
+                resource = tuple(map(tuple, resource)) if name == "Reticle link" else tuple(resource)
+                start, end = task_utils.indptr[offset + resource_id], task_utils.indptr[offset + resource_id + 1]
+                if per_module:
+                    lines.append(f"{name} {resource}: {util_name}={utils[resource_id]:.2%}")
+                if per_task:
+                    for var, util in zip(task_utils.indices[start:end].tolist(), task_utils.data[start:end].tolist()):
+                        lines.append(f"- {name} {resource}: vrid={self.vrids[var]}, {task_util_name}={util:.2%}")
+        if lines:
+            logger.debug("\n".join(lines))
@@ -2,4 +2,6 @@
 from .wafer import WaferScaleEngine
 from .reticle import Reticle
 from .dram_port import DramPort
-from .core import Core
\ No newline at end of file
+from .core import Core
+from .topology import ReticleTopology, get_reticle_topology
+from .core_mesh import CoreMesh, get_core_mesh
\ No newline at end of file
@@ -0,0 +1,132 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import List, Tuple
+from functools import lru_cache
+import numpy as np
+
+class CoreMesh():
+    """ Core array of a reticle, routed with XY like the reticle array: x hops first, then y hops.
+
+    Link loads are computed in closed form for product traffic, where a byte leaves core a with probability p[a]
+    and independently goes to core b with probability q[b]. Cumulative sums of p and q give every link load,
+    so a pattern costs O(H * W) numpy operations instead of one route per core pair.
+
+    Traffic patterns of a reticle are combinations of:
+        - ingress from side s: p uniform over the edge cores of s, q uniform over all cores
+        - egress to side s: the reverse of ingress
+        - transit from side s to side t: p uniform over the edge cores of s, q uniform over the edge cores of t
+        - all to all: p and q uniform over all cores, e.g. exchange between virtual reticles on the same reticle
+    Sides follow ReticleTopology.DIRECTIONS, side i faces the neighbor reticle in direction i, and 3 - i is the opposite side.
+    Link loads are flattened as [+x, -x, +y, -y] links, see get_links.
+    """
+
+    SIDES = ['-x', '-y', '+y', '+x']
+    NUM_SIDES = len(SIDES)
+    ALL_TO_ALL = 2 * NUM_SIDES + NUM_SIDES * NUM_SIDES
+    NUM_PATTERNS = ALL_TO_ALL + 1
+    ZERO_TOLERANCE = 1e-12
+
+    def __init__(self, core_array_height: int, core_array_width: int) -> None:
+        assert core_array_height > 0 and core_array_width > 0
+        self.core_array_height = core_array_height
+        self.core_array_width = core_array_width
+        H, W = core_array_height, core_array_width
+        self.num_links = 2 * (H - 1) * W + 2 * H * (W - 1)
+
+        uniform = np.full((H, W), 1 / (H * W))
+        edges = []
+        for side in self.SIDES:
+            edge = np.zeros((H, W))
+            if side == '-x':
+                edge[0, :] = 1 / W
+            elif side == '+x':
+                edge[-1, :] = 1 / W
+            elif side == '-y':
+                edge[:, 0] = 1 / H
+            else:
+                edge[:, -1] = 1 / H
+            edges.append(edge)
+
+        # unit link loads of every pattern, (NUM_PATTERNS, num_links)
+        patterns = [(edges[s], uniform) for s in range(self.NUM_SIDES)] \
+                 + [(uniform, edges[s]) for s in range(self.NUM_SIDES)] \
+                 + [(edges[s], edges[t]) for s in range(self.NUM_SIDES) for t in range(self.NUM_SIDES)] \
+                 + [(uniform, uniform)]
+        self.unit_loads = np.stack([self.get_link_loads(p, q) for p, q in patterns])
+        self.unit_loads.flags.writeable = False
+        self.candidate_links = self.__get_candidate_links()
+        self._candidate_unit_loads = np.ascontiguousarray(self.unit_loads[:, self.candidate_links])
+
+    def __get_candidate_links(self) -> np.ndarray:
+        """ Links whose unit loads are not dominated by another link in every pattern.
+        Data amounts are non-negative, so the hottest link of any traffic mix is among them
+        """
+        link_unit_loads = np.ascontiguousarray(self.unit_loads.T)
+        remaining = np.argsort(-link_unit_loads.sum(axis=1), kind='stable')
+        candidates = []
+        while len(remaining):
+            # the link with the largest sum is never dominated by the remaining ones
+            top, remaining = remaining[0], remaining[1:]
+            candidates.append(top)
+            remaining = remaining[~np.all(link_unit_loads[remaining] <= link_unit_loads[top], axis=1)]
+        return np.sort(np.array(candidates, dtype=np.int64))
+
+    @classmethod
+    def get_ingress_pattern(cls, side: np.ndarray) -> np.ndarray:
+        return side
+
+    @classmethod
+    def get_egress_pattern(cls, side: np.ndarray) -> np.ndarray:
+        return cls.NUM_SIDES + side
+
+    @classmethod
+    def get_transit_pattern(cls, in_side: np.ndarray, out_side: np.ndarray) -> np.ndarray:
+        return 2 * cls.NUM_SIDES + cls.NUM_SIDES * in_side + out_side
+
+    def get_link_loads(self, p: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """ Link loads of one byte of product traffic from distribution p to distribution q, both (H, W)
+        """
+        # x hops run along the source column y_a, from row x_a to row x_b
+        p_cum = np.cumsum(p, axis=0)[:-1]  # P(x_a <= k, y_a = y)
+        p_col = p.sum(axis=0)
+        q_x_cum = np.cumsum(q.sum(axis=1))[:-1, None]  # P(x_b <= k)
+        plus_x = p_cum * (1 - q_x_cum)
+        minus_x = (p_col - p_cum) * q_x_cum
+
+        # y hops run along the destination row x_b, from column y_a to column y_b
+        p_y_cum = np.cumsum(p_col)[None, :-1]  # P(y_a <= j)
+        q_cum = np.cumsum(q, axis=1)[:, :-1]  # P(x_b = x, y_b <= j)
+        q_row = q.sum(axis=1, keepdims=True)
+        plus_y = p_y_cum * (q_row - q_cum)
+        minus_y = (1 - p_y_cum) * q_cum
+
+        link_loads = np.concatenate([plus_x.ravel(), minus_x.ravel(), plus_y.ravel(), minus_y.ravel()])
+        # differences of cumulative sums leave rounding noise where a load is exactly zero,
+        # which would add meaningless tiny coefficients to the LP
+        link_loads[np.abs(link_loads) < self.ZERO_TOLERANCE] = 0
+        return link_loads
+
+    def get_links(self) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        """ (src core, dst core) of every link, in the order of get_link_loads
+        """
+        H, W = self.core_array_height, self.core_array_width
+        plus_x = [((x, y), (x + 1, y)) for x in range(H - 1) for y in range(W)]
+        plus_y = [((x, y), (x, y + 1)) for x in range(H) for y in range(W - 1)]
+        return plus_x + [(v, u) for u, v in plus_x] + plus_y + [(v, u) for u, v in plus_y]
+
+    def get_max_link_loads(self, pattern_amounts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ (N, NUM_PATTERNS) data amounts of N reticles -> load and index of the hottest link of each reticle
+        """
+        if self.num_links == 0:
+            return np.zeros(len(pattern_amounts)), np.zeros(len(pattern_amounts), dtype=np.int64)
+        link_loads = pattern_amounts @ self._candidate_unit_loads
+        hot_candidates = np.argmax(link_loads, axis=1)
+        return link_loads[np.arange(len(link_loads)), hot_candidates], self.candidate_links[hot_candidates]
+
+@lru_cache(maxsize=64)
+def get_core_mesh(core_array_height: int, core_array_width: int) -> CoreMesh:
+    """ Shared core mesh per array size
+    """
+    return CoreMesh(core_array_height, core_array_width)
@@ -6,8 +6,12 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from typing import Dict
 
 from .core import Core
+from .core_mesh import CoreMesh, get_core_mesh
 
 class Reticle():
+    """ Shared by all reticles of a WaferScaleEngine, the coordinate of a reticle is its node in the topology
+    """
+
     def __init__(self, 
                  core_array_height: int,
                  core_array_width: int,
@@ -19,8 +23,6 @@ class Reticle():
         self.inter_core_bandwidth = inter_core_bandwidth
         self.core_config = core_config
 
-        self.coordinate = kwargs.get('coordinate', None)
-
         self._core_graph = self.__build_core_graph()
 
     @classmethod
@@ -39,5 +41,5 @@ class Reticle():
         reticle_sram_size = core_array_height * core_array_width * core_sram_size
         return reticle_sram_size
     
-    def __build_core_graph(self):
-        return None
\ No newline at end of file
+    def __build_core_graph(self) -> CoreMesh:
+        return get_core_mesh(self.core_array_height, self.core_array_width)
\ No newline at end of file
@@ -0,0 +1,200 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from typing import Dict, List, Tuple
+from functools import lru_cache, cached_property
+import numpy as np
+import networkx as nx
+
+Coordinate = Tuple[int, int]
+
+class ReticleTopology():
+    """ Reticle graph of a wafer as integer arrays, which only depends on the array size and DRAM stacking.
+
+    Nodes are the (H + 2) x (W + 2) grid of reticles plus a border ring for 2d DRAM ports, without its four corners.
+    Node ids run row-major over that padded grid, so that ids are sorted by coordinate,
+    and links are sorted by (src id, dst id), which is also the iteration order of the former networkx graph.
+    A 'torus' topology adds wraparound links between the first and last reticle of every reticle row and column,
+    in both directions, along any dimension longer than 2, where they would duplicate mesh links otherwise.
+        - coordinates: (num_nodes, 2) coordinate of every node
+        - is_reticle, is_dram_port: (num_nodes,) flags
+        - link_srcs, link_dsts: (num_links,) node ids of every link
+        - link_directions: (num_links,) index of the link direction in DIRECTIONS, wraparound links keep the direction they travel in
+        - link_is_wraparound: (num_links,) flags
+        - out_indptr: CSR out adjacency, links leaving node u are out_indptr[u]: out_indptr[u + 1]
+        - in_indptr, in_links: CSR in adjacency, links entering node v are in_links[in_indptr[v]: in_indptr[v + 1]]
+
+    Instances are shared by every WaferScaleEngine with the same key, through get_reticle_topology,
+    so arrays are read-only. Reticle and DramPort objects depend on hardware parameters, and are created by the engine on demand.
+    """
+
+    DIRECTIONS = [(-1, 0), (0, -1), (0, 1), (1, 0)]  # sorted, so that out links of a node are sorted by dst id
+
+    def __init__(self,
+                 reticle_array_height: int,
+                 reticle_array_width: int,
+                 dram_stacking_type: str,
+                 topology_type: str = 'mesh',
+                 ) -> None:
+        assert dram_stacking_type in ['2d', '3d']
+        assert topology_type in ['mesh', 'torus']
+        self.reticle_array_height = reticle_array_height
+        self.reticle_array_width = reticle_array_width
+        self.dram_stacking_type = dram_stacking_type
+        self.topology_type = topology_type
+        H, W = reticle_array_height, reticle_array_width
+
+        # nodes
+        xs, ys = np.meshgrid(np.arange(-1, H + 1), np.arange(-1, W + 1), indexing='ij')
+        coordinates = np.stack([xs.ravel(), ys.ravel()], axis=1)
+        on_border_x = (coordinates[:, 0] == -1) | (coordinates[:, 0] == H)
+        on_border_y = (coordinates[:, 1] == -1) | (coordinates[:, 1] == W)
+        self.coordinates = coordinates[~(on_border_x & on_border_y)]
+        self.num_nodes = len(self.coordinates)
+        self.is_reticle = ~(on_border_x | on_border_y)[~(on_border_x & on_border_y)]
+        if dram_stacking_type == '2d':
+            self.is_dram_port = ~self.is_reticle
+        elif dram_stacking_type == '3d':
+            self.is_dram_port = self.is_reticle.copy()
+        else:
+            raise NotImplementedError
+
+        # dense coordinate -> node id table, -1 for corners
+        self._node_id_grid = np.full((H + 2, W + 2), -1, dtype=np.int64)
+        self._node_id_grid[tuple((self.coordinates + 1).T)] = np.arange(self.num_nodes)
+
+        # links, sorted by src then dst
+        link_srcs = np.repeat(np.arange(self.num_nodes), len(self.DIRECTIONS))
+        dst_coordinates = (self.coordinates[:, None, :] + np.array(self.DIRECTIONS)[None, :, :]).reshape(-1, 2)
+        dst_indices = dst_coordinates + 1
+        inside = np.all((dst_indices >= 0) & (dst_indices < self._node_id_grid.shape), axis=1)
+        link_dsts = np.full(len(link_srcs), -1, dtype=np.int64)
+        link_dsts[inside] = self._node_id_grid[tuple(dst_indices[inside].T)]
+        valid = link_dsts >= 0
+        link_srcs = link_srcs[valid]
+        link_dsts = link_dsts[valid]
+        link_directions = np.tile(np.arange(len(self.DIRECTIONS)), self.num_nodes)[valid]
+        link_is_wraparound = np.zeros(len(link_srcs), dtype=bool)
+        if topology_type == 'torus':
+            wrap_srcs, wrap_dsts, wrap_directions = self.__get_wraparound_links()
+            link_srcs = np.concatenate([link_srcs, wrap_srcs])
+            link_dsts = np.concatenate([link_dsts, wrap_dsts])
+            link_directions = np.concatenate([link_directions, wrap_directions])
+            link_is_wraparound = np.concatenate([link_is_wraparound, np.ones(len(wrap_srcs), dtype=bool)])
+            order = np.lexsort((link_dsts, link_srcs))
+            link_srcs, link_dsts, link_directions, link_is_wraparound = link_srcs[order], link_dsts[order], link_directions[order], link_is_wraparound[order]
+        self.link_srcs = link_srcs
+        self.link_dsts = link_dsts
+        self.link_directions = link_directions
+        self.link_is_wraparound = link_is_wraparound
+        self.num_links = len(self.link_srcs)
+        self._link_keys = self.link_srcs * self.num_nodes + self.link_dsts  # sorted
+
+        # CSR adjacency
+        self.out_indptr = np.concatenate([[0], np.cumsum(np.bincount(self.link_srcs, minlength=self.num_nodes))])
+        self.in_links = np.lexsort((self.link_srcs, self.link_dsts))
+        self.in_indptr = np.concatenate([[0], np.cumsum(np.bincount(self.link_dsts, minlength=self.num_nodes))])
+
+        for array in [self.coordinates, self.is_reticle, self.is_dram_port, self._node_id_grid,
+                      self.link_srcs, self.link_dsts, self.link_directions, self.link_is_wraparound, self._link_keys, self.out_indptr, self.in_links, self.in_indptr]:
+            array.flags.writeable = False
+
+    def __get_wraparound_links(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Node ids and directions of wraparound links, from the last reticle of a row or column to the first one (+1 direction) and back
+        """
+        H, W = self.reticle_array_height, self.reticle_array_width
+        firsts, lasts, plus_directions = [], [], []
+        if H > 2:
+            ys = np.arange(W)
+            firsts.append(np.stack([np.zeros(W, dtype=np.int64), ys], axis=1))
+            lasts.append(np.stack([np.full(W, H - 1), ys], axis=1))
+            plus_directions.append(np.full(W, self.DIRECTIONS.index((1, 0))))
+        if W > 2:
+            xs = np.arange(H)
+            firsts.append(np.stack([xs, np.zeros(H, dtype=np.int64)], axis=1))
+            lasts.append(np.stack([xs, np.full(H, W - 1)], axis=1))
+            plus_directions.append(np.full(H, self.DIRECTIONS.index((0, 1))))
+        if not firsts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        first_ids = self._node_id_grid[tuple((np.concatenate(firsts) + 1).T)]
+        last_ids = self._node_id_grid[tuple((np.concatenate(lasts) + 1).T)]
+        plus_directions = np.concatenate(plus_directions)
+        minus_directions = len(self.DIRECTIONS) - 1 - plus_directions
+        return np.concatenate([last_ids, first_ids]), np.concatenate([first_ids, last_ids]), np.concatenate([plus_directions, minus_directions])
+
+    @property
+    def key(self) -> Tuple:
+        return (self.reticle_array_height, self.reticle_array_width, self.dram_stacking_type, self.topology_type)
+
+    def get_node_ids(self, coordinates: np.ndarray) -> np.ndarray:
+        """ (N, 2) coordinates -> (N,) node ids, raises KeyError on coordinates outside the graph
+        """
+        coordinates = np.asarray(coordinates).reshape(-1, 2)
+        if not np.all(np.isfinite(coordinates)):
+            raise KeyError("Invalid node coordinate")
+        indices = coordinates.astype(np.int64) + 1
+        valid = np.all((indices >= 0) & (indices < self._node_id_grid.shape), axis=1)
+        node_ids = np.full(indices.shape[0], -1, dtype=np.int64)
+        node_ids[valid] = self._node_id_grid[tuple(indices[valid].T)]
+        if np.any(node_ids < 0):
+            raise KeyError(f"Invalid node coordinate {coordinates[node_ids < 0][0].tolist()}")
+        return node_ids
+
+    def get_coordinates(self, node_ids: np.ndarray) -> np.ndarray:
+        """ (N,) node ids -> (N, 2) coordinates
+        """
+        return self.coordinates[np.asarray(node_ids, dtype=np.int64)]
+
+    def get_link_ids(self, src_ids: np.ndarray, dst_ids: np.ndarray) -> np.ndarray:
+        """ Node ids of both ends -> link ids, raises KeyError on missing links
+        """
+        link_keys = np.asarray(src_ids, dtype=np.int64) * self.num_nodes + np.asarray(dst_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self._link_keys, link_keys), max(self.num_links - 1, 0))
+        if np.any(self._link_keys[positions] != link_keys):
+            raise KeyError("Invalid link")
+        return positions
+
+    def get_out_links(self, node_id: int) -> np.ndarray:
+        return np.arange(self.out_indptr[node_id], self.out_indptr[node_id + 1])
+
+    def get_in_links(self, node_id: int) -> np.ndarray:
+        return self.in_links[self.in_indptr[node_id]: self.in_indptr[node_id + 1]]
+
+    def get_dram_port_coordinates(self) -> List[Coordinate]:
+        return [tuple(c) for c in self.coordinates[self.is_dram_port].tolist()]
+
+    # coordinate views, built once per topology for code that works on coordinates
+
+    @cached_property
+    def nodes(self) -> List[Coordinate]:
+        return [tuple(c) for c in self.coordinates.tolist()]
+
+    @cached_property
+    def links(self) -> List[Tuple[Coordinate, Coordinate]]:
+        nodes = self.nodes
+        return [(nodes[u], nodes[v]) for u, v in zip(self.link_srcs.tolist(), self.link_dsts.tolist())]
+
+    @cached_property
+    def node_2_id(self) -> Dict[Coordinate, int]:
+        return {node: i for i, node in enumerate(self.nodes)}
+
+    @cached_property
+    def link_2_id(self) -> Dict[Tuple[Coordinate, Coordinate], int]:
+        return {link: i for i, link in enumerate(self.links)}
+
+    @cached_property
+    def graph(self) -> nx.DiGraph:
+        """ Frozen networkx view for visualization and graph algorithms, built on first access.
+        Node data flags positions: 'reticle' and 'dram_port' are booleans.
+        """
+        G = nx.DiGraph()
+        G.add_nodes_from((node, {'reticle': r, 'dram_port': d}) for node, r, d in zip(self.nodes, self.is_reticle.tolist(), self.is_dram_port.tolist()))
+        G.add_edges_from((u, v, {'wraparound': w}) for (u, v), w in zip(self.links, self.link_is_wraparound.tolist()))
+        return nx.freeze(G)
+
+@lru_cache(maxsize=64)
+def get_reticle_topology(reticle_array_height: int, reticle_array_width: int, dram_stacking_type: str, topology_type: str = 'mesh') -> ReticleTopology:
+    """ Shared topology per key, use get_reticle_topology.cache_info() / cache_clear() to inspect or reset
+    """
+    return ReticleTopology(reticle_array_height, reticle_array_width, dram_stacking_type, topology_type)
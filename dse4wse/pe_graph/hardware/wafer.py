@@ -4,12 +4,13 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from typing import Dict, List
-from itertools import product
-import networkx as nx
+import numpy as np
 
 from .reticle import Reticle
 from .dram_port import DramPort
 from .power_table import WsePowerTable
+from .topology import ReticleTopology, get_reticle_topology
+from .core_mesh import CoreMesh, get_core_mesh
 
 class WaferScaleEngine():
 
@@ -21,8 +22,14 @@ class WaferScaleEngine():
                  dram_bandwidth: int,
                  dram_stacking_type: str,
                  reticle_config: Dict,
+                 reticle_topology_type: str = 'mesh',
+                 wraparound_bandwidth_ratio: float = 1.0,
                  **kwargs,
                  ) -> None:
+        """
+        reticle_topology_type: 'mesh', or 'torus' with wraparound links between the edges of the reticle array
+        wraparound_bandwidth_ratio: bandwidth of a wraparound link relative to inter_reticle_bandwidth, e.g. < 1 for long wires
+        """
         
         self.reticle_array_height = reticle_array_height
         self.reticle_array_width = reticle_array_width
@@ -31,13 +38,60 @@ class WaferScaleEngine():
         self.dram_bandwidth = dram_bandwidth
         self.dram_stacking_type = dram_stacking_type
         self.reticle_config = reticle_config
+        self.reticle_topology_type = reticle_topology_type
+        self.wraparound_bandwidth_ratio = wraparound_bandwidth_ratio
         assert dram_stacking_type in ['2d', '3d']
+        assert reticle_topology_type in ['mesh', 'torus']
+        assert wraparound_bandwidth_ratio > 0
+
+        # the topology is shared with every engine of the same array size, DRAM stacking and topology type, and must not be modified
+        self._topology: ReticleTopology = get_reticle_topology(reticle_array_height, reticle_array_width, dram_stacking_type, reticle_topology_type)
+        # flyweights: all reticles share one Reticle, all DRAM ports share one DramPort,
+        # coordinates live in the topology and ports are its is_dram_port mask
+        self._reticle = None  # built on demand
+        self._dram_port = None
 
-        self._reticle_graph = self.__build_reticle_graph()
+    def __getstate__(self) -> Dict:
+        """ Only hardware parameters are pickled or deep-copied, the topology is looked up again from its key
+        """
+        state = self.__dict__.copy()
+        state['_topology'] = self._topology.key
+        state['_reticle'] = None
+        state['_dram_port'] = None
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._topology = get_reticle_topology(*state['_topology'])
+
+    @property
+    def _reticle_graph(self):
+        """ networkx view of the topology, only built when first needed
+        """
+        return self._topology.graph
 
     @property
     def reticle_compute_power(self):
         return Reticle.get_compute_power(self.reticle_config)
+
+    @property
+    def core_mesh(self) -> CoreMesh:
+        return get_core_mesh(self.reticle_config['core_array_height'], self.reticle_config['core_array_width'])
+
+    @property
+    def inter_core_bandwidth(self):
+        return self.reticle_config['inter_core_bandwidth']
+
+    @property
+    def link_bandwidth_ratios(self) -> np.ndarray:
+        """ (num_links,) bandwidth of every link of the topology relative to inter_reticle_bandwidth.
+        Evaluators divide the data amount of each hop by it, so that transmission loads stay in bytes of a regular link
+        and a single inter_reticle_bandwidth still gives the time on every link.
+        """
+        return np.where(self._topology.link_is_wraparound, self.wraparound_bandwidth_ratio, 1.0)
+
+    def get_link_bandwidths(self) -> np.ndarray:
+        return self.inter_reticle_bandwidth * self.link_bandwidth_ratios
     
     def get_bisection_bandwidth(self):
         """ This is actually the maximum bandwidth 2d-torus could offer, not the conventional bisection bandwidth
@@ -53,65 +107,28 @@ class WaferScaleEngine():
             raise NotImplementedError
         return num_dram_port * self.dram_bandwidth
     
-    def __build_reticle_graph(self):
-        # build graph skeleton
-        H, W = self.reticle_array_height, self.reticle_array_width
-        G = nx.grid_2d_graph(range(-1, H + 1), range(-1, W + 1), create_using=nx.DiGraph)
-        G : nx.DiGraph
-        for node, ndata in G.nodes(data=True):
-            ndata['reticle'] = None
-            ndata['dram_port'] = None
-        for node in [(-1, -1), (-1, W), (H, -1), (H, W)]:
-            G.remove_node(node)
-
-        def add_reticle(x, y, reticle: Reticle):
-            G.nodes[(x, y)]['reticle'] = reticle
-
-        def add_dram_port(x, y, dram_port: DramPort):
-            G.nodes[(x, y)]['dram_port'] = dram_port
-
-        # reticle arrays
-        for x, y in product(range(H), range(W)):
-            reticle = Reticle(coordinate=(x, y), **self.reticle_config)
-            add_reticle(x, y, reticle)
-
-        # dram ports
-        if self.dram_stacking_type == '2d':
-            for x in range(0, self.reticle_array_height):
-                add_dram_port(x, -1, DramPort())
-                add_dram_port(x, self.reticle_array_width, DramPort())
-            for y in range(0, self.reticle_array_width):
-                add_dram_port(-1, y, DramPort())
-                add_dram_port(self.reticle_array_height, y, DramPort())
-        elif self.dram_stacking_type == '3d':
-            for x, y in product(range(self.reticle_array_height), range(self.reticle_array_width)):
-                add_dram_port(x, y, DramPort())
-        else:
-            raise NotImplementedError
-
-        return G
-    
     def get_node_from_coordinate(self, x: int, y: int):
         return self.nodes([x, y])  # for direct graph operations
             
     def get_reticle_from_coordinate(self, x: int, y: int) -> Reticle:
         assert x >= 0 and x < self.reticle_array_height
         assert y >= 0 and y < self.reticle_array_width
-        ret = self._reticle_graph.nodes[(x, y)]['reticle']
-        assert ret
-        return ret
+        assert self._topology.is_reticle[self._topology.get_node_ids((x, y))].item()
+        if self._reticle is None:
+            self._reticle = Reticle(**self.reticle_config)
+        return self._reticle
     
     def get_dram_port_from_coordinate(self, x: int, y: int) -> DramPort:
         if self.dram_stacking_type == '2d':
             assert x in [-1, self.reticle_array_height] or y in [-1, self.reticle_array_width]
-            ret = self._reticle_graph.nodes[(x, y)]['dram_port']
         elif self.dram_stacking_type == '3d':
             assert x in range(self.reticle_array_height) and y in range(self.reticle_array_width)
-            ret = self._reticle_graph.nodes[(x, y)]['dram_port']
         else:
             raise RuntimeError
-        assert ret
-        return ret
+        assert self._topology.is_dram_port[self._topology.get_node_ids((x, y))].item()
+        if self._dram_port is None:
+            self._dram_port = DramPort()
+        return self._dram_port
 
     def buiid_power_table(self) -> WsePowerTable:
         """Translate parameters into raw design parameters, and build a power table
@@ -9,7 +9,7 @@ class HashDramPortMapper(BaseDramPortMapper):
                  wafer_scale_engine,
                  **kwargs) -> None:
         super().__init__(**kwargs)
-        self.dram_port_coordinates = [node for node, ndata in wafer_scale_engine._reticle_graph.nodes(data=True) if ndata['dram_port']]
+        self.dram_port_coordinates = wafer_scale_engine._topology.get_dram_port_coordinates()
         self.hash_func = hashlib.sha256
 
     def __call__(self, virtual_dram_port_id: int):
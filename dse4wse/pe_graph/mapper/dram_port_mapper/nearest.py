@@ -17,7 +17,7 @@ class NearestDramPortMapper(BaseDramPortMapper):
                 **kwargs,
                 ) -> None:
         super().__init__(**kwargs)
-        self.dram_port_coordinates = [node for node, ndata in wafer_scale_engine._reticle_graph.nodes(data=True) if ndata['dram_port']]
+        self.dram_port_coordinates = wafer_scale_engine._topology.get_dram_port_coordinates()
         self.reticle_mapper = reticle_mapper
         self.task = task
         self.__mapping_table = self.__setup_mapping_table()
@@ -41,9 +41,10 @@ class NearestDramPortMapper(BaseDramPortMapper):
                     if subtask.task_type == 'dram_access':
                         add_dram_access_task(subtask)
         
+        dram_ports = np.array(self.dram_port_coordinates)
+
         def get_nearest_dram_port(coord_list):
             reticle_coords = np.array(coord_list)
-            dram_ports = np.array(self.dram_port_coordinates)
             reticle_centroid = np.mean(reticle_coords, axis=0, keepdims=True)
             l1_distance = np.sum(np.abs(dram_ports - reticle_centroid), axis=1, keepdims=False)
             nearest_dram_port = self.dram_port_coordinates[np.argmin(l1_distance)]
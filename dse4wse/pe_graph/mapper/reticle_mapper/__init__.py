@@ -1,4 +1,4 @@
-
 from .base import BaseReticleMapper
 from .xy import XYReticleMapper
-from .zigzag import ZigZagReticleMapper
\ No newline at end of file
+from .zigzag import ZigZagReticleMapper
+from .table import TableReticleMapper
\ No newline at end of file
@@ -0,0 +1,20 @@
+from typing import Dict, Tuple
+import numpy as np
+
+from .base import BaseReticleMapper
+
+Coordinate = Tuple[int, int]
+
+class TableReticleMapper(BaseReticleMapper):
+    """ Look up physical reticles from an explicit vrid -> coordinate table,
+    e.g. the result of a mapping search
+    """
+
+    def __init__(self,
+                 mapping_table: Dict[int, Coordinate],
+                 **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.mapping_table = dict(mapping_table)
+
+    def __call__(self, virtual_reticle_id: int):
+        return self.mapping_table.get(virtual_reticle_id, (np.inf, np.inf))
@@ -4,3 +4,4 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from .base import BaseReticleRouter
 from .xy import XYReticleRouter
+from .torus_xy import TorusXYReticleRouter
@@ -5,6 +5,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from typing import List, Tuple
 from abc import ABC, abstractmethod
+import numpy as np
 
 Coordinate = Tuple[int, int]
 
@@ -17,4 +18,20 @@ class BaseReticleRouter(ABC):
 
     @abstractmethod
     def __call__(self, src: Coordinate, dst: Coordinate) -> List[Coordinate]:
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def get_link_batch(self, srcs: np.ndarray, dsts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Route a batch of flows at once.
+        srcs, dsts: (num_flow, 2) coordinates
+        return flow index, link source and link destination coordinates of every hop,
+        flows are in input order and hops are in path order.
+        Routers may override this with a vectorized implementation.
+        """
+        flow_indices, link_srcs, link_dsts = [], [], []
+        for i, (src, dst) in enumerate(zip(np.asarray(srcs).tolist(), np.asarray(dsts).tolist())):
+            path = self(tuple(src), tuple(dst))
+            for u, v in zip(path[:-1], path[1:]):
+                flow_indices.append(i)
+                link_srcs.append(u)
+                link_dsts.append(v)
+        return np.array(flow_indices, dtype=np.int64), np.array(link_srcs, dtype=np.int64).reshape(-1, 2), np.array(link_dsts, dtype=np.int64).reshape(-1, 2)
\ No newline at end of file
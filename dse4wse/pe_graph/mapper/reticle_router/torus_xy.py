@@ -0,0 +1,77 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from .base import BaseReticleRouter
+from typing import List, Tuple
+import numpy as np
+
+Coordinate = Tuple[int, int]
+
+class TorusXYReticleRouter(BaseReticleRouter):
+    """ Dimension-ordered routing on a 2d-torus reticle array: x hops first, then y hops, like XYReticleRouter,
+    but each dimension goes the shorter way around its ring.
+    Flows going half way around a ring split between both directions by the parity of their source coordinate.
+    Rings only exist among reticles, hops that start or end on a 2d DRAM port on the border follow the mesh.
+    """
+
+    def __init__(self, reticle_array_height: int, reticle_array_width: int, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.reticle_array_height = reticle_array_height
+        self.reticle_array_width = reticle_array_width
+
+    def __call__(self, src: Coordinate, dst: Coordinate) -> List[Coordinate]:
+        _, link_srcs, link_dsts = self.get_link_batch(np.array([src]), np.array([dst]))
+        return [tuple(src)] + [tuple(v) for v in link_dsts.tolist()]
+
+    @staticmethod
+    def __get_ring_steps(a1: np.ndarray, a2: np.ndarray, size: int, on_ring: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Step (+1 / -1) and number of hops from a1 to a2 in one dimension, wrapping around where on_ring is set
+        """
+        delta = a2 - a1
+        forward, backward = np.mod(delta, size), np.mod(-delta, size)
+        # half way around the ring, even sources go forward and odd ones backward, which balances both directions
+        forward_first = (forward < backward) | ((forward == backward) & (np.mod(a1, 2) == 0))
+        ring_steps = np.where(forward_first, 1, -1)
+        wraps = on_ring & (size > 2) & (delta != 0) & (ring_steps != np.sign(delta))
+        steps = np.where(wraps, ring_steps, np.sign(delta))
+        num_hops = np.where(wraps, np.where(forward_first, forward, backward), np.abs(delta))
+        return steps, num_hops
+
+    def get_link_batch(self, srcs: np.ndarray, dsts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Vectorized routing, hops of a flow are in path order and wrap modulo the array size
+        """
+        H, W = self.reticle_array_height, self.reticle_array_width
+        srcs = np.asarray(srcs, dtype=np.int64).reshape(-1, 2)
+        dsts = np.asarray(dsts, dtype=np.int64).reshape(-1, 2)
+        x1, y1 = srcs[:, 0], srcs[:, 1]
+        x2, y2 = dsts[:, 0], dsts[:, 1]
+
+        # x hops run along column y1 and y hops along row x2, which are rings if all their ends are reticles
+        x_on_ring = (y1 >= 0) & (y1 < W) & (x1 >= 0) & (x1 < H) & (x2 >= 0) & (x2 < H)
+        y_on_ring = (x2 >= 0) & (x2 < H) & (y1 >= 0) & (y1 < W) & (y2 >= 0) & (y2 < W)
+        step_x, num_x_hops = self.__get_ring_steps(x1, x2, H, x_on_ring)
+        step_y, num_y_hops = self.__get_ring_steps(y1, y2, W, y_on_ring)
+        num_hops = num_x_hops + num_y_hops
+
+        flow_indices = np.repeat(np.arange(len(srcs)), num_hops)
+        hop_offsets = np.cumsum(num_hops) - num_hops
+        hop_indices = np.arange(flow_indices.shape[0]) - hop_offsets[flow_indices]
+        is_x_hop = hop_indices < num_x_hops[flow_indices]
+        y_hop_indices = hop_indices - num_x_hops[flow_indices]
+
+        x1, y1, x2 = x1[flow_indices], y1[flow_indices], x2[flow_indices]
+        step_x, step_y = step_x[flow_indices], step_y[flow_indices]
+        x_on_ring, y_on_ring = x_on_ring[flow_indices], y_on_ring[flow_indices]
+
+        def wrap(a: np.ndarray, size: int, on_ring: np.ndarray) -> np.ndarray:
+            return np.where(on_ring, np.mod(a, size), a)
+
+        link_src_x = np.where(is_x_hop, wrap(x1 + step_x * hop_indices, H, x_on_ring), x2)
+        link_dst_x = np.where(is_x_hop, wrap(x1 + step_x * (hop_indices + 1), H, x_on_ring), x2)
+        link_src_y = np.where(is_x_hop, y1, wrap(y1 + step_y * y_hop_indices, W, y_on_ring))
+        link_dst_y = np.where(is_x_hop, y1, wrap(y1 + step_y * (y_hop_indices + 1), W, y_on_ring))
+
+        link_srcs = np.stack([link_src_x, link_src_y], axis=-1)
+        link_dsts = np.stack([link_dst_x, link_dst_y], axis=-1)
+        return flow_indices, link_srcs, link_dsts
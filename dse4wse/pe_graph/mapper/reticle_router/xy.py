@@ -5,6 +5,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from .base import BaseReticleRouter
 from typing import List, Tuple
+import numpy as np
 from dse4wse.utils import logger
 
 Coordinate = Tuple[int, int]
@@ -25,3 +26,29 @@ class XYReticleRouter(BaseReticleRouter):
         path = x_path[:-1] + y_path
         return path
 
+    def get_link_batch(self, srcs: np.ndarray, dsts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Vectorized version of __call__: |dx| hops along x at the source y, then |dy| hops along y at the destination x
+        """
+        srcs = np.asarray(srcs, dtype=np.int64).reshape(-1, 2)
+        dsts = np.asarray(dsts, dtype=np.int64).reshape(-1, 2)
+        x1, y1 = srcs[:, 0], srcs[:, 1]
+        x2, y2 = dsts[:, 0], dsts[:, 1]
+        num_x_hops = np.abs(x2 - x1)
+        num_hops = num_x_hops + np.abs(y2 - y1)
+
+        flow_indices = np.repeat(np.arange(len(srcs)), num_hops)
+        hop_offsets = np.cumsum(num_hops) - num_hops
+        hop_indices = np.arange(flow_indices.shape[0]) - hop_offsets[flow_indices]
+        is_x_hop = hop_indices < num_x_hops[flow_indices]
+        y_hop_indices = hop_indices - num_x_hops[flow_indices]
+
+        x1, y1, x2, y2 = x1[flow_indices], y1[flow_indices], x2[flow_indices], y2[flow_indices]
+        step_x, step_y = np.sign(x2 - x1), np.sign(y2 - y1)
+        link_src_x = np.where(is_x_hop, x1 + step_x * hop_indices, x2)
+        link_dst_x = np.where(is_x_hop, x1 + step_x * (hop_indices + 1), x2)
+        link_src_y = np.where(is_x_hop, y1, y1 + step_y * y_hop_indices)
+        link_dst_y = np.where(is_x_hop, y1, y1 + step_y * (y_hop_indices + 1))
+
+        link_srcs = np.stack([link_src_x, link_src_y], axis=-1)
+        link_dsts = np.stack([link_dst_x, link_dst_y], axis=-1)
+        return flow_indices, link_srcs, link_dsts
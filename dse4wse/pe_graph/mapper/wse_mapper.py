@@ -5,6 +5,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.dirname((os.path.dirname(os.path.abspath(__file__)))))
 
 from typing import Tuple, List
+import numpy as np
 Coordinate = Tuple[int, int]
 Link = Tuple[Coordinate, Coordinate]
 Path = List[Coordinate]
@@ -13,9 +14,9 @@ LinkList = List[Link]
 from dse4wse.pe_graph.hardware import WaferScaleEngine
 from dse4wse.pe_graph.task import ListWaferTask
 
-from .reticle_mapper import BaseReticleMapper, XYReticleMapper, ZigZagReticleMapper
+from .reticle_mapper import BaseReticleMapper, XYReticleMapper, ZigZagReticleMapper, TableReticleMapper
 from .dram_port_mapper import BaseDramPortMapper, HashDramPortMapper, NearestDramPortMapper
-from .reticle_router import BaseReticleRouter, XYReticleRouter
+from .reticle_router import BaseReticleRouter, XYReticleRouter, TorusXYReticleRouter
 
 class WseMapper():
     """Leave the problem of instantiating children mappers to users
@@ -49,6 +50,12 @@ class WseMapper():
     def find_write_peer_routing_path(self, reticle_coordinate: Coordinate, peer_reticle_coordinate: Coordinate) -> LinkList:
         return self.__path_2_link_list(self._reticle_router(reticle_coordinate, peer_reticle_coordinate))
     
+    def find_batch_routing_links(self, src_coordinates: np.ndarray, dst_coordinates: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Route many flows at once, the direction of each flow is decided by the caller.
+        Returns flow index, link source and link destination coordinates of every hop.
+        """
+        return self._reticle_router.get_link_batch(src_coordinates, dst_coordinates)
+
     def __path_2_link_list(self, path: Path) -> LinkList:
         link_list = [(path[i], path[i+1]) for i in range(len(path) - 1)]
         for link in link_list:
@@ -71,10 +78,17 @@ def get_default_mapper(wse: WaferScaleEngine, task: ListWaferTask):
     }
     dram_port_mapper = NearestDramPortMapper(**dram_port_mapper_config)
 
-    reticle_router_config = {
+    if wse.reticle_topology_type == 'torus':
+        reticle_router_config = {
+            'reticle_array_height': wse.reticle_array_height,
+            'reticle_array_width': wse.reticle_array_width,
+        }
+        reticle_router = TorusXYReticleRouter(**reticle_router_config)
+    else:
+        reticle_router_config = {
 
-    }
-    reticle_router = XYReticleRouter(**reticle_router_config)
+        }
+        reticle_router = XYReticleRouter(**reticle_router_config)
 
     wse_mapper = WseMapper(
         reticle_mapper=reticle_mapper,
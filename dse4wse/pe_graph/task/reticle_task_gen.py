@@ -3,7 +3,7 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from typing import List, Any
-from reticle_task import BaseReticleTask, ComputeReticleTask, DramAccessReticleTask, FusedReticleTask
+from .reticle_task import BaseReticleTask, ComputeReticleTask, DramAccessReticleTask, FusedReticleTask
 from copy import deepcopy
 import networkx as nx
 from networkx import DiGraph
@@ -12,6 +12,7 @@ import pickle as pkl
 from typing import Tuple
 import multiprocessing as mp
 from tqdm import tqdm
+from dgl import DGLError
 import time
 
 # make sure dse4wse filefolder is in your PATH
@@ -23,6 +24,9 @@ from dse4wse.model.wse_attn import WseTransformerRunner
 from dse4wse.model.wse_attn import ReticleFidelityWseTransformerRunner
 from dse4wse.model.wse_attn import GnnReticleFidelityWseTransformerRunner
 from dse4wse.pe_graph.hardware import WaferScaleEngine
+from dse4wse.pe_graph.task import ListWaferTask
+from dse4wse.pe_graph.mapper import get_default_mapper
+from dse4wse.pe_graph.evaluator import LpReticleLevelWseEvaluator, GnnReticleLevelWseEvaluator, get_result_cache
 from dse4wse.utils import logger, TrainingConfig
 from dse4wse.gnn.model import NoCeptionNet
 from dse4wse.gnn.dataloader import NoCeptionDataset
@@ -54,7 +58,10 @@ def build_legal_points(benchmark_size):
     elif design_point_source == 'random':
         with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_gnn", "legal_points.pickle"), 'rb') as f:
             legal_points = pkl.load(f)
-        random.shuffle(legal_points, lambda : 0.73)  # different seed from building dataset
+        # same order as random.shuffle(legal_points, lambda : 0.73), whose random argument is gone since python 3.11
+        for i in reversed(range(1, len(legal_points))):  # different seed from building dataset
+            j = int(0.73 * (i + 1))
+            legal_points[i], legal_points[j] = legal_points[j], legal_points[i]
     else:
         raise NotImplementedError
 
@@ -143,6 +150,8 @@ def test_fidelity_accuracy(fidelity, legal_points):
     
     tqdm_bar = tqdm(legal_points)
     timer = Timer()
+    # baseline runs of earlier calls would otherwise serve the timed runs from the process-wide cache
+    get_result_cache().clear(reset_stats=False)
     with timer:
         for design_point, model_parameters in tqdm_bar:
             result = worker(design_point, model_parameters, fidelity=fidelity)
@@ -184,6 +193,78 @@ def get_simulation_elapsed_time(legal_points):
 
     return average_elapsed_time
 
+def get_evaluator_elapsed_time(legal_points, gnn_model, inference=False):
+    """ average wall time of a single reticle-level evaluation, LP solver vs GNN, on the same task lists
+    """
+    lp_elapsed_time = []
+    gnn_elapsed_time = []
+
+    for handler in logger.handlers:
+        handler.setLevel('WARNING')
+
+    tqdm_bar = tqdm(legal_points)
+    for design_point, model_parameters in tqdm_bar:
+        wafer_scale_engine = create_wafer_scale_engine(**design_point)
+        transformer_runner = create_evaluator(True, wafer_scale_engine, **model_parameters)
+        try:
+            transformer_runner._find_best_intra_model_chunk_exec_params(inference=inference)
+            task = ListWaferTask(sum(transformer_runner._get_task_lists(inference=inference).values(), []))
+        except:
+            logger.warning("Failure in building reticle tasks")
+            continue
+        mapper = get_default_mapper(wafer_scale_engine, task)
+
+        # both runs start from an empty process-wide cache, so the GNN doesn't reuse the routed loads of the LP run
+        get_result_cache().clear(reset_stats=False)
+        start_time = time.time()
+        LpReticleLevelWseEvaluator(wafer_scale_engine, task, mapper).get_total_latency()
+        lp_time = time.time() - start_time
+
+        get_result_cache().clear(reset_stats=False)
+        start_time = time.time()
+        try:
+            GnnReticleLevelWseEvaluator(wafer_scale_engine, task, mapper, gnn_model).get_total_latency()
+        except (RuntimeError, DGLError):
+            # e.g. no hottest link found, or a graph the model can't take
+            logger.warning("Failure in GNN inference")
+            continue
+        gnn_time = time.time() - start_time
+
+        # only points where both runs succeed, so that both averages cover the same points
+        lp_elapsed_time.append(lp_time)
+        gnn_elapsed_time.append(gnn_time)
+
+    for handler in logger.handlers:
+        handler.setLevel('DEBUG')
+
+    report = {
+        'lp_average_time': np.mean(lp_elapsed_time).item(),
+        'gnn_average_time': np.mean(gnn_elapsed_time).item(),
+        'num_points': len(lp_elapsed_time),
+    }
+    logger.info(report)
+    return report
+
+def benchmark_gnn_vs_lp(max_num_points=20):
+    """ Compare wall time per evaluation of the GNN against the LP solver.
+    If the pretrained checkpoint is missing, an untrained model is used, which is fine for timing.
+    """
+    EVALUATION_REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'evaluation')
+    if not os.path.exists(EVALUATION_REPORT_DIR):
+        os.mkdir(EVALUATION_REPORT_DIR)
+
+    checkpoint_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'test_gnn', 'checkpoint', "model_2023-04-29-00-29-43-272787.pth")
+    gnn_model = torch.load(checkpoint_path) if os.path.exists(checkpoint_path) else NoCeptionNet()
+    gnn_model.eval()
+
+    df = pd.DataFrame(columns=['benchmark_size', 'lp_average_time', 'gnn_average_time', 'num_points'])
+    for benchmark_size in range(15):
+        legal_points = build_legal_points(benchmark_size=benchmark_size)[:max_num_points]
+        report = get_evaluator_elapsed_time(legal_points, gnn_model)
+        df.loc[len(df.index)] = {'benchmark_size': benchmark_size, **report}
+    logger.info(f"\n{df.to_string()}")
+    df.to_csv(os.path.join(EVALUATION_REPORT_DIR, f"gnn_vs_lp.csv"), index=True)
+
 def main():
     EVALUATION_REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'evaluation')
     if not os.path.exists(EVALUATION_REPORT_DIR):
@@ -213,4 +294,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        benchmark_gnn_vs_lp()
+    else:
+        main()
\ No newline at end of file
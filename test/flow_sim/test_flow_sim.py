@@ -0,0 +1,67 @@
+
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from dse4wse.pe_graph.evaluator import LpReticleLevelWseEvaluator, FlowLevelWseSimulator
+from dse4wse.pe_graph.task import ListWaferTask, ThreeStageReticleTaskGenerator
+from dse4wse.pe_graph.mapper import get_default_mapper
+from dse4wse.utils import logger
+
+from lp_reticle_eval.test_lp_reticle import instantiate_wafer, build_dse_design_points
+
+def check_timelines(task: ListWaferTask, result):
+    """ Iterations of a subtask never overlap, and never start before their predecessors
+    """
+    for reticle_task, timeline in zip(task, result['timelines']):
+        for name, subtask_timeline in timeline.items():
+            start, end = subtask_timeline['start'], subtask_timeline['end']
+            assert len(start) == reticle_task.repeated_times
+            assert np.all(end >= start)
+            assert np.all(start[1:] >= end[:-1] * (1 - 1e-9))
+            if reticle_task.task_type == 'fused':
+                for pred in reticle_task.task_graph.predecessors(name):
+                    assert np.all(start >= timeline[pred]['end'] * (1 - 1e-9))
+            assert end[-1] <= result['makespan'] * (1 + 1e-9)
+
+def test_fused_task_pipeline():
+    """ Compute dominates, so reads run ahead and the makespan is read + repeated_times * compute + write
+    """
+    hardware = instantiate_wafer(core_num_mac=1e12, tensor_parallel_size=1, inter_reticle_bandwidth=1e9, dram_bandwidth=1e9, dram_stacking_type='3d')
+    repeated_times = 6
+    task_generator = ThreeStageReticleTaskGenerator(compute_amount=10e12, read_data_amount=[1e9], write_data_amount=[2e9])
+    task = ListWaferTask([task_generator(repeated_times=repeated_times)])
+    mapper = get_default_mapper(hardware, task)
+
+    simulator = FlowLevelWseSimulator(hardware, task, mapper)
+    result = simulator.simulate()
+    assert np.isclose(result['makespan'], 1 + repeated_times * 10 + 2)
+    assert np.allclose(result['timelines'][0]['read_0']['end'], np.arange(1, repeated_times + 1))
+    assert np.allclose(result['timelines'][0]['compute']['start'], 1 + 10 * np.arange(repeated_times))
+    check_timelines(task, result)
+
+    # the LP evaluator ignores dependencies and overlaps everything
+    assert LpReticleLevelWseEvaluator(hardware, task, mapper).get_total_latency() < result['makespan']
+
+    # a new hardware or an explicit invalidation drops the cached result
+    simulator.hardware = instantiate_wafer(core_num_mac=2e12, tensor_parallel_size=1, inter_reticle_bandwidth=1e9, dram_bandwidth=1e9, dram_stacking_type='3d')
+    assert np.isclose(simulator.get_total_latency(), 1 + repeated_times * 5 + 2)
+    simulator.hardware.dram_bandwidth *= 2
+    simulator.invalidate_cache()
+    assert np.isclose(simulator.get_total_latency(), 0.5 + repeated_times * 5 + 1)
+
+def test_flow_sim_on_dse_design_points():
+    for hardware, task, mapper in build_dse_design_points(num_points=5):
+        result = FlowLevelWseSimulator(hardware, task, mapper).simulate()
+        check_timelines(task, result)
+        # no schedule beats the most loaded resource
+        lp_latency = LpReticleLevelWseEvaluator(hardware, task, mapper).get_total_latency()
+        assert result['makespan'] >= lp_latency * (1 - 1e-9)
+        logger.info(f"makespan = {result['makespan']}, LP latency = {lp_latency}")
+
+if __name__ == "__main__":
+    test_fused_task_pipeline()
+    test_flow_sim_on_dse_design_points()
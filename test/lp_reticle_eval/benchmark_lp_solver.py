@@ -0,0 +1,97 @@
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from dse4wse.pe_graph.evaluator import LpReticleLevelWseEvaluator
+from dse4wse.pe_graph.hardware import WaferScaleEngine
+from dse4wse.pe_graph.task import ListWaferTask, ComputeReticleTask, DramAccessReticleTask, PeerAccessReticleTask
+from dse4wse.pe_graph.mapper import get_default_mapper
+from dse4wse.utils import logger
+
+def instantiate_wafer(reticle_array_size: int, dram_stacking_type: str = '2d', **kwargs):
+    core_config = {
+        'core_compute_power': 32e9,
+        'core_sram_size': 48e3,
+    }
+    reticle_config = {
+        'core_array_height': 32,
+        'core_array_width': 32,
+        'inter_core_bandwidth': 32e9 / 8,
+        'core_config': core_config,
+    }
+    wse_config = {
+        'reticle_array_height': reticle_array_size,
+        'reticle_array_width': reticle_array_size,
+        'inter_reticle_bandwidth': 32e9 * reticle_array_size / 8,
+        'dram_size': np.inf,
+        'dram_bandwidth': 900e9,
+        'dram_stacking_type': dram_stacking_type,
+        'reticle_config': reticle_config,
+        **kwargs,
+    }
+    return WaferScaleEngine(**wse_config)
+
+def instantiate_task(reticle_array_size: int, tensor_parallel_size: int = 4):
+    """ Every reticle computes, swaps weight with DRAM and joins a ring allreduce,
+    which resembles the task list of ReticleFidelityWseTransformerRunner.
+    """
+    num_reticle = reticle_array_size * reticle_array_size
+    task_list = []
+    for vrid in range(num_reticle):
+        group_base = vrid - vrid % tensor_parallel_size
+        peer_vrid = group_base + (vrid + 1 - group_base) % tensor_parallel_size
+        task_list.append(ComputeReticleTask(vrid, 1e12, repeated_times=8))
+        task_list.append(DramAccessReticleTask(vrid, vrid, 'read', 1e8, repeated_times=8))
+        task_list.append(DramAccessReticleTask(vrid, vrid, 'write', 1e8, repeated_times=8))
+        if peer_vrid < num_reticle:
+            task_list.append(PeerAccessReticleTask(vrid, peer_vrid, 'read', 1e8, repeated_times=8))
+    return ListWaferTask(task_list)
+
+def benchmark_lp_solver(reticle_array_size: int, solver: str = 'linprog'):
+    hardware = instantiate_wafer(reticle_array_size)
+    task = instantiate_task(reticle_array_size)
+    mapper = get_default_mapper(hardware, task)
+    # the analytical run would otherwise hand its routed loads to the linprog run through the process-wide cache
+    evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, solver=solver, use_result_cache=False)
+
+    tracemalloc.start()
+    start_time = time.time()
+    total_latency = evaluator.get_total_latency()
+    elapsed_time = time.time() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # size of the constraint matrix if every resource still had a dense row
+    graph = hardware._reticle_graph
+    num_variables = len(evaluator.vrid_2_var) + 1
+    num_dense_rows = len(evaluator.vrid_2_var) + 2 * graph.number_of_nodes() + graph.number_of_edges()
+    dense_matrix_size = num_dense_rows * num_variables * np.dtype('float64').itemsize
+
+    report = {
+        'reticle_array_size': reticle_array_size,
+        'solver': solver,
+        'total_latency': total_latency,
+        'elapsed_time': elapsed_time,
+        'peak_memory_MB': peak_memory / 1e6,
+        'dense_matrix_MB': dense_matrix_size / 1e6,
+    }
+    logger.info(report)
+    return report
+
+def main():
+    df = pd.DataFrame(columns=['reticle_array_size', 'solver', 'total_latency', 'elapsed_time', 'peak_memory_MB', 'dense_matrix_MB'])
+    for reticle_array_size in [8, 16, 24, 32, 40]:
+        for solver in ['analytical', 'linprog']:
+            df.loc[len(df.index)] = benchmark_lp_solver(reticle_array_size, solver=solver)
+    logger.info(f"\n{df.to_string()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from dse4wse.pe_graph.evaluator import LpReticleLevelWseEvaluator, StreamingLpReticleLevelWseEvaluator
+from dse4wse.pe_graph.task import ListWaferTask, ComputeReticleTask, DramAccessReticleTask, PeerAccessReticleTask
+from dse4wse.pe_graph.mapper import get_default_mapper
+from dse4wse.utils import logger
+
+from benchmark_lp_solver import instantiate_wafer
+
+def iterate_task(reticle_array_size: int, tensor_parallel_size: int = 4):
+    """ Same tasks as benchmark_lp_solver.instantiate_task, generated lazily
+    """
+    num_reticle = reticle_array_size * reticle_array_size
+    for vrid in range(num_reticle):
+        group_base = vrid - vrid % tensor_parallel_size
+        peer_vrid = group_base + (vrid + 1 - group_base) % tensor_parallel_size
+        yield ComputeReticleTask(vrid, 1e12, repeated_times=8)
+        yield DramAccessReticleTask(vrid, vrid, 'read', 1e8, repeated_times=8)
+        yield DramAccessReticleTask(vrid, vrid, 'write', 1e8, repeated_times=8)
+        if peer_vrid < num_reticle:
+            yield PeerAccessReticleTask(vrid, peer_vrid, 'read', 1e8, repeated_times=8)
+
+def measure_peak_memory(func):
+    tracemalloc.start()
+    start_time = time.time()
+    result = func()
+    elapsed_time = time.time() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed_time, peak_memory
+
+def benchmark_streaming_evaluator(reticle_array_size: int, chunk_size: int = 4096, compare: bool = True):
+    """ Peak memory of one evaluation on a 3d-stacked wafer, the hardware and mapper are built beforehand
+    """
+    hardware = instantiate_wafer(reticle_array_size, dram_stacking_type='3d')
+    mapper = get_default_mapper(hardware, iterate_task(reticle_array_size))
+    graph = hardware._reticle_graph
+    num_resources = 2 * graph.number_of_nodes() + graph.number_of_edges()
+    num_vrids = reticle_array_size * reticle_array_size
+
+    streaming_latency, streaming_time, streaming_peak = measure_peak_memory(
+        lambda: StreamingLpReticleLevelWseEvaluator(hardware, iterate_task(reticle_array_size), mapper, chunk_size=chunk_size).get_total_latency())
+    report = {
+        'reticle_array_size': reticle_array_size,
+        'num_resources': num_resources,
+        'num_vrids': num_vrids,
+        'streaming_time': streaming_time,
+        'streaming_peak_MB': streaming_peak / 1e6,
+        'streaming_bytes_per_item': streaming_peak / (num_resources + num_vrids + chunk_size),
+    }
+
+    if compare:
+        # the task list has to be materialized for LpReticleLevelWseEvaluator, so it is counted as well
+        lp_latency, lp_time, lp_peak = measure_peak_memory(
+            lambda: LpReticleLevelWseEvaluator(hardware, ListWaferTask(list(iterate_task(reticle_array_size))), mapper, use_result_cache=False).get_total_latency())
+        assert np.isclose(streaming_latency, lp_latency), (streaming_latency, lp_latency)
+        report.update({'lp_time': lp_time, 'lp_peak_MB': lp_peak / 1e6})
+
+    logger.info(report)
+    return report
+
+def test_streaming_memory_bound(chunk_size=4096, max_bytes_per_item=1024):
+    """ Peak memory stays O(resources + vrids + chunk_size) as the wafer grows
+    """
+    for reticle_array_size in [16, 32, 48]:
+        report = benchmark_streaming_evaluator(reticle_array_size, chunk_size=chunk_size)
+        assert report['streaming_bytes_per_item'] < max_bytes_per_item, report
+        assert report['streaming_peak_MB'] < report['lp_peak_MB'], report
+
+def main():
+    df = pd.DataFrame(columns=['reticle_array_size', 'num_resources', 'num_vrids', 'streaming_time', 'streaming_peak_MB', 'streaming_bytes_per_item', 'lp_time', 'lp_peak_MB'])
+    for reticle_array_size in [16, 32, 48, 64, 96]:
+        df.loc[len(df.index)] = benchmark_streaming_evaluator(reticle_array_size)
+    logger.info(f"\n{df.to_string()}")
+
+if __name__ == "__main__":
+    main()
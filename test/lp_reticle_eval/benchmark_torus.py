@@ -0,0 +1,50 @@
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import pandas as pd
+
+from dse4wse.pe_graph.evaluator import LpReticleLevelWseEvaluator
+from dse4wse.pe_graph.task import ListWaferTask, PeerAccessReticleTask
+from dse4wse.pe_graph.mapper import get_default_mapper
+from dse4wse.utils import logger
+
+from benchmark_lp_solver import instantiate_wafer
+
+def instantiate_all_to_all_task(reticle_array_size: int, data_amount: float = 1e6):
+    """ Every reticle reads the same amount from every other reticle
+    """
+    num_reticle = reticle_array_size * reticle_array_size
+    return ListWaferTask([PeerAccessReticleTask(vrid, peer_vrid, 'read', data_amount, repeated_times=1)
+                          for vrid in range(num_reticle) for peer_vrid in range(num_reticle) if peer_vrid != vrid])
+
+def get_bisection_bound(hardware, reticle_array_size: int, data_amount: float = 1e6):
+    """ Latency if the bisection bandwidth the analytical model assumes were saturated:
+    each half of the reticles sends its data to the other half, in both directions at once
+    """
+    num_reticle = reticle_array_size * reticle_array_size
+    crossing_amount = 2 * (num_reticle // 2) * (num_reticle - num_reticle // 2) * data_amount
+    return crossing_amount / hardware.get_bisection_bandwidth()
+
+def benchmark_torus(reticle_array_size: int, wraparound_bandwidth_ratio: float = 1.0):
+    """ All-to-all latency on a mesh and on a torus with the same links, against the bisection bound
+    """
+    task = instantiate_all_to_all_task(reticle_array_size)
+    report = {'reticle_array_size': reticle_array_size, 'wraparound_bandwidth_ratio': wraparound_bandwidth_ratio}
+    for reticle_topology_type in ['mesh', 'torus']:
+        hardware = instantiate_wafer(reticle_array_size, dram_stacking_type='3d', reticle_topology_type=reticle_topology_type,
+                                     wraparound_bandwidth_ratio=wraparound_bandwidth_ratio)
+        mapper = get_default_mapper(hardware, task)
+        report[f'{reticle_topology_type}_latency'] = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False).get_total_latency()
+    report['bisection_bound'] = get_bisection_bound(hardware, reticle_array_size)
+    report['torus_speedup'] = report['mesh_latency'] / report['torus_latency']
+    report['torus_to_bound'] = report['torus_latency'] / report['bisection_bound']
+    return report
+
+if __name__ == "__main__":
+    reports = [benchmark_torus(reticle_array_size) for reticle_array_size in [4, 6, 8, 12]]
+    reports += [benchmark_torus(8, wraparound_bandwidth_ratio) for wraparound_bandwidth_ratio in [0.75, 0.5, 0.25]]
+    logger.info("\n" + pd.DataFrame(reports).to_string())
@@ -1,22 +1,38 @@
 
 import os
 import sys
+import copy
+import random
+import tempfile
+import itertools
+import pickle as pkl
+import numpy as np
+import networkx as nx
+from scipy.sparse import vstack, csr_matrix
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from dse4wse.op_graph.op import BaseOperator, MatMulOperator
 
-from dse4wse.pe_graph.evaluator import LpReticleLevelWseEvaluator
-from dse4wse.pe_graph.hardware import WaferScaleEngine
-from dse4wse.pe_graph.task import ListWaferTask, ThreeStageReticleTaskGenerator
-from dse4wse.pe_graph.mapper import get_default_mapper
+from dse4wse.pe_graph.evaluator import LpReticleLevelWseEvaluator, IncrementalLpReticleLevelWseEvaluator, MaxMinFairWseEvaluator
+from dse4wse.pe_graph.evaluator import EvaluatorResultCache, get_result_cache, set_result_cache, LinprogBackend
+from dse4wse.pe_graph.evaluator import StreamingLpReticleLevelWseEvaluator, FlowLevelWseSimulator
+from dse4wse.pe_graph.evaluator.result_cache import get_topology_key
+from dse4wse.pe_graph.evaluator.symmetry import get_unique_rows
+from dse4wse.pe_graph.hardware import WaferScaleEngine, ReticleTopology, get_reticle_topology, CoreMesh
+from dse4wse.pe_graph.task import ListWaferTask, ThreeStageReticleTaskGenerator, ComputeReticleTask, PeerAccessReticleTask
+from dse4wse.pe_graph.mapper import WseMapper, get_default_mapper
+from dse4wse.pe_graph.mapper.reticle_mapper import TableReticleMapper
+from dse4wse.pe_graph.mapper.reticle_router import TorusXYReticleRouter
 
 from dse4wse.utils import TensorInfo, logger
 
+from dse.api import create_wafer_scale_engine, create_evaluator
+
 def instantiate_wafer(**kwargs):
     core_config = {
-        'core_num_mac': kwargs.get('core_num_mac'),
+        'core_compute_power': kwargs.get('core_num_mac'),
     }
     reticle_config = {
         'core_array_height': 1,
@@ -28,6 +44,7 @@ def instantiate_wafer(**kwargs):
         'reticle_array_height': kwargs.get('tensor_parallel_size'),
         'reticle_array_width': 1,
         'inter_reticle_bandwidth': kwargs.get('inter_reticle_bandwidth'),
+        'dram_size': np.inf,
         'dram_bandwidth': kwargs.get('dram_bandwidth'),
         'dram_stacking_type': kwargs.get('dram_stacking_type'),
         'reticle_config': reticle_config,
@@ -43,7 +60,7 @@ def create_task_generator_from_operator(op: BaseOperator):
         'compute_amount': compute_amount,
         'read_data_amount': read_data_amount,
         'write_data_amount': write_data_amount,
-        'new_dram_port': True,
+        'reuse_dram_port': False,
     }
     return ThreeStageReticleTaskGenerator(**kwargs)
 
@@ -112,5 +129,952 @@ TESTCASE = {
     'tensor_parallel_size': 8,
 }
 
+DSE_LEGAL_POINTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_gnn", "legal_points.pickle")
+
+def build_dse_design_points(num_points=20):
+    """ Sample (hardware, task, mapper) of the design points used by test/dse
+    """
+    with open(DSE_LEGAL_POINTS, 'rb') as f:
+        legal_points = pkl.load(f)
+    legal_points = random.Random(42).sample(legal_points, num_points)
+
+    for design_point, model_parameters in legal_points:
+        for inference in [False, True]:
+            hardware = create_wafer_scale_engine(**design_point)
+            transformer_runner = create_evaluator(True, hardware, **model_parameters)
+            transformer_runner._find_best_intra_model_chunk_exec_params(inference=inference)
+            task_lists = transformer_runner._get_task_lists(inference=inference)
+            task = ListWaferTask(sum(task_lists.values(), []))
+            mapper = get_default_mapper(hardware, task)
+            yield hardware, task, mapper
+
+def check_solver_equivalence(hardware, task, mapper):
+    analytical_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, solver='analytical')
+    linprog_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, solver='linprog')
+    analytical_latency = analytical_evaluator.get_total_latency()
+    linprog_latency = linprog_evaluator.get_total_latency()
+    assert np.isclose(analytical_latency, linprog_latency, rtol=1e-6), (analytical_latency, linprog_latency)
+
+    bottleneck = analytical_evaluator.get_bottleneck()
+    repeated_times = max([reticle_task.repeated_times for reticle_task in task])
+    assert np.isclose(repeated_times / bottleneck['frequency'], analytical_latency)
+
+def test_solver_equivalence():
+    hardware = instantiate_wafer(**TESTCASE)
+    task = instantiate_task(**TESTCASE)
+    mapper = get_default_mapper(hardware, task)
+    check_solver_equivalence(hardware, task, mapper)
+
+def test_solver_equivalence_on_dse_design_points():
+    for hardware, task, mapper in build_dse_design_points():
+        check_solver_equivalence(hardware, task, mapper)
+
+def test_evaluator_cache():
+    hardware = instantiate_wafer(**TESTCASE)
+    task = instantiate_task(**TESTCASE)
+    mapper = get_default_mapper(hardware, task)
+    # per-evaluator cache only, the process-wide one is covered by test_result_cache
+    wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False)
+
+    total_latency = wse_evaluator.get_total_latency()
+    wse_evaluator.profile_utilization()
+    wse_evaluator.get_module_payload()
+    assert wse_evaluator.get_total_latency() == total_latency
+    assert wse_evaluator.cache_info['annotated_load']['misses'] == 1
+    assert wse_evaluator.cache_info['min_freq']['misses'] == 1
+    assert wse_evaluator.cache_info['min_freq']['hits'] == 2
+
+    # hardware parameters only invalidate the solved frequency
+    hardware.inter_reticle_bandwidth /= 1e3
+    assert wse_evaluator.get_total_latency() > total_latency
+    assert wse_evaluator.cache_info['annotated_load']['misses'] == 1
+    assert wse_evaluator.cache_info['min_freq']['misses'] == 2
+    hardware.inter_reticle_bandwidth *= 1e3
+
+    # a new task list invalidates everything
+    wse_evaluator.task = instantiate_task(**TESTCASE)
+    assert np.isclose(wse_evaluator.get_total_latency(), total_latency)
+    assert wse_evaluator.cache_info['annotated_load']['misses'] == 2
+
+    # repeated times are applied after the LP, in-place edits of amounts need invalidate_cache()
+    for reticle_task in wse_evaluator.task:
+        reticle_task.repeated_times *= 2
+    assert np.isclose(wse_evaluator.get_total_latency(), 2 * total_latency)
+    assert wse_evaluator.cache_info['annotated_load']['misses'] == 2
+    for reticle_task in wse_evaluator.task:
+        for subtask in reticle_task.get_subtask_list():
+            if isinstance(subtask, ComputeReticleTask):
+                subtask.compute_amount *= 1e6
+    wse_evaluator.invalidate_cache()
+    assert wse_evaluator.get_total_latency() > 2 * total_latency
+    assert wse_evaluator.cache_info['annotated_load']['misses'] == 3
+
+def test_in_place_edits():
+    # after invalidate_cache(), edits that keep the length of the task list or go through a shared mapper
+    # are picked up, also by the process-wide cache, which is keyed by content
+    from benchmark_lp_solver import instantiate_wafer as instantiate_square_wafer
+    hardware = instantiate_square_wafer(4, dram_stacking_type='3d')
+    # flows 1 -> 0 and 0 -> 2 run along the first column in opposite directions
+    reticle_tasks = [PeerAccessReticleTask(0, 1, 'read', 1e8, repeated_times=1), PeerAccessReticleTask(2, 0, 'read', 1e8, repeated_times=1)]
+    task = ListWaferTask(reticle_tasks)
+    mapper = WseMapper(TableReticleMapper({0: (0, 0), 1: (1, 0), 2: (2, 0), 3: (1, 1)}), None, get_default_mapper(hardware, task)._reticle_router)
+    evaluators = [
+        LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False),
+        LpReticleLevelWseEvaluator(hardware, task, mapper),
+        LpReticleLevelWseEvaluator(hardware, task, mapper, solver='linprog', use_result_cache=False),
+        MaxMinFairWseEvaluator(hardware, task, mapper),
+    ]
+
+    def edit_and_check(edit):
+        previous_latency = evaluators[0].get_total_latency()
+        edit()
+        for wse_evaluator in evaluators:
+            wse_evaluator.invalidate_cache()
+        reference_task, reference_mapper = copy.deepcopy(task), copy.deepcopy(mapper)
+        latency = LpReticleLevelWseEvaluator(hardware, reference_task, reference_mapper, use_result_cache=False).get_total_latency()
+        assert not np.isclose(latency, previous_latency)
+        for wse_evaluator in evaluators:
+            assert np.isclose(wse_evaluator.get_total_latency(), latency, rtol=1e-6), type(wse_evaluator)
+        assert evaluators[-1].get_rates() == MaxMinFairWseEvaluator(hardware, reference_task, reference_mapper).get_rates()
+
+    def set_attr(obj, name, value):
+        return lambda: setattr(obj, name, value)
+
+    # amount, access type and peer, then the mapping table of the shared mapper
+    edit_and_check(set_attr(reticle_tasks[1], 'data_amount', 3e8))
+    edit_and_check(set_attr(reticle_tasks[1], 'access_type', 'write'))  # shares link (1, 0) -> (0, 0)
+    edit_and_check(set_attr(reticle_tasks[1], 'peer_virtual_reticle_id', 3))
+    edit_and_check(lambda: mapper._reticle_mapper.mapping_table.update({3: (0, 0)}))
+
+    # hits of the per-evaluator cache never hash the task
+    def get_structure_digest(*args):
+        assert False, "hashed on a hit"
+    lp_solver_module = sys.modules[LpReticleLevelWseEvaluator.__module__]
+    original_get_structure_digest = lp_solver_module.get_structure_digest
+    lp_solver_module.get_structure_digest = get_structure_digest
+    try:
+        for wse_evaluator in evaluators:
+            wse_evaluator.get_total_latency()
+            wse_evaluator.get_annotated_load()
+        evaluators[-1].get_rates()
+    finally:
+        lp_solver_module.get_structure_digest = original_get_structure_digest
+
+def test_batch_evaluation():
+    problems = list(build_dse_design_points())
+    for solver in ['analytical', 'linprog']:
+        batch_latencies = LpReticleLevelWseEvaluator.get_batch_total_latency(problems, solver=solver)
+        assert len(batch_latencies) == len(problems)
+        for (hardware, task, mapper), batch_latency in zip(problems, batch_latencies):
+            latency = LpReticleLevelWseEvaluator(hardware, task, mapper, solver=solver).get_total_latency()
+            assert np.isclose(batch_latency, latency, rtol=1e-6), (solver, batch_latency, latency)
+
+def test_incremental_evaluator(num_moves=20):
+    rng = random.Random(0)
+    for hardware, task, mapper in build_dse_design_points(num_points=5):
+        incremental_evaluator = IncrementalLpReticleLevelWseEvaluator(hardware, task, mapper)
+        assert np.isclose(incremental_evaluator.get_total_latency(), LpReticleLevelWseEvaluator(hardware, task, mapper).get_total_latency())
+
+        task_list = list(task)
+        vrids = task.get_all_virtual_reticle_ids()
+        reticle_coordinates = [node for node, ndata in hardware._reticle_graph.nodes(data=True) if ndata['reticle']]
+        for _ in range(num_moves):
+            # swap two virtual reticles, or move one onto any reticle
+            vrid_0, vrid_1 = rng.sample(vrids, 2) if len(vrids) > 1 else (vrids[0], vrids[0])
+            coordinate_0 = incremental_evaluator.find_physical_reticle_coordinate(vrid_0)
+            coordinate_1 = incremental_evaluator.find_physical_reticle_coordinate(vrid_1)
+            incremental_evaluator.move_virtual_reticle(vrid_0, coordinate_1)
+            incremental_evaluator.move_virtual_reticle(vrid_1, coordinate_0)
+            incremental_evaluator.move_virtual_reticle(rng.choice(vrids), rng.choice(reticle_coordinates))
+
+            compute_indices = [i for i, t in enumerate(task_list) if isinstance(t, ComputeReticleTask)]
+            if compute_indices:
+                task_index = rng.choice(compute_indices)
+                old_task = task_list[task_index]
+                task_list[task_index] = ComputeReticleTask(old_task.virtual_reticle_id, old_task.compute_amount * rng.uniform(0.5, 2), repeated_times=old_task.repeated_times)
+                incremental_evaluator.update_task(task_index, task_list[task_index])
+
+            reference_evaluator = LpReticleLevelWseEvaluator(hardware, ListWaferTask(task_list), incremental_evaluator.get_mapper())
+            assert np.isclose(incremental_evaluator.get_total_latency(), reference_evaluator.get_total_latency())
+            reference_bottleneck = reference_evaluator.get_bottleneck()
+            assert np.isclose(incremental_evaluator.get_bottleneck()['frequency'], reference_bottleneck['frequency'])
+
+    # empty task lists, and tasks updated down to nothing, take no time, like in the streaming evaluator
+    hardware, task, mapper = next(build_dse_design_points(num_points=1))
+    assert IncrementalLpReticleLevelWseEvaluator(hardware, ListWaferTask([]), mapper).get_total_latency() == 0
+    assert StreamingLpReticleLevelWseEvaluator(hardware, ListWaferTask([]), mapper).get_total_latency() == 0
+    vrid = task.get_all_virtual_reticle_ids()[0]
+    incremental_evaluator = IncrementalLpReticleLevelWseEvaluator(hardware, ListWaferTask([ComputeReticleTask(vrid, 1e12, repeated_times=2)]), mapper)
+    assert incremental_evaluator.get_total_latency() > 0
+    incremental_evaluator.update_task(0, ComputeReticleTask(vrid, 0, repeated_times=2))
+    assert incremental_evaluator.get_total_latency() == 0
+    assert incremental_evaluator.get_bottleneck()['frequency'] == np.inf
+
+def check_sensitivity_report(hardware, task, mapper, rel_step=1e-6):
+    """ Compare latency gradients from LP duals against finite differences
+    """
+    def scale_parameter(parameter, factor):
+        if parameter == 'reticle_compute_power':
+            hardware.reticle_config['core_config']['core_compute_power'] *= factor
+        else:
+            setattr(hardware, parameter, getattr(hardware, parameter) * factor)
+
+    wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper)
+    report = wse_evaluator.sensitivity_report()
+    total_latency = wse_evaluator.get_total_latency()
+    assert np.isclose(report['total_latency'], total_latency, rtol=1e-6)
+
+    for parameter, latency_gradient in report['latency_gradient'].items():
+        capacity = getattr(hardware, parameter)
+        scale_parameter(parameter, 1 + rel_step)
+        perturbed_latency = wse_evaluator.get_total_latency()
+        scale_parameter(parameter, 1 / (1 + rel_step))
+        finite_difference = (perturbed_latency - total_latency) / (capacity * rel_step)
+        assert np.isclose(latency_gradient, finite_difference, rtol=1e-3, atol=1e-6 * total_latency / capacity), (parameter, latency_gradient, finite_difference)
+
+def test_sensitivity_report():
+    hardware = instantiate_wafer(**TESTCASE)
+    task = instantiate_task(**TESTCASE)
+    mapper = get_default_mapper(hardware, task)
+    check_sensitivity_report(hardware, task, mapper)
+    for hardware, task, mapper in build_dse_design_points(num_points=5):
+        check_sensitivity_report(hardware, task, mapper)
+
+    # nothing loaded: no linprog solve, which would be unbounded
+    task = ListWaferTask([ComputeReticleTask(0, 0, repeated_times=1)])
+    linprog_backend = LinprogBackend()
+    wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, get_default_mapper(hardware, task), linprog_backend=linprog_backend)
+    report = wse_evaluator.sensitivity_report()
+    assert report['frequency'] == np.inf and report['total_latency'] == 0 == wse_evaluator.get_total_latency()
+    assert all(not prices for prices in report['shadow_prices'].values())
+    assert set(report['latency_gradient']) == {'reticle_compute_power', 'dram_bandwidth', 'inter_reticle_bandwidth'}
+    assert all(gradient == 0 for gradient in report['latency_gradient'].values())
+    assert linprog_backend.get_profile()['num_solves'] == 0
+
+def test_hardware_parameter_sweep():
+    hardware = instantiate_wafer(**TESTCASE)
+    task = instantiate_task(**TESTCASE)
+    mapper = get_default_mapper(hardware, task)
+    wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper)
+
+    rng = np.random.default_rng(0)
+    core_compute_power = TESTCASE['core_num_mac'] * rng.uniform(0.1, 10, size=(20, 1, 1))
+    inter_reticle_bandwidth = TESTCASE['inter_reticle_bandwidth'] * rng.uniform(0.1, 10, size=(1, 20, 1))
+    dram_bandwidth = TESTCASE['dram_bandwidth'] * rng.uniform(0.1, 10, size=(1, 1, 20))
+    reticle_compute_power = core_compute_power * hardware.reticle_compute_power / TESTCASE['core_num_mac']
+    latencies = wse_evaluator.sweep_hardware_parameters(reticle_compute_power, inter_reticle_bandwidth, dram_bandwidth)
+    assert latencies.shape == (20, 20, 20)
+
+    for index in [(0, 0, 0), (3, 7, 11), (19, 5, 2)]:
+        i, j, k = index
+        hardware.reticle_config['core_config']['core_compute_power'] = core_compute_power[i, 0, 0]
+        hardware.inter_reticle_bandwidth = inter_reticle_bandwidth[0, j, 0]
+        hardware.dram_bandwidth = dram_bandwidth[0, 0, k]
+        for solver in ['analytical', 'linprog']:
+            latency = LpReticleLevelWseEvaluator(hardware, task, mapper, solver=solver).get_total_latency()
+            assert np.isclose(latencies[index], latency, rtol=1e-6), (index, solver, latencies[index], latency)
+
+def test_component_decomposition():
+    for hardware, task, mapper in build_dse_design_points(num_points=5):
+        for solver in ['analytical', 'linprog']:
+            latency = LpReticleLevelWseEvaluator(hardware, task, mapper, solver=solver).get_total_latency()
+            for max_workers in [None, 4]:
+                wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, solver=solver, decompose=True, max_workers=max_workers)
+                assert np.isclose(wse_evaluator.get_total_latency(), latency, rtol=1e-6)
+
+            # components partition the loaded virtual reticles, and the slowest one sets the frequency
+            component_report = wse_evaluator.get_component_report()
+            component_vrids = sum([component['vrids'] for component in component_report], [])
+            assert len(component_vrids) == len(set(component_vrids))
+            assert set(component_vrids) <= set(task.get_all_virtual_reticle_ids())
+            slowest_component = min(component_report, key=lambda component: component['frequency'])
+            assert np.isclose(slowest_component['bottleneck']['frequency'], wse_evaluator.get_bottleneck()['frequency'], rtol=1e-6)
+
+def test_max_min_fair_evaluator():
+    for hardware, task, mapper in build_dse_design_points(num_points=5):
+        wse_evaluator = MaxMinFairWseEvaluator(hardware, task, mapper)
+        assert np.isclose(wse_evaluator.get_total_latency(), LpReticleLevelWseEvaluator(hardware, task, mapper).get_total_latency(), rtol=1e-6)
+
+        # feasible: no resource is over-subscribed
+        utilization = wse_evaluator.get_resource_utilization()
+        assert all([np.all(utils <= 1 + 1e-6) for utils in utilization.values()])
+
+        # max-min fair: every loaded virtual reticle uses a saturated resource on which no one runs faster
+        rates = wse_evaluator.get_rates()
+        load = wse_evaluator.get_annotated_load()
+        var_2_vrid = {var: vrid for vrid, var in wse_evaluator.vrid_2_var.items()}
+        resources = [(load.compute, utilization['compute']), (load.dram_access, utilization['dram']), (load.transmission, utilization['inter_reticle'])]
+        for vrid, rate in rates.items():
+            if np.isinf(rate):
+                continue
+            var = wse_evaluator.vrid_2_var[vrid]
+            has_bottleneck = False
+            for resource_load, utils in resources:
+                for resource_id in resource_load.resource_ids[resource_load.vars == var].tolist():
+                    user_rates = [rates[var_2_vrid[v]] for v in resource_load.get_mark(resource_id)]
+                    if utils[resource_id] > 1 - 1e-6 and rate >= max(user_rates) * (1 - 1e-6):
+                        has_bottleneck = True
+            assert has_bottleneck, vrid
+
+def test_result_cache():
+    original_cache = get_result_cache()
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            set_result_cache(EvaluatorResultCache(cache_dir=cache_dir))
+            # identical task lists built by separate runners share entries, other bandwidths share the routed loads
+            for _ in range(2):
+                for hardware, task, mapper in build_dse_design_points(num_points=5):
+                    reference_latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False).get_total_latency()
+                    assert LpReticleLevelWseEvaluator(hardware, task, mapper).get_total_latency() == reference_latency
+                    hardware.inter_reticle_bandwidth *= 2
+                    reference_latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False).get_total_latency()
+                    assert LpReticleLevelWseEvaluator(hardware, task, mapper).get_total_latency() == reference_latency
+            cache_info = get_result_cache().cache_info
+            assert cache_info['min_freq']['misses'] == 20 and cache_info['min_freq']['hits'] == 20
+            assert cache_info['annotated_load']['misses'] == 10 and cache_info['annotated_load']['hits'] == 10
+            logger.info(f"Result cache hit rates: {get_result_cache().get_hit_rates()}")
+
+            # solved frequencies survive in cache_dir
+            set_result_cache(EvaluatorResultCache(cache_dir=cache_dir))
+            for hardware, task, mapper in build_dse_design_points(num_points=5):
+                LpReticleLevelWseEvaluator(hardware, task, mapper).get_total_latency()
+            cache_info = get_result_cache().cache_info
+            assert cache_info['min_freq']['disk_hits'] == 10 and cache_info['min_freq']['misses'] == 0
+            assert cache_info['annotated_load']['misses'] == 0
+    finally:
+        set_result_cache(original_cache)
+
+def test_linprog_backend():
+    for preset, rtol in [('accurate', 1e-6), ('screening', 1e-4)]:
+        linprog_backend = LinprogBackend.from_preset(preset)
+        num_problems = 0
+        for hardware, task, mapper in build_dse_design_points(num_points=5):
+            analytical_latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False).get_total_latency()
+            linprog_latency = LpReticleLevelWseEvaluator(hardware, task, mapper, solver='linprog', use_result_cache=False, linprog_backend=linprog_backend).get_total_latency()
+            assert np.isclose(analytical_latency, linprog_latency, rtol=rtol), (preset, analytical_latency, linprog_latency)
+            num_problems += 1
+        assert len(linprog_backend.solve_stats) == num_problems == linprog_backend.get_profile()['num_solves']
+        assert all(stats['status'] == 0 and stats['elapsed_time'] > 0 for stats in linprog_backend.solve_stats)
+        logger.info(f"{preset} linprog profile: {linprog_backend.get_profile()}")
+
+    # solve_stats only keeps the latest solves, get_profile still counts all of them
+    for max_solve_stats in [0, 2]:
+        linprog_backend = LinprogBackend(max_solve_stats=max_solve_stats)
+        for hardware, task, mapper in build_dse_design_points(num_points=5):
+            LpReticleLevelWseEvaluator(hardware, task, mapper, solver='linprog', use_result_cache=False, linprog_backend=linprog_backend).get_total_latency()
+        assert len(linprog_backend.solve_stats) == max_solve_stats
+        profile = linprog_backend.get_profile()
+        assert profile['num_solves'] == num_problems and profile['nit'] > 0 and profile['elapsed_time'] > 0
+        linprog_backend.reset_stats()
+        assert len(linprog_backend.solve_stats) == 0 and linprog_backend.get_profile()['num_solves'] == 0
+
+    # failures are reported instead of returning a meaningless x
+    linprog_backend = LinprogBackend()
+    try:
+        linprog_backend.solve(np.array([-1.]), csr_matrix(np.array([[0.]])), np.array([1.]))
+    except RuntimeError:
+        pass
+    else:
+        assert False, "An unbounded LP should raise"
+
+    # loads that are all zero never reach linprog
+    hardware = instantiate_wafer(**TESTCASE)
+    task = ListWaferTask([ComputeReticleTask(0, 0, repeated_times=1)])
+    mapper = get_default_mapper(hardware, task)
+    linprog_backend = LinprogBackend()
+    wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, solver='linprog', use_result_cache=False, linprog_backend=linprog_backend)
+    assert wse_evaluator.get_total_latency() == 0
+    assert linprog_backend.get_profile()['num_solves'] == 0
+
+def build_extreme_design_points():
+    """ Tiny and huge reticles, starved and oversized links, small and huge hidden sizes
+    """
+    for core_num_mac, inter_reticle_bandwidth, dram_bandwidth, hidden_size, tensor_parallel_size, dram_stacking_type in itertools.product(
+        [1e6, 312e12, 1e18], [1e3, 600e9, 1e15], [1e3, 1.94e12], [64, 12288, 1 << 20], [1, 8, 32], ['2d', '3d']):
+        testcase = {
+            'core_num_mac': core_num_mac,
+            'inter_reticle_bandwidth': inter_reticle_bandwidth,
+            'dram_bandwidth': dram_bandwidth,
+            'dram_stacking_type': dram_stacking_type,
+            'micro_batch_size': 32,
+            'sequence_length': 2048,
+            'hidden_size': hidden_size,
+            'tensor_parallel_size': tensor_parallel_size,
+        }
+        hardware = instantiate_wafer(**testcase)
+        task = instantiate_task(**testcase)
+        yield hardware, task, get_default_mapper(hardware, task)
+
+def test_linprog_scaling_on_extreme_design_points():
+    linprog_backends = {'scaled': LinprogBackend(scaling=True), 'unscaled': LinprogBackend(scaling=False)}
+    for hardware, task, mapper in build_extreme_design_points():
+        analytical_latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False).get_total_latency()
+        for name, linprog_backend in linprog_backends.items():
+            linprog_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, solver='linprog', use_result_cache=False, linprog_backend=linprog_backend)
+            linprog_latency = linprog_evaluator.get_total_latency()
+            assert np.isclose(analytical_latency, linprog_latency, rtol=1e-6), (name, analytical_latency, linprog_latency)
+
+        # scaled coefficients stay within a few powers of two, and duals are mapped back
+        load = linprog_evaluator.get_annotated_load()
+        A_ub = vstack([
+            load.compute.to_csr(hardware.reticle_compute_power),
+            load.dram_access.to_csr(hardware.dram_bandwidth),
+            load.transmission.to_csr(hardware.inter_reticle_bandwidth),
+        ], format='csr')
+        row_scale, col_scale = LinprogBackend.get_scaling(A_ub)
+        scaled_values = np.abs(A_ub.multiply(row_scale[:, None]).multiply(col_scale[None, :]).data)
+        assert np.all((scaled_values >= 2 ** -4) & (scaled_values <= 2 ** 4))
+        # frequency is homogeneous of degree 1 in the capacities, so sum_C C * df / dC = f for any optimal duals
+        report = LpReticleLevelWseEvaluator(hardware, task, mapper, linprog_backend=linprog_backends['scaled']).sensitivity_report()
+        euler_sum = sum([getattr(hardware, parameter) * gradient for parameter, gradient in report['frequency_gradient'].items()])
+        assert np.isclose(euler_sum, report['frequency'], rtol=1e-6), (euler_sum, report['frequency'])
+
+    for name, linprog_backend in linprog_backends.items():
+        logger.info(f"{name} linprog profile on extreme design points: {linprog_backend.get_profile()}")
+
+def test_utilization_profile():
+    for hardware, task, mapper in build_dse_design_points(num_points=5):
+        wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper)
+        report = wse_evaluator.profile_utilization(per_module=True, per_task=True)
+        profile = wse_evaluator.get_utilization_profile()
+        H, W = hardware.reticle_array_height, hardware.reticle_array_width
+        assert profile.compute.shape == (H, W) and not np.any(np.isnan(profile.compute))
+        assert np.isclose(np.nanmax(profile.compute), report['compute'])
+        assert np.isclose(np.nanmax(profile.dram), report['dram'])
+        assert np.isclose(max([np.nanmax(utils) for utils in profile.inter_reticle.values()]), report['inter_reticle'])
+        assert np.isclose(max(report.values()), 1)  # the bottleneck is saturated
+        num_dram_ports = np.count_nonzero(~np.isnan(profile.dram))
+        assert num_dram_ports == (H * W if hardware.dram_stacking_type == '3d' else 2 * (H + W))
+        assert sum([np.count_nonzero(~np.isnan(utils)) for utils in profile.inter_reticle.values()]) == hardware._reticle_graph.number_of_edges()
+
+        # every resource's utilization is the sum of its users
+        load = wse_evaluator.get_annotated_load()
+        resource_utils = np.asarray(profile.task_utils.sum(axis=0)).reshape(-1)
+        num_nodes = len(load.nodes)
+        assert np.allclose(resource_utils[:num_nodes], load.compute.totals * profile.frequency / hardware.reticle_compute_power)
+        assert np.allclose(resource_utils[num_nodes: 2 * num_nodes], load.dram_access.totals * profile.frequency / hardware.dram_bandwidth)
+        assert np.allclose(resource_utils[2 * num_nodes:], load.transmission.totals * profile.frequency / hardware.inter_reticle_bandwidth)
+
+        with tempfile.TemporaryDirectory() as dump_dir:
+            path = os.path.join(dump_dir, 'utilization.npz')
+            profile.to_npz(path)
+            dumped = np.load(path)
+            assert np.array_equal(dumped['compute'], profile.compute)
+            assert np.array_equal(dumped['inter_reticle_+y'], profile.inter_reticle['+y'], equal_nan=True)
+            assert np.array_equal(dumped['task_utils_data'], profile.task_utils.data)
+
+def test_symmetry_reduction():
+    from benchmark_lp_solver import instantiate_wafer as instantiate_square_wafer, instantiate_task as instantiate_allreduce_task
+    hardware = instantiate_square_wafer(16)
+    task = instantiate_allreduce_task(16)
+    problems = [(hardware, task, get_default_mapper(hardware, task))] + list(build_dse_design_points(num_points=5))
+    for hardware, task, mapper in problems:
+        analytical_latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False).get_total_latency()
+        wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, solver='linprog', use_result_cache=False, symmetry=True)
+        assert np.isclose(wse_evaluator.get_total_latency(), analytical_latency, rtol=1e-6)
+
+        report = wse_evaluator.get_symmetry_report()
+        assert sorted(sum(report['classes'], [])) == task.get_all_virtual_reticle_ids()
+        assert report['num_reduced_vars'] == len(report['classes']) <= report['num_vars']
+        assert report['num_reduced_resource_rows'] <= report['num_resource_rows']
+        logger.info({k: v for k, v in report.items() if k != 'classes'})
+
+    # replicas of the synthetic task only differ near wafer edges and DRAM ports
+    report = LpReticleLevelWseEvaluator(*problems[0], symmetry=True).get_symmetry_report()
+    assert report['num_reduced_vars'] * 4 < report['num_vars']
+
+def get_unique_rows_by_loop(A):
+    row_2_unique, row_indices, unique_rows = {}, [], []
+    for i in range(A.shape[0]):
+        row = A.getrow(i)
+        key = (tuple(row.indices.tolist()), tuple(row.data.tolist()))
+        if key not in row_2_unique:
+            row_2_unique[key] = len(unique_rows)
+            unique_rows.append(i)
+        row_indices.append(row_2_unique[key])
+    return np.array(row_indices), np.array(unique_rows)
+
+def test_unique_rows():
+    symmetry_module = sys.modules[get_unique_rows.__module__]
+    rng = np.random.default_rng(0)
+    for num_rows, num_cols in [(0, 3), (1, 1), (50, 4), (400, 30)]:
+        # few distinct rows, some of them empty or differing in a single coefficient
+        distinct_rows = rng.integers(0, 3, size=(max(num_rows // 8, 1), num_cols)) * rng.choice([0.5, 1., 1e-9], size=(1, num_cols))
+        A = csr_matrix(distinct_rows[rng.integers(len(distinct_rows), size=num_rows)].reshape(num_rows, num_cols))
+        A.eliminate_zeros()
+        A.sort_indices()
+        reference = get_unique_rows_by_loop(A)
+        for batch, expected in zip(get_unique_rows(A), reference):
+            assert np.array_equal(batch, expected)
+
+        # rows sharing a hash are told apart entry by entry
+        original_hash_rows = symmetry_module._hash_rows
+        symmetry_module._hash_rows = lambda A: np.zeros(A.shape[0], dtype=np.uint64)
+        try:
+            for batch, expected in zip(get_unique_rows(A), reference):
+                assert np.array_equal(batch, expected)
+        finally:
+            symmetry_module._hash_rows = original_hash_rows
+
+def test_streaming_evaluator():
+    for hardware, task, mapper in build_dse_design_points(num_points=5):
+        wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False)
+        for chunk_size in [1, 7, 65536]:
+            # a generator is consumed only once
+            streaming_evaluator = StreamingLpReticleLevelWseEvaluator(hardware, (t for t in task), mapper, chunk_size=chunk_size)
+            assert np.isclose(streaming_evaluator.get_total_latency(), wse_evaluator.get_total_latency())
+            bottleneck = streaming_evaluator.get_bottleneck()
+            assert bottleneck['type'] == wse_evaluator.get_bottleneck()['type']
+            assert np.isclose(bottleneck['frequency'], wse_evaluator.get_bottleneck()['frequency'])
+
+def test_shared_topology():
+    get_reticle_topology.cache_clear()
+    hardware = instantiate_wafer(**TESTCASE)
+    other_hardware = instantiate_wafer(**{**TESTCASE, 'inter_reticle_bandwidth': 1e12, 'dram_bandwidth': 3e12})
+    assert other_hardware._reticle_graph is hardware._reticle_graph
+    assert get_reticle_topology.cache_info().hits == 1
+    assert instantiate_wafer(**{**TESTCASE, 'dram_stacking_type': '3d'})._reticle_graph is not hardware._reticle_graph
+
+    # the shared graph is frozen
+    graph = hardware._reticle_graph
+    H = TESTCASE['tensor_parallel_size']
+    assert graph.number_of_nodes() == (H + 2) * 3 - 4
+    try:
+        graph.add_edge((0, 0), (1, 1))
+        assert False, "shared reticle graph should be frozen"
+    except nx.NetworkXError:
+        pass
+
+    # reticles and DRAM ports are flyweights built on demand, with the parameters of their own engine
+    assert sum([ndata['reticle'] for _, ndata in graph.nodes(data=True)]) == H
+    assert sum([ndata['dram_port'] for _, ndata in graph.nodes(data=True)]) == 2 * (H + 1)
+    reticle = hardware.get_reticle_from_coordinate(2, 0)
+    assert hardware.get_reticle_from_coordinate(0, 0) is reticle
+    assert other_hardware.get_reticle_from_coordinate(2, 0) is not reticle
+    assert hardware.get_dram_port_from_coordinate(-1, 0) is hardware.get_dram_port_from_coordinate(H, 0)
+
+def test_engine_pickling():
+    from benchmark_lp_solver import instantiate_wafer as instantiate_square_wafer, instantiate_task as instantiate_allreduce_task
+    hardware = instantiate_square_wafer(16)
+    task = instantiate_allreduce_task(16)
+    latency = LpReticleLevelWseEvaluator(hardware, task, get_default_mapper(hardware, task), use_result_cache=False).get_total_latency()
+
+    # only hardware parameters are serialized, the topology is shared again after loading
+    data = pkl.dumps(hardware)
+    assert len(data) < 4096
+    for copied_hardware in [pkl.loads(data), copy.deepcopy(hardware)]:
+        assert copied_hardware._topology is hardware._topology
+        assert copied_hardware.inter_reticle_bandwidth == hardware.inter_reticle_bandwidth
+        copied_latency = LpReticleLevelWseEvaluator(copied_hardware, task, get_default_mapper(copied_hardware, task), use_result_cache=False).get_total_latency()
+        assert np.isclose(copied_latency, latency)
+
+def test_reticle_topology():
+    for (H, W), dram_stacking_type in itertools.product([(1, 1), (3, 5), (8, 1), (7, 7)], ['2d', '3d']):
+        # the former networkx reticle graph
+        reference_graph = nx.grid_2d_graph(range(-1, H + 1), range(-1, W + 1), create_using=nx.DiGraph)
+        reference_graph.remove_nodes_from([(-1, -1), (-1, W), (H, -1), (H, W)])
+
+        topology = ReticleTopology(H, W, dram_stacking_type)
+        assert topology.nodes == list(reference_graph.nodes())
+        assert topology.links == list(reference_graph.edges())
+        assert list(topology.graph.nodes()) == topology.nodes and list(topology.graph.edges()) == topology.links
+        assert topology.is_reticle.sum() == H * W
+        assert topology.is_dram_port.sum() == (2 * (H + W) if dram_stacking_type == '2d' else H * W)
+
+        node_ids = np.arange(topology.num_nodes)
+        assert np.array_equal(topology.get_node_ids(topology.get_coordinates(node_ids)), node_ids)
+        assert np.array_equal(topology.get_link_ids(topology.link_srcs, topology.link_dsts), np.arange(topology.num_links))
+        for u in node_ids.tolist():
+            node = topology.nodes[u]
+            assert [topology.links[l] for l in topology.get_out_links(u)] == list(reference_graph.out_edges(node))
+            assert sorted([topology.links[l] for l in topology.get_in_links(u)]) == sorted(reference_graph.in_edges(node))
+        try:
+            topology.get_node_ids([(H, W)])
+            assert False, "corners are not part of the topology"
+        except KeyError:
+            pass
+
+def get_core_mesh_link_loads_by_routing(core_mesh: CoreMesh, p: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """ XY-route every pair of cores one by one
+    """
+    link_2_id = {link: i for i, link in enumerate(core_mesh.get_links())}
+    link_loads = np.zeros(core_mesh.num_links)
+    cores = list(itertools.product(range(core_mesh.core_array_height), range(core_mesh.core_array_width)))
+    for (x, y), (dst_x, dst_y) in itertools.product(cores, cores):
+        amount = p[x, y] * q[dst_x, dst_y]
+        while x != dst_x:
+            link_loads[link_2_id[((x, y), (x + np.sign(dst_x - x), y))]] += amount
+            x += np.sign(dst_x - x)
+        while y != dst_y:
+            link_loads[link_2_id[((x, y), (x, y + np.sign(dst_y - y)))]] += amount
+            y += np.sign(dst_y - y)
+    return link_loads
+
+def test_intra_reticle_congestion():
+    # closed-form core mesh link loads
+    rng = np.random.default_rng(0)
+    for H, W in [(1, 1), (1, 4), (3, 1), (3, 5), (6, 4)]:
+        core_mesh = CoreMesh(H, W)
+        for _ in range(3):
+            p, q = rng.random((H, W)), rng.random((H, W))
+            assert np.allclose(core_mesh.get_link_loads(p / p.sum(), q / q.sum()), get_core_mesh_link_loads_by_routing(core_mesh, p / p.sum(), q / q.sum()))
+        pattern_amounts = rng.random((16, CoreMesh.NUM_PATTERNS)) * (rng.random((16, CoreMesh.NUM_PATTERNS)) < 0.3)
+        max_link_loads, hot_links = core_mesh.get_max_link_loads(pattern_amounts)
+        if core_mesh.num_links:
+            link_loads = pattern_amounts @ core_mesh.unit_loads
+            assert np.allclose(max_link_loads, link_loads.max(axis=1))
+            assert np.allclose(link_loads[np.arange(16), hot_links], max_link_loads)
+
+    # hop classification, against routing flows one by one
+    from benchmark_lp_solver import instantiate_wafer as instantiate_square_wafer, instantiate_task as instantiate_allreduce_task
+    for dram_stacking_type in ['2d', '3d']:
+        hardware = instantiate_square_wafer(6, dram_stacking_type=dram_stacking_type)
+        hardware.reticle_config = {**hardware.reticle_config, 'core_array_height': 4, 'core_array_width': 3}
+        task = instantiate_allreduce_task(6, tensor_parallel_size=6)
+        task = ListWaferTask(list(task) + [PeerAccessReticleTask(0, 0, 'read', 3e8, repeated_times=8)])
+        mapper = get_default_mapper(hardware, task)
+        core_mesh = hardware.core_mesh
+        topology = hardware._topology
+        sides = {delta: i for i, delta in enumerate(topology.DIRECTIONS)}
+
+        reference_loads = {}
+        def add_pattern(node, pattern, amount):
+            if topology.is_reticle[topology.get_node_ids([node])].item():
+                reference_loads[node] = reference_loads.get(node, 0) + amount * core_mesh.unit_loads[pattern]
+
+        for reticle_task in task:
+            if reticle_task.task_type == 'compute':
+                continue
+            prid = mapper.find_physical_reticle_coordinate(reticle_task.virtual_reticle_id)
+            if reticle_task.task_type == 'dram_access':
+                other = mapper.find_physical_dram_port_coordinate(reticle_task.virtual_dram_port)
+            else:
+                other = mapper.find_physical_reticle_coordinate(reticle_task.peer_virtual_reticle_id)
+            src, dst = (other, prid) if reticle_task.access_type == 'read' else (prid, other)
+            _, link_srcs, link_dsts = mapper.find_batch_routing_links(np.array([src]), np.array([dst]))
+            hops = [sides[tuple((v - u).tolist())] for u, v in zip(link_srcs, link_dsts)]
+            if not hops:
+                if reticle_task.task_type == 'peer_access':
+                    add_pattern(src, CoreMesh.ALL_TO_ALL, reticle_task.data_amount)
+                continue
+            add_pattern(src, CoreMesh.get_egress_pattern(hops[0]), reticle_task.data_amount)
+            add_pattern(dst, CoreMesh.get_ingress_pattern(3 - hops[-1]), reticle_task.data_amount)
+            for node, in_hop, out_hop in zip(link_dsts[:-1], hops[:-1], hops[1:]):
+                add_pattern(tuple(node.tolist()), CoreMesh.get_transit_pattern(3 - in_hop, out_hop), reticle_task.data_amount)
+
+        wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False, intra_reticle=True)
+        intra_reticle = wse_evaluator.get_annotated_load().intra_reticle
+        for node in topology.nodes:
+            reference_load = reference_loads[node].max(initial=0) if node in reference_loads else 0
+            assert np.isclose(intra_reticle.totals[topology.node_2_id[node]], reference_load)
+
+    # the core mesh only adds constraints, and feeds the bottleneck and every solver
+    for hardware, task, mapper in build_dse_design_points(num_points=5):
+        latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False).get_total_latency()
+        wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False, intra_reticle=True)
+        intra_latency = wse_evaluator.get_total_latency()
+        assert intra_latency >= latency * (1 - 1e-9)
+        bottleneck = wse_evaluator.get_bottleneck()
+        repeated_times = max([reticle_task.repeated_times for reticle_task in task])
+        assert np.isclose(repeated_times / bottleneck['frequency'], intra_latency)
+        if bottleneck['type'] == 'intra_reticle':
+            assert bottleneck['resource'] in hardware._topology.nodes
+            assert np.isclose(wse_evaluator.profile_utilization()['intra_reticle'], 1)
+        linprog_latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False, intra_reticle=True, solver='linprog').get_total_latency()
+        assert np.isclose(linprog_latency, intra_latency, rtol=1e-6)
+        component_latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False, intra_reticle=True, decompose=True).get_total_latency()
+        assert np.isclose(component_latency, intra_latency)
+
+def test_torus_topology():
+    for (H, W), dram_stacking_type in itertools.product([(1, 4), (2, 2), (3, 5), (6, 4)], ['2d', '3d']):
+        mesh = get_reticle_topology(H, W, dram_stacking_type, 'mesh')
+        torus = get_reticle_topology(H, W, dram_stacking_type, 'torus')
+        assert torus.key != mesh.key and torus.nodes == mesh.nodes
+        num_wraparound_links = (2 * W if H > 2 else 0) + (2 * H if W > 2 else 0)
+        assert torus.num_links == mesh.num_links + num_wraparound_links == torus.link_is_wraparound.sum() + mesh.num_links
+        assert set(mesh.links) == {link for link, wraparound in zip(torus.links, torus.link_is_wraparound) if not wraparound}
+        assert np.all(np.diff(torus.link_srcs * torus.num_nodes + torus.link_dsts) > 0)
+        assert np.array_equal(torus.get_link_ids(torus.link_srcs, torus.link_dsts), np.arange(torus.num_links))
+
+        # wraparound links keep the direction they travel in around the ring
+        deltas = torus.coordinates[torus.link_dsts] - torus.coordinates[torus.link_srcs]
+        wraparound = torus.link_is_wraparound
+        assert np.array_equal(deltas[~wraparound], np.array(ReticleTopology.DIRECTIONS)[torus.link_directions[~wraparound]])
+        assert np.array_equal(np.mod(deltas[wraparound], [H, W]), np.mod(np.array(ReticleTopology.DIRECTIONS)[torus.link_directions[wraparound]], [H, W]))
+        assert np.all(torus.is_reticle[torus.link_srcs[wraparound]] & torus.is_reticle[torus.link_dsts[wraparound]])
+        assert sum(nx.get_edge_attributes(torus.graph, 'wraparound').values()) == num_wraparound_links
+
+    # the topology type is part of every key, and survives pickling
+    from benchmark_lp_solver import instantiate_wafer as instantiate_square_wafer, instantiate_task as instantiate_allreduce_task
+    mesh_hardware = instantiate_square_wafer(4, dram_stacking_type='3d')
+    hardware = instantiate_square_wafer(4, dram_stacking_type='3d', reticle_topology_type='torus', wraparound_bandwidth_ratio=0.5)
+    assert pkl.loads(pkl.dumps(hardware))._topology is hardware._topology
+    assert get_topology_key(hardware) != get_topology_key(mesh_hardware)
+
+    # a single flow across a wraparound link is bound by its own bandwidth
+    task = ListWaferTask([PeerAccessReticleTask(0, 1, 'read', 1e8, repeated_times=8)])
+    mapper = WseMapper(TableReticleMapper({0: (0, 0), 1: (3, 0)}), None, TorusXYReticleRouter(4, 4))
+    latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False).get_total_latency()
+    assert np.isclose(latency, 8 * 1e8 / (0.5 * hardware.inter_reticle_bandwidth))
+    assert np.isclose(FlowLevelWseSimulator(hardware, task, mapper).get_total_latency(), latency)
+    assert np.isclose(StreamingLpReticleLevelWseEvaluator(hardware, task, mapper).get_total_latency(), latency)
+    assert np.isclose(IncrementalLpReticleLevelWseEvaluator(hardware, task, mapper).get_total_latency(), latency)
+
+    # all-to-all traffic reaches the bisection bound on a torus, which a mesh misses by half
+    from benchmark_torus import benchmark_torus
+    for reticle_array_size in [4, 5]:
+        report = benchmark_torus(reticle_array_size)
+        assert np.isclose(report['torus_speedup'], 2)
+        assert report['torus_latency'] <= report['bisection_bound'] * (1 + 1e-9)
+    hardware = instantiate_square_wafer(4, dram_stacking_type='2d', reticle_topology_type='torus')
+    task = instantiate_allreduce_task(4)
+    mapper = get_default_mapper(hardware, task)
+    latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False).get_total_latency()
+    linprog_latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False, solver='linprog').get_total_latency()
+    assert np.isclose(linprog_latency, latency, rtol=1e-6)
+
+def test_zero_load_components():
+    # reticle 0 has a busy compute node with a zero amount, reticle 1 a regular load
+    hardware = instantiate_wafer(core_num_mac=1e12, tensor_parallel_size=2, inter_reticle_bandwidth=1e9, dram_bandwidth=1e9, dram_stacking_type='3d')
+    for task in [ListWaferTask([ComputeReticleTask(0, 0, repeated_times=1)]),
+                 ListWaferTask([ComputeReticleTask(0, 0, repeated_times=1), ComputeReticleTask(1, 1e12, repeated_times=4)])]:
+        mapper = get_default_mapper(hardware, task)
+        for solver in ['analytical', 'linprog']:
+            latency = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False, solver=solver).get_total_latency()
+            wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False, solver=solver, decompose=True)
+            assert np.isclose(wse_evaluator.get_total_latency(), latency)
+            assert np.isclose(latency, 4 if len(task) > 1 else 0)
+            for component in wse_evaluator.get_component_report():
+                assert component['frequency'] == component['bottleneck']['frequency']
+            assert np.isclose(wse_evaluator.get_bottleneck()['frequency'], 1 if len(task) > 1 else np.inf)
+        streaming_evaluator = StreamingLpReticleLevelWseEvaluator(hardware, task, mapper)
+        assert np.isclose(streaming_evaluator.get_total_latency(), latency)
+        assert np.isclose(streaming_evaluator.get_bottleneck()['frequency'], 1 if len(task) > 1 else np.inf)
+
+def get_task_subgraph_by_networkx(load, graph: nx.DiGraph, virtual_reticle_id: int):
+    """ Subgraph of a task as in the former annotated graph: sources of its links, their successors, and busy links among them
+    """
+    target_nodes = {load.links[plid][0] for plid in load.transmission.resource_ids[load.transmission.vars == virtual_reticle_id].tolist()}
+    target_nodes |= {v for u in target_nodes for v in graph.successors(u)}
+    sub_links = [(u, v) for u, v in graph.subgraph(target_nodes).edges() if load.transmission.busy[load.link_2_id[(u, v)]]]
+    sub_nodes = {u for link in sub_links for u in link}
+    return sorted(sub_nodes, key=load.node_2_id.get), sorted(sub_links, key=load.link_2_id.get)
+
+def test_task_subgraph():
+    get_reticle_topology.cache_clear()  # fresh topologies, without a networkx view yet
+    for hardware, task, mapper in build_dse_design_points(num_points=2):
+        wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False)
+        load = wse_evaluator.get_annotated_load()
+        for vrid in wse_evaluator.find_hottest_link_task()[:2]:
+            graph_features = wse_evaluator.get_graph_features(vrid)
+            assert 'graph' not in vars(hardware._topology)  # subgraphs come from the CSR topology
+            sub_nodes, sub_links = get_task_subgraph_by_networkx(load, nx.DiGraph(hardware._topology.links), vrid)
+            node_2_alias = {u: i for i, u in enumerate(sub_nodes)}
+            assert graph_features['edge_srcs'] == [node_2_alias[u] for u, v in sub_links]
+            assert graph_features['edge_dsts'] == [node_2_alias[v] for u, v in sub_links]
+            num_flows = [len(load.transmission.get_mark(load.link_2_id[link])) for link in sub_links]
+            assert graph_features['edge_feats'][:, 0].tolist() == num_flows
+            compute_nodes = {load.nodes[i] for i in load.compute.resource_ids[load.compute.vars == vrid].tolist()}
+            assert graph_features['node_feats'][:, 0].tolist() == [float(u in compute_nodes) for u in sub_nodes]
+
+def build_annotated_graph_by_networkx(hardware, task, mapper, vrid_2_var):
+    """ The former annotated reticle graph: a graph copy with per-var marks on nodes and links, routed flow by flow
+    """
+    G = nx.DiGraph()
+    G.add_nodes_from(hardware._topology.nodes)
+    G.add_edges_from(hardware._topology.links)
+    for node, ndata in G.nodes(data=True):
+        ndata['compute_mark'] = {}
+        ndata['dram_access_mark'] = {}
+    for u, v, edata in G.edges(data=True):
+        edata['transmission_mark'] = {}
+
+    def add_mark(mark, var, amount):
+        mark[var] = mark.get(var, 0) + amount
+
+    for reticle_task in task:
+        for subtask in (reticle_task.get_subtask_list() if reticle_task.task_type == 'fused' else [reticle_task]):
+            var = vrid_2_var[subtask.virtual_reticle_id]
+            prid = mapper.find_physical_reticle_coordinate(subtask.virtual_reticle_id)
+            if subtask.task_type == 'compute':
+                add_mark(G.nodes[prid]['compute_mark'], var, subtask.compute_amount)
+                continue
+            if subtask.task_type == 'dram_access':
+                pdpid = mapper.find_physical_dram_port_coordinate(subtask.virtual_dram_port)
+                add_mark(G.nodes[pdpid]['dram_access_mark'], var, subtask.data_amount)
+                routing_func = mapper.find_read_dram_routing_path if subtask.access_type == 'read' else mapper.find_write_dram_routing_path
+                link_list = routing_func(prid, pdpid)
+            else:
+                peer_prid = mapper.find_physical_reticle_coordinate(subtask.peer_virtual_reticle_id)
+                routing_func = mapper.find_read_peer_routing_path if subtask.access_type == 'read' else mapper.find_write_peer_routing_path
+                link_list = routing_func(prid, peer_prid)
+            for link in link_list:
+                add_mark(G.edges[link]['transmission_mark'], var, subtask.data_amount)
+    return G
+
+def dump_graph_by_networkx(hardware, G: nx.DiGraph, min_freq: float):
+    """ Used-by edges of the former dump_graph, as (src, dst) index lists and feature lists, and link labels
+    """
+    G = G.copy()
+    G.remove_edges_from([(u, v) for u, v, edata in G.edges(data=True) if not edata['transmission_mark']])
+    G.remove_nodes_from([u for u, ndata in G.nodes(data=True) if not (ndata['compute_mark'] or ndata['dram_access_mark'])])
+
+    def get_used_by_hyper(resources, get_mark, capacity):
+        used_by_hyper, features = [], []
+        for i, resource in enumerate(resources):
+            for hyper, amount in get_mark(resource).items():
+                used_by_hyper.append((i, hyper))
+                features.append(amount / capacity)
+        return used_by_hyper, features
+
+    prids = [u for u, ndata in G.nodes(data=True) if ndata['compute_mark']]
+    pdpids = [u for u, ndata in G.nodes(data=True) if ndata['dram_access_mark']]
+    plids = list(G.edges())
+    return {
+        'reticle_used_by': get_used_by_hyper(prids, lambda u: G.nodes[u]['compute_mark'], hardware.reticle_compute_power),
+        'dram_port_used_by': get_used_by_hyper(pdpids, lambda u: G.nodes[u]['dram_access_mark'], hardware.dram_bandwidth),
+        'link_used_by': get_used_by_hyper(plids, lambda link: G.edges[link]['transmission_mark'], hardware.inter_reticle_bandwidth),
+        'label': [sum(G.edges[link]['transmission_mark'].values()) * min_freq / hardware.inter_reticle_bandwidth for link in plids],
+    }
+
+def check_dump_graph(data_dict, feat_dict, label_dict, reference):
+    edge_types = {
+        'reticle_used_by': ('reticle', 'task', False), 'use_reticle': ('task', 'reticle', True),
+        'dram_port_used_by': ('dram_port', 'task', False), 'use_dram_port': ('task', 'dram_port', True),
+        'link_used_by': ('link', 'task', False), 'use_link': ('task', 'link', True),
+    }
+    for name, (src_type, dst_type, reverse) in edge_types.items():
+        edges, features = reference[name.replace('use_', '') + '_used_by' if reverse else name]
+        srcs, dsts = data_dict[(src_type, name, dst_type)]
+        assert list(zip(srcs.tolist(), dsts.tolist())) == [(j, i) if reverse else (i, j) for i, j in edges]
+        assert np.allclose(feat_dict[name].numpy(), np.stack([features, np.ones(len(features))], axis=-1).reshape(-1, 2))
+    assert np.allclose(label_dict['link'].numpy(), reference['label'])
+
+def test_dump_graph():
+    from benchmark_lp_solver import instantiate_wafer as instantiate_square_wafer, instantiate_task as instantiate_allreduce_task
+    for dram_stacking_type in ['2d', '3d']:
+        hardware = instantiate_square_wafer(4, dram_stacking_type=dram_stacking_type)
+        task = instantiate_allreduce_task(4)
+        mapper = get_default_mapper(hardware, task)
+        wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False)
+        G = build_annotated_graph_by_networkx(hardware, task, mapper, wse_evaluator.vrid_2_var)
+
+        # the LP optimum sets every frequency to 1 / the longest resource time
+        resource_times = [sum(ndata['compute_mark'].values()) / hardware.reticle_compute_power for _, ndata in G.nodes(data=True)] \
+                       + [sum(ndata['dram_access_mark'].values()) / hardware.dram_bandwidth for _, ndata in G.nodes(data=True)] \
+                       + [sum(edata['transmission_mark'].values()) / hardware.inter_reticle_bandwidth for _, _, edata in G.edges(data=True)]
+        min_freq = 1 / max(resource_times)
+        repeated_times = max([reticle_task.repeated_times for reticle_task in task])
+        assert np.isclose(wse_evaluator.get_total_latency(), repeated_times / min_freq)
+
+        check_dump_graph(*wse_evaluator.dump_graph(), dump_graph_by_networkx(hardware, G, min_freq))
+
+        # the first of the most loaded links in graph order
+        link_loads = [sum(edata['transmission_mark'].values()) for _, _, edata in G.edges(data=True)]
+        hottest_link = list(G.edges())[int(np.argmax(link_loads))]
+        assert wse_evaluator.find_hottest_link_task() == list(G.edges[hottest_link]['transmission_mark'].keys())
+
+def get_link_successors_by_networkx(G: nx.DiGraph):
+    """ Pairs (u, v) -> (v, t) of active links of the former dump_graph, found pairwise,
+    with the share of each link that can flow through the other one, i.e. sum over vrids of min(prev, succ)
+    """
+    G = G.copy()
+    G.remove_edges_from([(u, v) for u, v, edata in G.edges(data=True) if not edata['transmission_mark']])
+    G.remove_nodes_from([u for u, ndata in G.nodes(data=True) if not (ndata['compute_mark'] or ndata['dram_access_mark'])])
+    plids = list(G.edges())
+    connect_to, connect_to_ratio, connected_by_ratio = [], [], []
+    for (i, (u, v)), (j, (r, t)) in itertools.product(enumerate(plids), enumerate(plids)):
+        if v != r:
+            continue
+        prev_mark, succ_mark = G.edges[(u, v)]['transmission_mark'], G.edges[(r, t)]['transmission_mark']
+        overlap = sum([min(prev_mark.get(hyper, 0), succ_mark.get(hyper, 0)) for hyper in set(prev_mark) | set(succ_mark)])
+        connect_to.append((i, j))
+        connect_to_ratio.append(overlap / sum(prev_mark.values()))
+        connected_by_ratio.append(overlap / sum(succ_mark.values()))
+    return connect_to, connect_to_ratio, connected_by_ratio
+
+def test_link_successors():
+    from benchmark_lp_solver import instantiate_wafer as instantiate_square_wafer, instantiate_task as instantiate_allreduce_task
+    # rings of 6 reticles and 2d DRAM accesses, so that many links carry several vrids with different amounts
+    hardware = instantiate_square_wafer(6, dram_stacking_type='2d')
+    task = instantiate_allreduce_task(6, tensor_parallel_size=6)
+    task = ListWaferTask(list(task) + [PeerAccessReticleTask(vrid, (vrid + 7) % 36, 'write', 3e7 * (1 + vrid % 3), repeated_times=8) for vrid in range(36)])
+    design_points = [(hardware, task, get_default_mapper(hardware, task))] + list(build_dse_design_points(num_points=2))
+    for hardware, task, mapper in design_points:
+        wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False)
+        data_dict, feat_dict, _ = wse_evaluator.dump_graph()
+        G = build_annotated_graph_by_networkx(hardware, task, mapper, wse_evaluator.vrid_2_var)
+        connect_to, connect_to_ratio, connected_by_ratio = get_link_successors_by_networkx(G)
+
+        srcs, dsts = data_dict[('link', 'connect_to', 'link')]
+        assert list(zip(srcs.tolist(), dsts.tolist())) == connect_to
+        srcs, dsts = data_dict[('link', 'connected_by', 'link')]
+        assert list(zip(dsts.tolist(), srcs.tolist())) == connect_to
+        assert np.allclose(feat_dict['connect_to'].numpy().reshape(-1), connect_to_ratio)
+        assert np.allclose(feat_dict['connected_by'].numpy().reshape(-1), connected_by_ratio)
+        if task is design_points[0][1]:
+            # successors share part of the flows, not all or nothing
+            ratios = np.array(connect_to_ratio)
+            assert np.any((ratios > 0) & (ratios < 1)) and np.any(ratios == 0)
+
+def test_gnn_inference_without_lp():
+    import torch
+    from dse4wse.pe_graph.evaluator import GnnReticleLevelWseEvaluator
+
+    class ConstantModel(torch.nn.Module):
+        """ Predicts the same number of flits per service for every graph
+        """
+        def forward(self, graph):
+            return torch.tensor(1.5)
+
+    for hardware, task, mapper in build_dse_design_points(num_points=2):
+        # inference only reads the annotated load
+        gnn_evaluator = GnnReticleLevelWseEvaluator(hardware, task, mapper, ConstantModel())
+        gnn_latency = gnn_evaluator.get_total_latency()
+        assert gnn_evaluator.cache_info['min_freq'] == {'hits': 0, 'misses': 0}
+        vrid = gnn_evaluator.find_hottest_link_task()[0]
+        graph_features = gnn_evaluator.get_graph_features(vrid)
+        repeated_times = max([reticle_task.repeated_times for reticle_task in task])
+        expected_latency = max(1.5 * graph_features['num_total_flit'] / 1e9, graph_features['compute_latency'], graph_features['dram_access_latency'])
+        assert np.isclose(gnn_latency, repeated_times * expected_latency)
+        assert gnn_evaluator.cache_info['min_freq'] == {'hits': 0, 'misses': 0}
+
+        # dataset generation still gets features and label together
+        wse_evaluator = LpReticleLevelWseEvaluator(hardware, task, mapper, use_result_cache=False)
+        for vrid in wse_evaluator.find_hottest_link_task()[:2]:
+            graph_data = wse_evaluator.dump_graph_v2(vrid)
+            graph_features = wse_evaluator.get_graph_features(vrid)
+            assert set(graph_data) == set(graph_features) | {'label'}
+            for key, value in graph_features.items():
+                assert np.array_equal(graph_data[key], value)
+            assert graph_data['label'] == wse_evaluator.get_graph_label(vrid)
+
 if __name__ == "__main__":
-    test_lp_reticle_evaluator(**TESTCASE)
\ No newline at end of file
+    test_lp_reticle_evaluator(**TESTCASE)
+    test_solver_equivalence()
+    test_solver_equivalence_on_dse_design_points()
+    test_evaluator_cache()
+    test_in_place_edits()
+    test_batch_evaluation()
+    test_incremental_evaluator()
+    test_sensitivity_report()
+    test_hardware_parameter_sweep()
+    test_component_decomposition()
+    test_max_min_fair_evaluator()
+    test_result_cache()
+    test_linprog_backend()
+    test_linprog_scaling_on_extreme_design_points()
+    test_utilization_profile()
+    test_symmetry_reduction()
+    test_unique_rows()
+    test_streaming_evaluator()
+    test_shared_topology()
+    test_reticle_topology()
+    test_engine_pickling()
+    test_intra_reticle_congestion()
+    test_torus_topology()
+    test_zero_load_components()
+    test_task_subgraph()
+    test_dump_graph()
+    test_link_successors()
+    test_gnn_inference_without_lp()
@@ -4,7 +4,10 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from dse4wse.pe_graph.mapper.reticle_router import XYReticleRouter
+import numpy as np
+
+from dse4wse.pe_graph.mapper.reticle_router import BaseReticleRouter, XYReticleRouter, TorusXYReticleRouter
+from dse4wse.pe_graph.hardware import get_reticle_topology
 from dse4wse.utils import logger
 
 def test_router(src, dst):
@@ -26,9 +29,78 @@ TEST_CASES = [
     ((1, 2), (3, 4)),
 ]
 
+def test_batch_router():
+    """ Vectorized XY routing should produce the same hops as routing flows one by one
+    """
+    router = XYReticleRouter()
+    srcs = np.array([src for src, dst in TEST_CASES])
+    dsts = np.array([dst for src, dst in TEST_CASES])
+    rng = np.random.default_rng(0)
+    srcs = np.concatenate([srcs, rng.integers(-1, 9, size=(100, 2))])
+    dsts = np.concatenate([dsts, rng.integers(-1, 9, size=(100, 2))])
+
+    batch_result = router.get_link_batch(srcs, dsts)
+    reference_result = BaseReticleRouter.get_link_batch(router, srcs, dsts)
+    for batch, reference in zip(batch_result, reference_result):
+        assert np.array_equal(batch, reference)
+
+def get_torus_xy_path(src, dst, H, W):
+    """ Reference dimension-ordered torus route, walked hop by hop: x first along column y1, then y along row x2.
+    A dimension wraps if the ring has more than 2 reticles and both ends of the walk are reticles,
+    half way around a ring goes forward from an even source coordinate and backward from an odd one.
+    """
+    (x1, y1), (x2, y2) = src, dst
+
+    def walk(a1, a2, size, on_ring):
+        if not on_ring or size <= 2:
+            return [a1 + (i + 1) * (1 if a2 > a1 else -1) for i in range(abs(a2 - a1))]
+        forward, backward = (a2 - a1) % size, (a1 - a2) % size
+        step, num_hops = (1, forward) if forward < backward or (forward == backward and a1 % 2 == 0) else (-1, backward)
+        return [(a1 + (i + 1) * step) % size for i in range(num_hops)]
+
+    x_on_ring = 0 <= y1 < W and 0 <= x1 < H and 0 <= x2 < H
+    y_on_ring = 0 <= x2 < H and 0 <= y1 < W and 0 <= y2 < W
+    path = [(x1, y1)]
+    path += [(x, y1) for x in walk(x1, x2, H, x_on_ring)]
+    path += [(x2, y) for y in walk(y1, y2, W, y_on_ring)]
+    return path
+
+def test_torus_router():
+    """ Torus routes only use links of the torus topology, and take the shorter way around each reticle ring
+    """
+    rng = np.random.default_rng(0)
+    for H, W, dram_stacking_type in [(1, 5, '2d'), (2, 2, '3d'), (3, 4, '2d'), (5, 6, '2d'), (6, 5, '3d')]:
+        topology = get_reticle_topology(H, W, dram_stacking_type, 'torus')
+        router = TorusXYReticleRouter(reticle_array_height=H, reticle_array_width=W)
+        # flows between reticles, and between a reticle and a DRAM port in either direction
+        ports = topology.coordinates[rng.integers(topology.num_nodes, size=200)]
+        reticles = topology.coordinates[topology.is_reticle][rng.integers(H * W, size=200)]
+        port_first = rng.random((200, 1)) < 0.5
+        srcs, dsts = np.where(port_first, ports, reticles), np.where(port_first, reticles, ports)
+
+        flow_indices, link_srcs, link_dsts = router.get_link_batch(srcs, dsts)
+        reference_paths = [get_torus_xy_path(tuple(src), tuple(dst), H, W) for src, dst in zip(srcs.tolist(), dsts.tolist())]
+        assert np.array_equal(flow_indices, np.repeat(np.arange(len(srcs)), [len(path) - 1 for path in reference_paths]))
+        assert np.array_equal(link_srcs.reshape(-1, 2), np.array(sum([path[:-1] for path in reference_paths], [])).reshape(-1, 2))
+        assert np.array_equal(link_dsts.reshape(-1, 2), np.array(sum([path[1:] for path in reference_paths], [])).reshape(-1, 2))
+        topology.get_link_ids(topology.get_node_ids(link_srcs), topology.get_node_ids(link_dsts))  # raises on missing links
+
+        num_hops = np.bincount(flow_indices, minlength=len(srcs))
+        mesh_hops = np.abs(dsts - srcs).sum(axis=1)
+        on_reticles = np.all((srcs >= 0) & (srcs < [H, W]) & (dsts >= 0) & (dsts < [H, W]), axis=1)
+        delta = np.mod(dsts - srcs, [H, W])
+        torus_hops = np.minimum(delta, [H, W] - delta).sum(axis=1)
+        assert np.array_equal(num_hops[on_reticles], torus_hops[on_reticles])
+        assert np.all(num_hops <= mesh_hops)
+        for i in np.flatnonzero(num_hops > 0)[:20]:
+            path = router(tuple(srcs[i]), tuple(dsts[i]))
+            assert path == reference_paths[i] and path[-1] == tuple(dsts[i].tolist())
+
 def run_all_tests():
     for case in TEST_CASES:
         test_router(*case)
+    test_batch_router()
+    test_torus_router()
 
 if __name__ == "__main__":
     run_all_tests()
\ No newline at end of file